@@ -1,7 +1,24 @@
+import hashlib
+import json
 import logging
-from collections import Counter
-from itertools import combinations
-from typing import Any, Dict, List, Optional, Tuple
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import graph_tool.all as gt
 import matplotlib.pyplot as plt
@@ -10,6 +27,7 @@ import networkx as nx
 import numpy as np
 import pandas as pd
 from graph_tool.all import Graph, GraphView
+from scipy import sparse
 
 
 def save_gt(g: Graph, filename: str) -> None:
@@ -23,47 +41,100 @@ def load_gt(filename: str) -> Graph:
 # CONSTRUCT NETWORK FUNCTIONS #
 
 
-def construct_cooccurrence_edgelist(
+def cooccurrence_matrix(
     df: pd.DataFrame, node_list_col: str, context_group_col: Optional[str] = None
-) -> pd.DataFrame:
+) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    Count co-occurrences of nodes with a sparse unit-by-node incidence matrix.
+
+    Each row of df (or each group of rows sharing a context_group_col value) is a
+    unit. X[u, n] is 1 if node n appears in unit u, so the upper triangle of X.T @ X
+    counts the units that every pair of nodes shares.
+
+    Args:
+        df (pd.DataFrame): DataFrame with a column of node lists.
+        node_list_col (str): Column containing lists of nodes.
+        context_group_col (Optional[str]): Column to group rows into units by.
+            Defaults to None, which treats each row as a unit.
+
+    Returns:
+        Tuple[sparse.csr_matrix, np.ndarray]: Upper triangular co-occurrence counts
+            (diagonal excluded) and the node labels for its rows and columns, sorted.
+    """
+    nodes = df[node_list_col].reset_index(drop=True).explode().dropna()
+    units = nodes.index.to_numpy()
+    if context_group_col:
+        contexts = df[context_group_col].to_numpy()[units]
+        units = pd.factorize(contexts)[0]
+        # groupby drops missing context values, so do the same here
+        nodes, units = nodes[units >= 0], units[units >= 0]
+
+    codes, labels = pd.factorize(nodes.to_numpy(), sort=True)
+    units = pd.factorize(units)[0]
+    incidence = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int64), (units, codes)),
+        shape=(units.max() + 1 if len(units) else 0, len(labels)),
+    )
+    incidence.data[:] = 1  # count each node once per unit
+
+    counts = sparse.triu(incidence.T @ incidence, k=1, format="csr")
+    counts.eliminate_zeros()
+    return counts, np.asarray(labels)
+
+
+def construct_cooccurrence_edgelist(
+    df: pd.DataFrame,
+    node_list_col: str,
+    context_group_col: Optional[str] = None,
+    return_matrix: bool = False,
+) -> Union[pd.DataFrame, Tuple[sparse.csr_matrix, np.ndarray]]:
     """
     Create a co-occurrence / co-mention network of nodes in node_list_col
     Defaults to co-occurrences within the row units (e.g., videos, comments)
     If you provide context_group_col, it will create ties within the expanded context
+    Counts are computed with a sparse incidence matrix (see cooccurrence_matrix);
+    set return_matrix to get that matrix and its node labels instead of a DataFrame
     """
-    results: List[Dict[str, Any]] = []
+    counts, labels = cooccurrence_matrix(df, node_list_col, context_group_col)
+    if return_matrix:
+        return counts, labels
+
+    counts = counts.tocoo()
+    order = np.lexsort((counts.col, counts.row))
+    edgelist_df = pd.DataFrame(
+        {
+            "i": labels[counts.row[order]],
+            "j": labels[counts.col[order]],
+            "count": counts.data[order].astype(np.int64),
+        }
+    )
 
-    if context_group_col:
-        # group by context column and process each group separately
-        grouped = df.groupby(context_group_col)
-        for gid, group in grouped:
-            # flatten the lists of nodes within each group
-            all_nodes = [node for sublist in group[node_list_col] for node in sublist]
-            unique_nodes = set(all_nodes)  # Ensure unique nodes
-
-            for node1, node2 in combinations(unique_nodes, 2):
-                # undirected graph, so sort the nodes to get the counts right
-                if node1 > node2:
-                    node1, node2 = node2, node1
-                results.append({"i": node1, "j": node2})
-                # results.append({"i": node1, "j": node2, "context": gid})
-    else:
-        # process co-occurrences within row units (e.g., videos, comments)
-        for _, row in df.iterrows():  # vectorize this later...
-            nodes = row[node_list_col]
-            unique_nodes = set(nodes)  # Ensure unique nodes
-
-            for node1, node2 in combinations(unique_nodes, 2):
-                # undirected graph, so sort the nodes to get the counts right
-                if node1 > node2:
-                    node1, node2 = node2, node1
-                results.append({"i": node1, "j": node2})
-                # results.append({"i": node1, "j": node2, "context": '(row)'})
+    return edgelist_df
 
-    edgelist_df = pd.DataFrame(results)
-    edgelist_df = edgelist_df.groupby(["i", "j"]).size().reset_index(name="count")
 
-    return edgelist_df
+def _bulk_add(
+    g: Graph, labels: np.ndarray, edges: np.ndarray, weights: np.ndarray
+) -> Tuple[gt.VertexPropertyMap, gt.EdgePropertyMap]:
+    """
+    Add labelled vertices and weighted edges to g with array-based calls.
+
+    Args:
+        g (Graph): An empty graph.
+        labels (np.ndarray): Vertex names; vertex k is named labels[k].
+        edges (np.ndarray): (E, 2) array of source and target vertex indices.
+        weights (np.ndarray): Integer weight of each edge.
+
+    Returns:
+        Tuple[gt.VertexPropertyMap, gt.EdgePropertyMap]: Name and weight maps.
+    """
+    if len(labels) > 0:
+        g.add_vertex(len(labels))
+    vprop_name = g.new_vertex_property("string", vals=np.asarray(labels, dtype=str))
+    eprop_weight = g.new_edge_property("int")
+    g.add_edge_list(
+        np.column_stack([edges, weights]).astype(np.int64), eprops=[eprop_weight]
+    )
+    return vprop_name, eprop_weight
 
 
 def g_from_weighted_edgelist(
@@ -74,34 +145,17 @@ def g_from_weighted_edgelist(
 ) -> Graph:
     g = gt.Graph(directed=False)
 
-    # add vertex and edge properties
-    vprop_name = g.new_vertex_property("string")  # node names
+    # interleave i and j so vertices are numbered in order of first appearance
+    pairs = edgelist[[node_i_col, node_j_col]].to_numpy(dtype=object)
+    codes, labels = pd.factorize(pairs.ravel(), use_na_sentinel=False)
+
+    # add nodes, edges, and their properties in bulk
+    vprop_name, eprop_weight = _bulk_add(
+        g, np.asarray(labels), codes.reshape(-1, 2), edgelist[weight_col].to_numpy()
+    )
     g.vertex_properties["vprop_name"] = vprop_name  # node names
-    eprop_weight = g.new_edge_property("int")  # weight
     g.edge_properties["eprop_weight"] = eprop_weight  # weight
 
-    # add nodes, edges
-    vertices: Dict[str, gt.Vertex] = {}
-    for _, row in edgelist.iterrows():  # vectorize later
-        node_i, node_j, count = row[node_i_col], row[node_j_col], row[weight_col]
-
-        if node_i not in vertices:
-            v_i = g.add_vertex()
-            vprop_name[v_i] = node_i
-            vertices[node_i] = v_i
-        else:
-            v_i = vertices[node_i]
-
-        if node_j not in vertices:
-            v_j = g.add_vertex()
-            vprop_name[v_j] = node_j
-            vertices[node_j] = v_j
-        else:
-            v_j = vertices[node_j]
-
-        e = g.add_edge(v_i, v_j)
-        eprop_weight[e] = count
-
     return g
 
 
@@ -119,48 +173,89 @@ def construct_mention_network(
     # explode the df so that each mention becomes a separate row
     exploded_df = df.explode("mentioned_users").dropna(subset=["mentioned_users"])
 
-    users = df[user_id_col].unique()
-    user_nodes: Dict[str, gt.Vertex] = {user: g.add_vertex() for user in users}
-
+    # commenters first, then (optionally) users who were only mentioned
+    nodes = [df[user_id_col]]
     if include_mentioned_no_comment_nodes:
-        mentioned_users = exploded_df["mentioned_users"].unique()
-        for user in mentioned_users:
-            if user not in user_nodes:
-                user_nodes[user] = g.add_vertex()
+        nodes.append(exploded_df["mentioned_users"])
+    labels = pd.unique(pd.concat(nodes, ignore_index=True))
+    node_index = pd.Index(labels)
 
     # create edge list with count weights
     edges = exploded_df[exploded_df[user_id_col] != exploded_df["mentioned_users"]]
-    edge_list = edges[[user_id_col, "mentioned_users"]].values.tolist()
-    edge_weights = Counter((user, mentioned_user) for user, mentioned_user in edge_list)
+    weighted_edges_df = (
+        edges.groupby([user_id_col, "mentioned_users"], sort=False, dropna=False)
+        .size()
+        .reset_index(name="weight")
+    )
+    codes = np.column_stack(
+        [
+            node_index.get_indexer(weighted_edges_df[user_id_col]),
+            node_index.get_indexer(weighted_edges_df["mentioned_users"]),
+        ]
+    )
+    # mentions of users who are not nodes cannot become edges
+    known = (codes >= 0).all(axis=1)
+    weighted_edges_df = weighted_edges_df[known].reset_index(drop=True)
 
     # add weighted edges to the graph
-    weight_property = g.new_edge_property("int")
-    for (user, mentioned_user), weight in edge_weights.items():
-        e = g.add_edge(user_nodes[user], user_nodes[mentioned_user])
-        weight_property[e] = weight
-
+    vprop_name, weight_property = _bulk_add(
+        g, labels, codes[known], weighted_edges_df["weight"].to_numpy()
+    )
+    g.vertex_properties["name"] = vprop_name
     g.edge_properties["weight"] = weight_property
 
     # remove isolates if drop_isolates is true; in and out for directed network
     if drop_isolates:
-        isolates = [
-            v for v in g.vertices() if v.out_degree() == 0 and v.in_degree() == 0
-        ]
-        g.remove_vertex(isolates)
-
-    weighted_edges_df = pd.DataFrame(
-        [
-            (user, mentioned_user, weight)
-            for (user, mentioned_user), weight in edge_weights.items()
-        ],
-        columns=[user_id_col, "mentioned_users", "weight"],
-    )
+        isolates = np.flatnonzero(g.get_total_degrees(g.get_vertices()) == 0)
+        if len(isolates) > 0:
+            g.remove_vertex(isolates)
 
     weighted_edges_df.sort_values("weight", ascending=False, inplace=True)
 
     return g, weighted_edges_df
 
 
+def _entity_pairs(
+    df: pd.DataFrame, id_col: str, span_col: str
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Count directed co-mentions of entities within each id_col group.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Entity labels (in
+            order of first appearance), a mention count per label, (E, 2) label
+            indices of each (earlier, later) pair, and the weight of each pair.
+    """
+    # lay mentions out comment by comment, in the order groupby would visit them
+    mentions = df.dropna(subset=[id_col]).sort_values(id_col, kind="stable")
+    codes, labels = pd.factorize(mentions[span_col].to_numpy(), use_na_sentinel=False)
+    grouped = mentions.groupby(id_col, sort=False)
+    position = grouped.cumcount().to_numpy()
+    later = grouped[span_col].transform("size").to_numpy() - position - 1
+
+    # each mention counts once, plus once for every earlier mention in its comment
+    count = np.bincount(codes, weights=position + 1, minlength=len(labels))
+
+    # every ordered pair (earlier mention, later mention) within a comment
+    first = np.repeat(np.arange(len(codes)), later)
+    block_start = np.repeat(np.cumsum(later) - later, later)
+    second = first + (np.arange(len(first)) - block_start) + 1
+    source, target = codes[first], codes[second]
+    keep = source != target  # no self loops
+    source, target = source[keep], target[keep]
+
+    # aggregate pair counts, keeping edges in order of first appearance
+    pair_keys = source.astype(np.int64) * len(labels) + target
+    keys, first_seen, weights = np.unique(
+        pair_keys, return_index=True, return_counts=True
+    )
+    order = np.argsort(first_seen, kind="stable")
+    keys, weights = keys[order], weights[order]
+    edges = np.column_stack([keys // len(labels), keys % len(labels)])
+
+    return np.asarray(labels), count.astype(np.int64), edges, weights
+
+
 def construct_entity_network(
     df: pd.DataFrame,
     id_col: str,
@@ -179,62 +274,33 @@ def construct_entity_network(
         return GraphView(Graph()), []
         # return Graph(), []
 
-    g = Graph()
-    vprop_name = g.new_vertex_property("string")
-    vprop_count = g.new_vertex_property("int")
-    eprop_weight = g.new_edge_property("int")
+    labels, count, edges, weights = _entity_pairs(filtered_df, id_col, span_col)
 
-    # property map, entity names to vertex ids
-    entity_to_vertex: Dict[str, gt.Vertex] = {}
-
-    # group by comment_id and add edges between co-mentioned entities
-    grouped = filtered_df.groupby(id_col)
-    for comment_id, group in grouped:
-        entities = group[span_col].tolist()
-        for i, entity1 in enumerate(entities):
-            if entity1 not in entity_to_vertex:
-                v1 = g.add_vertex()
-                entity_to_vertex[entity1] = v1
-                vprop_name[v1] = entity1
-                vprop_count[v1] = 1
-            else:
-                v1 = entity_to_vertex[entity1]
-                vprop_count[v1] += 1
-            for entity2 in entities[i + 1 :]:
-                if entity2 not in entity_to_vertex:
-                    v2 = g.add_vertex()
-                    entity_to_vertex[entity2] = v2
-                    vprop_name[v2] = entity2
-                    vprop_count[v2] = 1
-                else:
-                    v2 = entity_to_vertex[entity2]
-                    vprop_count[v2] += 1
-
-                if g.edge(v1, v2) is None:
-                    e = g.add_edge(v1, v2)
-                    eprop_weight[e] = 1
-                else:
-                    e = g.edge(v1, v2)
-                    eprop_weight[e] += 1
+    g = Graph()
+    vprop_name, eprop_weight = _bulk_add(g, labels, edges, weights)
+    vprop_count = g.new_vertex_property("int", vals=count)
 
     g.vertex_properties["name"] = vprop_name
     g.vertex_properties["count"] = vprop_count
     g.edge_properties["weight"] = eprop_weight
 
-    gt.remove_self_loops(g)
-
     # Apply edge weight threshold filter
-    edge_filter = g.new_edge_property("bool")
-    for e in g.edges():
-        edge_filter[e] = eprop_weight[e] >= edge_weight_threshold
+    kept = weights >= edge_weight_threshold
+    edge_filter = g.new_edge_property("bool", vals=kept)
 
     gv = GraphView(g, efilt=edge_filter)
 
-    # Create weighted edgelist from the filtered graph
-    weighted_edgelist: List[Tuple[str, str, int]] = []
-    for e in gv.edges():
-        v1, v2 = e
-        weighted_edgelist.append((vprop_name[v1], vprop_name[v2], eprop_weight[e]))
+    # Create weighted edgelist from the filtered graph, grouped by source vertex
+    names = np.asarray(labels, dtype=str)
+    kept_edges, kept_weights = edges[kept], weights[kept]
+    by_source = np.argsort(kept_edges[:, 0], kind="stable")
+    weighted_edgelist: List[Tuple[str, str, int]] = list(
+        zip(
+            names[kept_edges[by_source, 0]].tolist(),
+            names[kept_edges[by_source, 1]].tolist(),
+            kept_weights[by_source].tolist(),
+        )
+    )
 
     return gv, weighted_edgelist
 
@@ -272,42 +338,21 @@ def construct_topic_entity_network(
 ) -> Tuple[Graph, pd.DataFrame]:
     g = gt.Graph(directed=False)
 
-    # add vertex properties
-    vprop_name = g.new_vertex_property("string")
-    # add edge property for weight
-    eprop_weight = g.new_edge_property("int")
-    # bipartite vertex property map
-    vtype = g.new_vertex_property("int")
-
-    # ADD NODES
-    node_ids: Dict[str, gt.Vertex] = {}
-    for node in pd.concat([df[topic_col], df[entity_col]]).unique():
-        v = g.add_vertex()
-        vprop_name[v] = node
-        node_ids[node] = v
-
+    # ADD NODES AND WEIGHTED EDGES
+    # topics and entities share one vertex index, in order of first appearance
+    codes, labels = pd.factorize(
+        pd.concat([df[topic_col], df[entity_col]], ignore_index=True),
+        use_na_sentinel=False,
+    )
+    labels, edges = np.asarray(labels), codes.reshape(2, -1).T
+    vprop_name, eprop_weight = _bulk_add(g, labels, edges, df[weight_col].to_numpy())
     g.vertex_properties["name"] = vprop_name
 
-    # set node types (for bipartite graph)
-    for node in set(df[topic_col]):
-        v = node_ids[node]
-        vtype[v] = 0  # topic nodes
-
-    for node in set(df[entity_col]):
-        v = node_ids[node]
-        vtype[v] = 1  # entity nodes
-
+    # set node types (for bipartite graph); 0 for topics, 1 for entities
+    vtype = g.new_vertex_property("int")
+    vtype.a[edges[:, 1]] = 1
     g.vertex_properties["vtype"] = vtype
 
-    # ADD WEIGHTED EDGES
-    for _, row in df.iterrows():
-        topic = row[topic_col]
-        entity = row[entity_col]
-        weight = row[weight_col]
-
-        e = g.add_edge(node_ids[topic], node_ids[entity])
-        eprop_weight[e] = weight
-
     g.edge_properties["weight"] = eprop_weight
 
     # FILTER / CLEAN UP GRAPH
@@ -316,8 +361,8 @@ def construct_topic_entity_network(
     # "For undirected graphs, the “out-degree” is synonym for degree,
     # and in this case the in-degree of a vertex is always zero."
 
-    isolates = [v for v in g.vertices() if v.out_degree() == 0]
-    if drop_isolates and isolates:
+    isolates = np.flatnonzero(g.get_out_degrees(g.get_vertices()) == 0)
+    if drop_isolates and len(isolates) > 0:
         g.remove_vertex(isolates, fast=True)
         logging.info(
             (
@@ -328,34 +373,553 @@ def construct_topic_entity_network(
 
     # create wel
     weighted_edges_df = pd.DataFrame(
-        [
-            (vprop_name[e.source()], vprop_name[e.target()], eprop_weight[e])
-            for e in g.edges()
-        ],
-        columns=[topic_col, entity_col, weight_col],
+        {
+            topic_col: labels[edges[:, 0]],
+            entity_col: labels[edges[:, 1]],
+            weight_col: eprop_weight.a.copy(),
+        }
     )
 
     weighted_edges_df.sort_values(weight_col, ascending=False, inplace=True)
     return g, weighted_edges_df
 
 
+# INCREMENTAL UPDATES #
+#
+# Persisted networks can be updated with newly collected data instead of being
+# rebuilt. The ids of the rows already incorporated are kept in the graph itself
+# (the "source_ids" graph property), so the manifest and the graph are always
+# saved together and re-running an update with the same rows changes nothing.
+# Update the unthresholded graph and apply weight thresholds with a GraphView.
+
+
+def read_manifest(g: Graph) -> Set[str]:
+    """Get the source ids that have already been incorporated into g."""
+    if "source_ids" not in g.graph_properties:
+        return set()
+    return set(g.graph_properties["source_ids"])
+
+
+def write_manifest(g: Graph, ids: Set[str]) -> None:
+    """Record the source ids that have been incorporated into g."""
+    if "source_ids" not in g.graph_properties:
+        g.graph_properties["source_ids"] = g.new_graph_property("vector<string>")
+    g.graph_properties["source_ids"] = sorted(ids)
+
+
+def update_weighted_graph(
+    g: Graph,
+    edgelist: pd.DataFrame,
+    node_i_col: str = "i",
+    node_j_col: str = "j",
+    weight_col: str = "count",
+    name_prop: str = "name",
+    weight_prop: str = "weight",
+    vertex_counts: Optional[pd.Series] = None,
+    count_prop: str = "count",
+) -> Tuple[int, int]:
+    """
+    Add a weighted edgelist to a graph in place.
+
+    Vertices are matched by name. Weights of existing edges are incremented; only
+    new vertices and edges are added, in bulk.
+
+    Args:
+        g (Graph): Graph with a string name vertex property and an int weight
+            edge property.
+        edgelist (pd.DataFrame): Edges to add, with node names and weights.
+        node_i_col (str): Source node column. Defaults to "i".
+        node_j_col (str): Target node column. Defaults to "j".
+        weight_col (str): Weight column. Defaults to "count".
+        name_prop (str): Name of the vertex name property. Defaults to "name".
+        weight_prop (str): Name of the edge weight property. Defaults to "weight".
+        vertex_counts (Optional[pd.Series]): Increments for a vertex count
+            property, indexed by node name. Defaults to None.
+        count_prop (str): Name of the vertex count property. Defaults to "count".
+
+    Returns:
+        Tuple[int, int]: The number of vertices and edges added.
+    """
+    vprop_name = g.vertex_properties[name_prop]
+    eprop_weight = g.edge_properties[weight_prop]
+
+    # existing vertices keep their indices; new names are appended after them
+    existing = pd.Index([vprop_name[v] for v in g.vertices()])
+    pairs = edgelist[[node_i_col, node_j_col]].to_numpy(dtype=str)
+    candidates = [pd.unique(pairs.ravel())]
+    if vertex_counts is not None:
+        candidates.append(vertex_counts.index.to_numpy(dtype=str))
+    new_names = pd.unique(np.concatenate(candidates))
+    new_names = new_names[existing.get_indexer(new_names) < 0]
+
+    n_old = g.num_vertices()
+    if len(new_names) > 0:
+        g.add_vertex(len(new_names))
+        for k, name in enumerate(new_names):
+            vprop_name[g.vertex(n_old + k)] = name
+    node_index = existing.append(pd.Index(new_names))
+    n = g.num_vertices()
+
+    # key each edge by its endpoints; undirected edges in canonical order
+    source = node_index.get_indexer(pairs[:, 0]).astype(np.int64)
+    target = node_index.get_indexer(pairs[:, 1]).astype(np.int64)
+    current = g.get_edges([g.edge_index])
+    current_source, current_target = current[:, 0], current[:, 1]
+    if not g.is_directed():
+        source, target = np.minimum(source, target), np.maximum(source, target)
+        current_source, current_target = (
+            np.minimum(current_source, current_target),
+            np.maximum(current_source, current_target),
+        )
+    delta = (
+        pd.Series(edgelist[weight_col].to_numpy(), index=source * n + target)
+        .groupby(level=0, sort=False)
+        .sum()
+    )
+    current_keys = pd.Series(current[:, 2], index=current_source * n + current_target)
+    current_keys = current_keys[~current_keys.index.duplicated()]
+
+    # increment the weights of edges we already have, then add the rest in bulk
+    edge_index = current_keys.reindex(delta.index).to_numpy()
+    found = ~np.isnan(edge_index)
+    eprop_weight.a[edge_index[found].astype(np.int64)] += delta.to_numpy()[found]
+    new_keys = delta.index.to_numpy()[~found]
+    g.add_edge_list(
+        np.column_stack([new_keys // n, new_keys % n, delta.to_numpy()[~found]]),
+        eprops=[eprop_weight],
+    )
+
+    if vertex_counts is not None:
+        vprop_count = g.vertex_properties[count_prop]
+        positions = node_index.get_indexer(vertex_counts.index.to_numpy(dtype=str))
+        np.add.at(vprop_count.a, positions, vertex_counts.to_numpy())
+
+    return len(new_names), int((~found).sum())
+
+
+def _update_network(
+    path: Union[str, Path],
+    delta_df: pd.DataFrame,
+    id_col: str,
+    build: Callable[[pd.DataFrame], Tuple[pd.DataFrame, Optional[pd.Series]]],
+    directed: bool,
+    name_prop: str,
+    weight_prop: str,
+    count_prop: Optional[str] = None,
+) -> Graph:
+    """Load (or create) a graph, add the rows of delta_df it has not seen, save it."""
+    path = Path(path)
+    if path.exists():
+        g = gt.load_graph(str(path))
+    else:
+        g = Graph(directed=directed)
+        g.vertex_properties[name_prop] = g.new_vertex_property("string")
+        g.edge_properties[weight_prop] = g.new_edge_property("int")
+        if count_prop is not None:
+            g.vertex_properties[count_prop] = g.new_vertex_property("int")
+
+    seen = read_manifest(g)
+    ids = delta_df[id_col].astype(str)
+    is_new = ~ids.isin(seen)
+    if not is_new.any():
+        logging.info(f"No new rows for {path}; nothing to update.")
+        return g
+
+    edgelist, vertex_counts = build(delta_df[is_new])
+    node_i_col, node_j_col, weight_col = edgelist.columns[:3]
+    n_vertices, n_edges = update_weighted_graph(
+        g,
+        edgelist,
+        node_i_col,
+        node_j_col,
+        weight_col,
+        name_prop=name_prop,
+        weight_prop=weight_prop,
+        vertex_counts=vertex_counts,
+        count_prop=count_prop or "count",
+    )
+    write_manifest(g, seen | set(ids[is_new]))
+
+    # write next to the target and swap it in, so a crash never leaves half a graph
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.stem}.tmp{path.suffix}")
+    g.save(str(tmp))
+    os.replace(tmp, path)
+
+    logging.info(
+        f"Updated {path} with {int(is_new.sum())} new rows: "
+        f"{n_vertices} new vertices, {n_edges} new edges"
+    )
+    return g
+
+
+def update_entity_network(
+    path: Union[str, Path],
+    delta_df: pd.DataFrame,
+    id_col: str,
+    span_col: str,
+    score_col: str,
+    threshold: float = 0.5,
+    typelist: Optional[List[str]] = None,
+) -> Graph:
+    """
+    Update a persisted entity co-mention network (see construct_entity_network).
+
+    Args:
+        path (Union[str, Path]): Path to the .gt file; created if it does not exist.
+        delta_df (pd.DataFrame): Entity rows, possibly including rows already seen.
+        id_col (str): Column of source ids (e.g., comment ids).
+        span_col (str): Column of entity spans.
+        score_col (str): Column of entity scores.
+        threshold (float): Minimum entity score. Defaults to 0.5.
+        typelist (Optional[List[str]]): Entity labels to keep. Defaults to None.
+
+    Returns:
+        Graph: The updated graph, with name and count vertex properties and a
+            weight edge property.
+    """
+
+    def build(rows: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+        rows = rows[rows[score_col] > threshold]
+        if typelist is not None:
+            rows = rows[rows["label"].isin(typelist)]
+        labels, count, edges, weights = _entity_pairs(rows, id_col, span_col)
+        edgelist = pd.DataFrame(
+            {"i": labels[edges[:, 0]], "j": labels[edges[:, 1]], "weight": weights}
+        )
+        return edgelist, pd.Series(count, index=labels)
+
+    return _update_network(
+        path, delta_df, id_col, build, True, "name", "weight", count_prop="count"
+    )
+
+
+def update_mention_network(
+    path: Union[str, Path],
+    delta_df: pd.DataFrame,
+    id_col: str,
+    user_id_col: str = "user",
+    comment_text_col: str = "comment_text",
+) -> Graph:
+    """
+    Update a persisted user mention network (see construct_mention_network).
+
+    Only users who mention or are mentioned become vertices, as with
+    drop_isolates=True.
+
+    Args:
+        path (Union[str, Path]): Path to the .gt file; created if it does not exist.
+        delta_df (pd.DataFrame): Comments, possibly including comments already seen.
+        id_col (str): Column of source ids (e.g., comment ids).
+        user_id_col (str): Column of commenting users. Defaults to "user".
+        comment_text_col (str): Column of comment text. Defaults to "comment_text".
+
+    Returns:
+        Graph: The updated graph, with a name vertex property and a weight edge
+            property.
+    """
+
+    def build(rows: pd.DataFrame) -> Tuple[pd.DataFrame, None]:
+        mentions = rows[[user_id_col]].assign(
+            mentioned_users=rows[comment_text_col].str.findall(r"@(\w+)")
+        )
+        mentions = mentions.explode("mentioned_users").dropna(
+            subset=["mentioned_users"]
+        )
+        mentions = mentions[mentions[user_id_col] != mentions["mentioned_users"]]
+        edgelist = (
+            mentions.groupby([user_id_col, "mentioned_users"], sort=False)
+            .size()
+            .reset_index(name="weight")
+        )
+        return edgelist, None
+
+    return _update_network(path, delta_df, id_col, build, True, "name", "weight")
+
+
+def update_cooccurrence_network(
+    path: Union[str, Path],
+    delta_df: pd.DataFrame,
+    id_col: str,
+    node_list_col: str,
+) -> Graph:
+    """
+    Update a persisted co-occurrence network (see g_from_weighted_edgelist).
+
+    Only row-unit co-occurrences can be updated incrementally: new rows added to
+    an existing context group would change counts that were already made.
+
+    Args:
+        path (Union[str, Path]): Path to the .gt file; created if it does not exist.
+        delta_df (pd.DataFrame): Rows, possibly including rows already seen.
+        id_col (str): Column of source ids (e.g., video ids).
+        node_list_col (str): Column containing lists of nodes.
+
+    Returns:
+        Graph: The updated graph, with vprop_name and eprop_weight properties.
+    """
+
+    def build(rows: pd.DataFrame) -> Tuple[pd.DataFrame, None]:
+        return construct_cooccurrence_edgelist(rows, node_list_col), None
+
+    return _update_network(
+        path, delta_df, id_col, build, False, "vprop_name", "eprop_weight"
+    )
+
+
+# PARALLEL CONSTRUCTION #
+
+
+def _build_cooccurrence_network(
+    group: pd.DataFrame,
+    node_list_col: str,
+    context_group_col: Optional[str],
+    edge_threshold: int,
+    output_path: str,
+) -> Tuple[pd.DataFrame, int, int]:
+    """Build, threshold, and save one co-occurrence network (runs in a worker)."""
+    wel = construct_cooccurrence_edgelist(group, node_list_col, context_group_col)
+    wel = wel[wel["count"] > edge_threshold]
+    g = g_from_weighted_edgelist(wel)
+    g.save(output_path)
+    return wel, g.num_vertices(), g.num_edges()
+
+
+def construct_cooccurrence_networks(
+    df: pd.DataFrame,
+    group_col: str,
+    node_list_col: str,
+    contexts: Dict[str, Optional[str]],
+    output_pattern: str,
+    edge_threshold: int = 0,
+    n_processes: Optional[int] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Build one co-occurrence network per group and context in a process pool.
+
+    Each (group, context) network is built and saved by a worker process, so wall
+    time is set by the largest group rather than the sum of all groups. The
+    largest groups are submitted first. Results are collected in group order no
+    matter which worker finishes first.
+
+    Args:
+        df (pd.DataFrame): DataFrame with a column of node lists.
+        group_col (str): Column to split the networks by (e.g., "channel").
+        node_list_col (str): Column containing lists of nodes.
+        contexts (Dict[str, Optional[str]]): Context names mapped to the column
+            that defines co-occurrence within them (None for row units), e.g.
+            {"videos": "video_id", "topics": "topic"}.
+        output_pattern (str): Path of each .gt file, with {group} and {context}
+            placeholders.
+        edge_threshold (int): Keep edges with counts above this. Defaults to 0.
+        n_processes (Optional[int]): Number of worker processes. Defaults to the
+            number of CPUs; 1 builds everything in this process.
+
+    Returns:
+        Dict[str, pd.DataFrame]: For each context, the thresholded weighted
+            edgelists of every group, concatenated, with a group_col column.
+    """
+    groups = {key: group for key, group in df.groupby(group_col)}
+    tasks = [(key, context) for key in groups for context in contexts]
+    results: Dict[Tuple[Any, str], Tuple[pd.DataFrame, int, int]] = {}
+
+    def arguments(key: Any, context: str) -> Tuple[Any, ...]:
+        output_path = output_pattern.format(group=key, context=context)
+        return (
+            groups[key],
+            node_list_col,
+            contexts[context],
+            edge_threshold,
+            output_path,
+        )
+
+    if n_processes == 1:
+        for key, context in tasks:
+            results[(key, context)] = _build_cooccurrence_network(
+                *arguments(key, context)
+            )
+    else:
+        largest_first = sorted(tasks, key=lambda task: -len(groups[task[0]]))
+        # fork, so pipeline scripts without a __main__ guard are not re-imported
+        with ProcessPoolExecutor(
+            max_workers=n_processes,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as pool:
+            futures = {
+                task: pool.submit(_build_cooccurrence_network, *arguments(*task))
+                for task in largest_first
+            }
+            results = {task: future.result() for task, future in futures.items()}
+
+    edgelists: Dict[str, List[pd.DataFrame]] = {context: [] for context in contexts}
+    for key, context in tasks:
+        wel, n_vertices, n_edges = results[(key, context)]
+        logging.info(
+            f"Built the [{context}] network for '{key}': "
+            f"{n_vertices} nodes, {n_edges} edges (edge threshold {edge_threshold})"
+        )
+        edgelists[context].append(wel.assign(**{group_col: key}))
+
+    return {
+        context: pd.concat(wels, ignore_index=True) if wels else pd.DataFrame()
+        for context, wels in edgelists.items()
+    }
+
+
 # MODEL NETWORK FUNCTIONS #
 #
 # - Bayesian Planted Partition Models (BPPM)
 # - Hierarachical Bayesian Stochastic Blockmodels (HBSBM)
 
 
+def _seeds(seed: Optional[int], n: int) -> List[Optional[int]]:
+    """Derive n distinct seeds from one, or no seeds at all if seed is None."""
+    if seed is None and n == 1:
+        return [None]
+    return [int(s) for s in np.random.SeedSequence(seed).generate_state(n)]
+
+
+def _seed(seed: Optional[int]) -> None:
+    if seed is not None:
+        gt.seed_rng(seed)
+        np.random.seed(seed)
+
+
+def _run_in_processes(
+    fn: Callable[..., Any], calls: List[Tuple[Any, ...]], n_processes: Optional[int]
+) -> List[Any]:
+    """
+    Run fn over a list of argument tuples, in worker processes if there are several.
+
+    Unlike construct_cooccurrence_networks, which forks, the workers are spawned:
+    graph-tool runs OpenMP threads, which a forked child cannot use safely.
+    Spawned workers re-import the calling script, so scripts that fit with
+    n_starts or n_chains above 1 must keep their top-level code under
+    `if __name__ == "__main__":`.
+    """
+    if len(calls) == 1 or n_processes == 1:
+        return [fn(*args) for args in calls]
+    with ProcessPoolExecutor(
+        max_workers=n_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        futures = [pool.submit(fn, *args) for args in calls]
+        return [future.result() for future in futures]
+
+
+def _imap_in_processes(
+    fn: Callable[..., Any], calls: List[Tuple[Any, ...]], n_processes: Optional[int]
+) -> Iterator[Any]:
+    """Like _run_in_processes, but yield each result as soon as it is ready."""
+    if len(calls) == 1 or n_processes == 1:
+        for args in calls:
+            yield fn(*args)
+        return
+    with ProcessPoolExecutor(
+        max_workers=n_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        pending = {pool.submit(fn, *args) for args in calls}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def _fit_start(
+    graph: gt.Graph,
+    nested: bool,
+    state_args: Dict[str, Any],
+    refine_basic: bool,
+    refine_args: Dict[str, Any],
+    seed: Optional[int],
+) -> Tuple[Any, List[Dict[str, float]]]:
+    """One independent minimisation (and optional refinement); runs in a worker."""
+    _seed(seed)
+    trace: List[Dict[str, float]] = []
+    if nested:
+        state = gt.minimize_nested_blockmodel_dl(graph, state_args=state_args)
+    else:
+        state = gt.minimize_blockmodel_dl(g=graph, state=gt.PPBlockState)
+    if refine_basic:
+        state = _refine_state_multiflip_mcmc_sweep(state, trace=trace, **refine_args)
+    return state, trace
+
+
+def _fit_best_of(
+    graph: gt.Graph,
+    nested: bool,
+    state_args: Dict[str, Any],
+    refine_basic: bool,
+    refine_args: Optional[Dict[str, Any]],
+    n_starts: int,
+    n_processes: Optional[int],
+    seed: Optional[int],
+    trace: Optional[List[Dict[str, float]]] = None,
+) -> Any:
+    """Fit n_starts independent models and keep the lowest description length."""
+    calls = [
+        (graph, nested, state_args, refine_basic, refine_args or {}, start_seed)
+        for start_seed in _seeds(seed, n_starts)
+    ]
+    fits = _run_in_processes(_fit_start, calls, n_processes)
+    entropies = [state.entropy() for state, _ in fits]
+    if n_starts > 1:
+        logging.info(
+            f"Description lengths of {n_starts} starts: "
+            f"{', '.join(f'{e:,.1f}' for e in entropies)}"
+        )
+
+    state, best_trace = fits[int(np.argmin(entropies))]
+    if best_trace:
+        logging.info(
+            f"Refined the best fit over {best_trace[-1]['sweep']} sweeps "
+            f"in {best_trace[-1]['seconds']:.1f}s"
+        )
+    if trace is not None:
+        trace.extend(best_trace)
+    return state
+
+
 def fit_bppm(
-    g: gt.Graph, refine: str = "marginals", return_all_levels: bool = False
+    g: gt.Graph,
+    refine: str = "marginals",
+    return_all_levels: bool = False,
+    n_starts: int = 1,
+    n_chains: int = 1,
+    n_processes: Optional[int] = None,
+    seed: Optional[int] = None,
+    refine_args: Optional[Dict[str, Any]] = None,
+    trace: Optional[List[Dict[str, float]]] = None,
 ) -> Tuple[Any, Optional[pd.DataFrame]]:
-    """fit a Bayesian planted partition model for assortative community structure"""
-    state = gt.minimize_blockmodel_dl(g=g, state=gt.PPBlockState)
+    """
+    fit a Bayesian planted partition model for assortative community structure
+
+    n_starts independent fits (and n_chains posterior chains with "marginals") run
+    in up to n_processes worker processes with distinct seeds derived from seed;
+    the fit with the lowest description length is kept. The workers are spawned,
+    so calling scripts need a __main__ guard (see _run_in_processes)
+    refine_args (niter, window, tol, max_seconds) control the "basic" refinement,
+    whose entropy trace for the kept fit is appended to trace if one is given
+    """
+    state = _fit_best_of(
+        g,
+        False,
+        {},
+        refine == "basic",
+        refine_args,
+        n_starts,
+        n_processes,
+        seed,
+        trace,
+    )
     if refine == "marginals":
-        state = get_consensus_partition_from_posterior(state)
+        state = get_consensus_partition_from_posterior(
+            state, g, n_chains=n_chains, n_processes=n_processes, seed=seed
+        )
         block_data = _get_ppm_results(g=g, block_property_map=state.get_blocks())
         return state, block_data
     elif refine == "basic":
-        state = _refine_state_multiflip_mcmc_sweep(state=state)
         block_data = _get_ppm_results(g=g, block_property_map=state.get_blocks())
         return state, block_data
     else:
@@ -427,15 +991,23 @@ def fit_hbsbm(
     refine: str = "basic",  # or 'marginals'
     return_all_levels: bool = False,
     vertex_property_key: str = "vprop_name",
+    n_starts: int = 1,
+    n_chains: int = 1,
+    n_processes: Optional[int] = None,
+    seed: Optional[int] = None,
+    refine_args: Optional[Dict[str, Any]] = None,
+    trace: Optional[List[Dict[str, float]]] = None,
 ) -> Tuple[Any, Optional[pd.DataFrame]]:
-    """fit a Hierarchical Bayesian stochastic blockmodel"""
-    global bs
-    bs = []
-
-    def collect_partitions(s: Any) -> None:
-        global bs
-        bs.append(s.get_bs())
-
+    """
+    fit a Hierarchical Bayesian stochastic blockmodel
+
+    n_starts independent fits (and n_chains posterior chains with "marginals") run
+    in up to n_processes worker processes with distinct seeds derived from seed;
+    the fit with the lowest description length is kept. The workers are spawned,
+    so calling scripts need a __main__ guard (see _run_in_processes)
+    refine_args (niter, window, tol, max_seconds) control the "basic" refinement,
+    whose entropy trace for the kept fit is appended to trace if one is given
+    """
     if covars:
         recs = recs
         rec_types = rec_types
@@ -443,26 +1015,35 @@ def fit_hbsbm(
         recs = []
         rec_types = []
 
-    state = gt.minimize_nested_blockmodel_dl(
+    state_args = dict(
+        # deg_corr=True,
+        # eweight=eweight,
+        recs=recs,
+        rec_types=rec_types,
+        # clabel=bip,
+        # pclabel=bip,
+    )
+    state = _fit_best_of(
         graph,
-        state_args=dict(
-            # deg_corr=True,
-            # eweight=eweight,
-            recs=recs,
-            rec_types=rec_types,
-            # clabel=bip,
-            # pclabel=bip,
-        ),
+        True,
+        state_args,
+        refine == "basic",
+        refine_args,
+        n_starts,
+        n_processes,
+        seed,
+        trace,
     )
 
     if refine == "marginals":
-        state = get_consensus_partition_from_posterior(state, graph)
+        state = get_consensus_partition_from_posterior(
+            state, graph, n_chains=n_chains, n_processes=n_processes, seed=seed
+        )
         block_data = _get_hbsbm_results(
             state, all_levels=return_all_levels, vertex_property_key=vertex_property_key
         )
         return state, block_data
     elif refine == "basic":
-        state = _refine_state_multiflip_mcmc_sweep(state)
         block_data = _get_hbsbm_results(
             state, all_levels=return_all_levels, vertex_property_key=vertex_property_key
         )
@@ -471,91 +1052,432 @@ def fit_hbsbm(
         return state, None
 
 
-def _refine_state_multiflip_mcmc_sweep(state: Any, niter: int = 100) -> Any:
-    for i in range(niter):
-        state.multiflip_mcmc_sweep(niter=niter, beta=np.inf)
+def _refine_state_multiflip_mcmc_sweep(
+    state: Any,
+    niter: int = 100,
+    window: int = 5,
+    tol: float = 1e-6,
+    max_seconds: Optional[float] = None,
+    trace: Optional[List[Dict[str, float]]] = None,
+    start_round: int = 0,
+    callback: Optional[Callable[[Any, int], None]] = None,
+) -> Any:
+    """
+    Greedily refine a flat or nested state with merge-split sweeps at beta=inf.
+
+    Runs up to niter rounds of niter sweeps, but stops early once the description
+    length has improved by less than tol (relative to its value) over the last
+    window rounds, or once max_seconds have passed.
+
+    Args:
+        state (Any): A BlockState, PPBlockState or NestedBlockState.
+        niter (int): Maximum number of rounds, and sweeps per round. Defaults to 100.
+        window (int): Number of rounds to look back over. Defaults to 5.
+        tol (float): Relative improvement below which refinement stops.
+            Defaults to 1e-6.
+        max_seconds (Optional[float]): Wall-clock budget. Defaults to None.
+        trace (Optional[List[Dict[str, float]]]): If given, one record of sweep,
+            entropy and seconds is appended per round (plus the starting point).
+        start_round (int): Round to resume from, when continuing an earlier
+            refinement whose trace is passed in. Defaults to 0.
+        callback (Optional[Callable[[Any, int], None]]): Called with the state and
+            the number of completed rounds after every round. Defaults to None.
+
+    Returns:
+        Any: The refined state.
+    """
+    trace = trace if trace is not None else []
+    start = time.perf_counter()
+    entropy = state.entropy()
+    deltas: Deque[float] = deque(maxlen=window)
+    elapsed = trace[-1]["seconds"] if trace else 0.0
+    if not trace:
+        trace.append({"sweep": 0, "entropy": entropy, "seconds": 0.0})
+
+    stopped = "sweep limit"
+    for i in range(start_round, niter):
+        delta = state.multiflip_mcmc_sweep(niter=niter, beta=np.inf)[0]
+        entropy += delta
+        deltas.append(delta)
+        seconds = time.perf_counter() - start
+        trace.append(
+            {"sweep": (i + 1) * niter, "entropy": entropy, "seconds": elapsed + seconds}
+        )
+        if callback is not None:
+            callback(state, i + 1)
+
+        if len(deltas) == window and -sum(deltas) <= tol * abs(entropy):
+            stopped = "converged"
+            break
+        if max_seconds is not None and seconds >= max_seconds:
+            stopped = "time budget"
+            break
+
+    logging.info(
+        f"Refinement stopped ({stopped}) after {trace[-1]['sweep']} sweeps "
+        f"and {trace[-1]['seconds']:.1f}s: description length "
+        f"{trace[0]['entropy']:,.1f} -> {entropy:,.1f}"
+    )
     return state
 
 
-def get_consensus_partition_from_posterior(state, graph, force_niter=2000):
-    global bs
-    bs = []
+class PartitionAccumulator:
+    """
+    Collect partitions sampled by mcmc_equilibrate without keeping a list of them.
 
-    def collect_partitions(s) -> None:
-        """
-        Collect block assignments for NestedBlockState if it's a nested model.
-        Collect block assignments for BlockState if it's not a nested model.
-        """
-        global bs
-        if isinstance(s, gt.NestedBlockState):
-            bs.append(s.get_bs())
-        else:
-            bs.append(s.b.a.copy())
+    Used as the mcmc_equilibrate callback, every stride-th sampled partition is
+    added straight to a PartitionModeState. Each fit (or chain) creates its own
+    accumulator, so concurrent fits share no state; accumulators from parallel
+    chains are combined with merge. Pickling sends the partitions themselves, so
+    a worker process can return its accumulator.
+
+    Args:
+        nested (bool): Whether the partitions come from a NestedBlockState.
+        stride (int): Keep every stride-th partition. Defaults to 1.
+    """
+
+    def __init__(self, nested: bool, stride: int = 1) -> None:
+        self.nested = nested
+        self.stride = stride
+        self.seen = 0
+        self.kept = 0
+        self.pmode: Optional[gt.PartitionModeState] = None
+
+    def __call__(self, state: Any) -> None:
+        self.seen += 1
+        if (self.seen - 1) % self.stride == 0:
+            self.add(state.get_bs() if self.nested else state.b.a.copy())
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["pmode"] = self.partitions()
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        partitions = state.pop("pmode")
+        self.__dict__.update(state)
+        # the partitions were already relabelled to agree with each other
+        self.pmode = (
+            gt.PartitionModeState(partitions, relabel=False, nested=self.nested)
+            if partitions
+            else None
+        )
 
+    def add(self, b: Any) -> None:
+        """Add one partition (a block array, or a list of them if nested)."""
+        if self.pmode is None:
+            self.pmode = gt.PartitionModeState([b], nested=self.nested)
+        else:
+            self.pmode.add_partition(b, relabel=True)
+        self.kept += 1
+
+    def partitions(self) -> List[Any]:
+        """Return the partitions collected so far."""
+        if self.pmode is None:
+            return []
+        return list(self.pmode.get_partitions().values())
+
+    def merge(self, other: "PartitionAccumulator") -> None:
+        """Add the partitions collected by another accumulator, e.g. another chain."""
+        for b in other.partitions():
+            self.add(b)
+        self.seen += other.seen
+
+    def mode(self) -> gt.PartitionModeState:
+        """Relabel the partitions until they agree and return the mode state."""
+        if self.pmode is None:
+            raise ValueError("No partitions have been collected")
+        delta = 1.0
+        while abs(delta) > 1e-8:
+            delta = self.pmode.replace_partitions()
+        return self.pmode
+
+
+def _sample_posterior(
+    state: Any, force_niter: int, seed: Optional[int], stride: int
+) -> PartitionAccumulator:
+    """Run one MCMC chain (in a worker) and return its accumulated partitions."""
+    _seed(seed)
+    accumulator = PartitionAccumulator(
+        nested=isinstance(state, gt.NestedBlockState), stride=stride
+    )
     # MCMC equilibration
     gt.mcmc_equilibrate(
         state,
         force_niter=force_niter,
         mcmc_args=dict(niter=10),  # no. of iterations per sweep
-        callback=collect_partitions,  # collect partitions during sweeps
+        callback=accumulator,  # collect partitions during sweeps
     )
+    return accumulator
+
+
+def get_consensus_partition_from_posterior(
+    state,
+    graph,
+    force_niter=2000,
+    n_chains: int = 1,
+    n_processes: Optional[int] = None,
+    seed: Optional[int] = None,
+    stride: int = 1,
+    max_partitions: Optional[int] = None,
+):
+    """
+    Sample partitions from the posterior and return the state at their consensus.
+
+    Partitions are fed into a PartitionModeState as they are sampled (see
+    PartitionAccumulator), keeping every stride-th one. Set max_partitions to
+    bound memory regardless of force_niter and n_chains; the stride is raised so
+    that all chains together keep at most max_partitions.
+
+    With n_chains > 1, independent chains with distinct seeds start from state in
+    up to n_processes spawned worker processes (calling scripts need a __main__
+    guard). Each chain accumulates its own partitions, and each is merged into
+    the first one to finish as soon as it is done.
+    """
+    nested = isinstance(state, gt.NestedBlockState)
+    if max_partitions is not None:
+        per_chain = max(1, max_partitions // n_chains)
+        stride = max(stride, -(-force_niter // per_chain))
+
+    if n_chains == 1:
+        accumulator = _sample_posterior(state, force_niter, seed, stride)
+    else:
+        calls = [
+            (state, force_niter, chain_seed, stride)
+            for chain_seed in _seeds(seed, n_chains)
+        ]
+        chains = _imap_in_processes(_sample_posterior, calls, n_processes)
+        accumulator = next(chains)
+        for chain in chains:
+            accumulator.merge(chain)
+    logging.info(f"Collected {accumulator.kept} posterior partitions")
 
     # process partitions with PartitionModeState, check if model nested to avoid errors
-    pmode = gt.PartitionModeState(
-        bs, nested=isinstance(state, gt.NestedBlockState), converge=True
-    )
+    pmode = accumulator.mode()
 
     # get the posterior vertex marginals
     pv = pmode.get_marginal(graph)
     graph.vertex_properties["pv"] = pv
 
     # obtain the consensus partition
-    if isinstance(state, gt.NestedBlockState):
-        bs = pmode.get_max_nested()
+    if nested:
+        state = state.copy(bs=pmode.get_max_nested())
     else:
-        bs = pmode.get_max()
-
-    state = state.copy(bs=bs)
+        state = state.copy(b=pmode.get_max(graph))
 
     return state
 
 
+def _vertex_names(g: gt.Graph, vertex_property_key: str) -> np.ndarray:
+    """Read a (string) vertex property into an array, one entry per vertex."""
+    prop = g.vertex_properties[vertex_property_key]
+    return np.array([prop[v] for v in g.vertices()], dtype=object)
+
+
 def _get_ppm_results(g: gt.Graph, block_property_map: Any) -> pd.DataFrame:
     block_property_map = gt.contiguous_map(block_property_map)
-    block_data = {g.vp.vprop_name[v]: block_property_map[v] for v in g.vertices()}
-    block_data = pd.DataFrame(list(block_data.items()), columns=["Node", "BlockID"])
-    return block_data
+    block_data = pd.DataFrame(
+        {
+            "Node": _vertex_names(g, "vprop_name"),
+            "BlockID": block_property_map.a.copy(),
+        }
+    )
+    # one row per name, as a dict keyed by name would give
+    return block_data.groupby("Node", sort=False, as_index=False).last()
 
 
 def _get_hbsbm_results(
     state: Any, all_levels: bool = False, vertex_property_key: str = "vprop_name"
 ) -> pd.DataFrame:
-    """Get block memberships for nodes in a graph-tool state."""
-    levels = state.get_levels()
-    name_list: List[str] = []
-    block_list: List[int] = []
-    level_list: List[int] = []
-
-    for level, level_state in enumerate(levels):
-        block_map = level_state.get_blocks()
-        for v in state.g.vertices():
-            name_list.append(state.g.vertex_properties[vertex_property_key][v])
-            block_list.append(block_map[v])
-            level_list.append(level)
-
-        # break after the first (base) level if not returning all levels
-        if not all_levels:
-            break
+    """
+    Get block memberships for nodes in a graph-tool state.
+
+    Blocks at every level are projected onto the nodes of the base graph, so the
+    BlockID at level l is the node's block in the level-l partition.
+    """
+    names = _vertex_names(state.g, vertex_property_key)
+    bs = state.get_bs()
+    levels = len(bs) if all_levels else 1
+
+    # compose the hierarchy: level l blocks index into the level l + 1 partition
+    projected = [np.asarray(bs[0])]
+    for level in range(1, levels):
+        projected.append(np.asarray(bs[level])[projected[-1]])
 
     data_df = pd.DataFrame()
-    data_df["Node"] = name_list
-    data_df["BlockID"] = block_list
+    data_df["Node"] = np.tile(names, levels)
+    data_df["BlockID"] = np.concatenate(projected)
     if all_levels:
-        data_df["Level"] = level_list
+        data_df["Level"] = np.repeat(np.arange(levels), len(names))
 
     return data_df
 
 
+# CHECKPOINTED FITTING #
+#
+# Long fits checkpoint their partitions as block arrays (one per hierarchy level)
+# in a compressed npz file, with the refinement round and entropy trace. Each
+# checkpoint records a hash of the graph file and the fit parameters: a complete
+# result with a matching hash is reused, and a partial one is refined further.
+
+
+def fit_key(graph_path: Union[str, Path], model: str, params: Dict[str, Any]) -> str:
+    """hash a graph file together with the model and parameters fitted to it"""
+    digest = hashlib.sha256()
+    with open(graph_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    spec = json.dumps({"model": model, **params}, sort_keys=True, default=str)
+    digest.update(spec.encode())
+    return digest.hexdigest()
+
+
+def save_blockmodel_checkpoint(
+    path: Union[str, Path], state: Any, meta: Dict[str, Any]
+) -> None:
+    """write the block arrays of a flat or nested state, replacing path atomically"""
+    path = Path(path)
+    if hasattr(state, "get_bs"):
+        bs = state.get_bs()
+    else:
+        bs = [state.get_blocks().a]
+    levels = {f"level_{i}": np.asarray(b, dtype=np.int32) for i, b in enumerate(bs)}
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez_compressed(tmp, meta=np.array(json.dumps(meta)), **levels)
+    os.replace(tmp, path)
+
+
+def load_blockmodel_checkpoint(
+    path: Union[str, Path]
+) -> Optional[Tuple[List[np.ndarray], Dict[str, Any]]]:
+    """read the block arrays and metadata of a checkpoint, if there is one"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        bs = [data[f"level_{i}"] for i in range(meta["levels"])]
+    return bs, meta
+
+
+def _restore_state(
+    g: gt.Graph, nested: bool, state_args: Dict[str, Any], bs: List[np.ndarray]
+) -> Any:
+    if nested:
+        return gt.NestedBlockState(g, bs=bs, state_args=state_args)
+    return gt.PPBlockState(g, b=g.new_vertex_property("int", vals=bs[0]))
+
+
+def fit_blockmodel_checkpointed(
+    graph_path: Union[str, Path],
+    model: str = "hbsbm",
+    checkpoint_dir: Union[str, Path] = "../output/checkpoints",
+    name: Optional[str] = None,
+    checkpoint_every: int = 10,
+    return_all_levels: bool = False,
+    vertex_property_key: str = "vprop_name",
+    n_starts: int = 1,
+    n_processes: Optional[int] = None,
+    seed: Optional[int] = None,
+    refine_args: Optional[Dict[str, Any]] = None,
+) -> Tuple[Any, pd.DataFrame]:
+    """
+    Fit a PPM or HBSBM with "basic" refinement, checkpointing as it goes.
+
+    The partition is checkpointed to {checkpoint_dir}/{name}_{model}.npz after the
+    initial minimisation and every checkpoint_every refinement rounds. If the
+    checkpoint was written for the same graph file and parameters, a complete fit
+    is returned as is and an interrupted one resumes from its last round.
+
+    Args:
+        graph_path (Union[str, Path]): Path to a saved graph-tool graph.
+        model (str): "ppm" (flat planted partition) or "hbsbm" (nested).
+            Defaults to "hbsbm".
+        checkpoint_dir (Union[str, Path]): Directory for checkpoints.
+            Defaults to "../output/checkpoints".
+        name (Optional[str]): Checkpoint name. Defaults to the graph file's stem.
+        checkpoint_every (int): Refinement rounds between checkpoints. Defaults to 10.
+        return_all_levels (bool): Return blocks at every level of an HBSBM.
+            Defaults to False.
+        vertex_property_key (str): Vertex property with node names.
+            Defaults to "vprop_name".
+        n_starts (int): Independent minimisations, the best of which is refined.
+            Defaults to 1.
+        n_processes (Optional[int]): Worker processes for the starts. Calling
+            scripts need a __main__ guard (see _run_in_processes). Defaults to None.
+        seed (Optional[int]): Seed for the starts. Defaults to None.
+        refine_args (Optional[Dict[str, Any]]): niter, window, tol and max_seconds
+            for the refinement. Defaults to None.
+
+    Returns:
+        Tuple[Any, pd.DataFrame]: The state and its block memberships.
+    """
+    if model not in ("ppm", "hbsbm"):
+        raise ValueError(f"Unknown model {model!r}; use 'ppm' or 'hbsbm'.")
+    nested = model == "hbsbm"
+    refine_args = refine_args or {}
+    state_args: Dict[str, Any] = dict(recs=[], rec_types=[]) if nested else {}
+    key = fit_key(
+        graph_path,
+        model,
+        dict(n_starts=n_starts, seed=seed, refine_args=refine_args),
+    )
+    checkpoint_dir = Path(checkpoint_dir)
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_dir / f"{name or Path(graph_path).stem}_{model}.npz"
+
+    g = gt.load_graph(str(graph_path))
+    trace: List[Dict[str, float]] = []
+
+    def save(state: Any, rounds: int, complete: bool = False) -> None:
+        levels = len(state.get_bs()) if nested else 1
+        meta = dict(
+            key=key, round=rounds, complete=complete, levels=levels, trace=trace
+        )
+        save_blockmodel_checkpoint(path, state, meta)
+
+    def checkpoint(state: Any, rounds: int) -> None:
+        if rounds % checkpoint_every == 0:
+            save(state, rounds)
+
+    checkpointed = load_blockmodel_checkpoint(path)
+    if checkpointed is not None and checkpointed[1]["key"] == key:
+        bs, meta = checkpointed
+        state = _restore_state(g, nested, state_args, bs)
+        trace.extend(meta["trace"])
+        start_round = meta["round"]
+        complete = meta["complete"]
+        if complete:
+            logging.info(f"Reusing the completed {model} fit in {path}")
+        else:
+            logging.info(f"Resuming the {model} fit in {path} from round {start_round}")
+    else:
+        state = _fit_best_of(
+            g, nested, state_args, False, None, n_starts, n_processes, seed
+        )
+        start_round = 0
+        complete = False
+        save(state, start_round)
+
+    if not complete:
+        state = _refine_state_multiflip_mcmc_sweep(
+            state,
+            trace=trace,
+            start_round=start_round,
+            callback=checkpoint,
+            **refine_args,
+        )
+        save(state, len(trace) - 1, complete=True)
+
+    if nested:
+        block_data = _get_hbsbm_results(
+            state, all_levels=return_all_levels, vertex_property_key=vertex_property_key
+        )
+    else:
+        block_data = _get_ppm_results(g=g, block_property_map=state.get_blocks())
+    return state, block_data
+
+
 def rotate_positions(pos, a):
     """Rotate the positions by `a` degrees."""
     theta = np.radians(a)
@@ -621,26 +1543,77 @@ def plot_line_comparison(
         plt.savefig(filename, dpi=300)
 
 
-def graph_tool_to_networkx(gt_graph):
+def graph_tool_to_csr(
+    gt_graph: gt.Graph, weight: Optional[str] = None
+) -> sparse.csr_matrix:
+    """
+    Converts a graph-tool graph to a SciPy CSR adjacency matrix.
+
+    Row and column k correspond to the k-th (unfiltered) vertex. Parallel edges
+    are summed, and undirected graphs give a symmetric matrix.
+
+    Parameters:
+    gt_graph (gt.Graph): The graph-tool graph (or GraphView) to convert.
+    weight (Optional[str]): Name of a scalar edge property holding edge weights.
+        Every edge has weight 1 if None.
+
+    Returns:
+    sparse.csr_matrix: The (n, n) adjacency matrix.
+    """
+    eprops = [gt_graph.edge_properties[weight]] if weight is not None else []
+    edges = gt_graph.get_edges(eprops=eprops)
+    vertices = gt_graph.get_vertices()
+
+    # positions of the vertices that survive any vertex filter
+    position = np.full(gt_graph.num_vertices(ignore_filter=True), -1, dtype=np.int64)
+    position[vertices] = np.arange(len(vertices))
+    source = position[edges[:, 0].astype(np.int64)]
+    target = position[edges[:, 1].astype(np.int64)]
+    data = edges[:, 2] if weight is not None else np.ones(len(edges), dtype=np.int64)
+
+    if not gt_graph.is_directed():
+        loops = source == target
+        source, target = (
+            np.concatenate([source, target[~loops]]),
+            np.concatenate([target, source[~loops]]),
+        )
+        data = np.concatenate([data, data[~loops]])
+
+    return sparse.csr_matrix(
+        (data, (source, target)), shape=(len(vertices), len(vertices))
+    )
+
+
+def graph_tool_to_networkx(
+    gt_graph: gt.Graph, weight: Optional[str] = None
+) -> Union[nx.Graph, nx.DiGraph]:
     """
     Converts a graph-tool Graph object to a networkx Graph object.
 
+    Edges are added in bulk from the CSR adjacency matrix, and every vertex
+    property map becomes a node attribute of the same name.
+
     Parameters:
     gt_graph (gt.Graph): The graph-tool graph to convert.
+    weight (Optional[str]): Name of a scalar edge property holding edge weights,
+        kept as an edge attribute of the same name. Defaults to None.
 
     Returns:
-    nx.Graph: The converted networkx graph.
+    nx.Graph: The converted networkx graph (a DiGraph if gt_graph is directed).
     """
-    nx_graph = nx.DiGraph() if gt_graph.is_directed() else nx.Graph()
-
-    # Add nodes
-    for v in gt_graph.vertices():
-        nx_graph.add_node(int(v))
+    adjacency = graph_tool_to_csr(gt_graph, weight=weight)
+    nx_graph = nx.from_scipy_sparse_array(
+        adjacency,
+        create_using=nx.DiGraph if gt_graph.is_directed() else nx.Graph,
+        edge_attribute=weight if weight is not None else "weight",
+    )
 
-    # Add edges
-    for e in gt_graph.edges():
-        source = int(e.source())
-        target = int(e.target())
-        nx_graph.add_edge(source, target)
+    nodes = range(adjacency.shape[0])
+    for key, prop in gt_graph.vertex_properties.items():
+        if prop.a is not None:
+            values = prop.a[gt_graph.get_vertices()].tolist()
+        else:
+            values = [prop[v] for v in gt_graph.vertices()]
+        nx.set_node_attributes(nx_graph, dict(zip(nodes, values)), name=key)
 
     return nx_graph
@@ -82,6 +82,13 @@ def load_hansard(years=None, british=False, canadian=False):
     return combined_df
 
 
+# CACHES
+
+cache: Path = root / ".cache"
+inference_cache: Path = cache / "inference.sqlite"
+embedding_store: Path = cache / "embeddings"
+
+
 # SLIDES AND NOTEBOOKS
 
 slides_qmd: Path = root / "slides"
@@ -0,0 +1,647 @@
+import logging
+import pickle
+import time
+from collections import Counter
+from itertools import combinations
+from types import SimpleNamespace
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+gt = pytest.importorskip("graph_tool.all")
+networks = pytest.importorskip("icsspy.networks")
+
+
+def two_cliques(n=6):
+    """Two n-cliques joined by a single edge, with named vertices."""
+    g = gt.Graph(directed=False)
+    g.add_vertex(2 * n)
+    edges = [
+        (i, j)
+        for start in (0, n)
+        for i in range(start, start + n)
+        for j in range(i + 1, start + n)
+    ]
+    g.add_edge_list(edges + [(0, n)])
+    g.vp["vprop_name"] = g.new_vertex_property(
+        "string", vals=[f"v{i}" for i in range(2 * n)]
+    )
+    return g
+
+
+# CONSTRUCT NETWORK FUNCTIONS #
+
+NODE_LISTS = pd.DataFrame(
+    {
+        "nodes": [["a", "b", "c"], ["b", "a", "a"], [], ["c", "d"], ["d"], ["e", "b"]],
+        "video": ["v1", "v1", "v2", "v2", None, "v3"],
+    }
+)
+
+
+def loop_cooccurrence_edgelist(df, node_list_col, context_group_col=None):
+    """The pair-by-pair builder that construct_cooccurrence_edgelist replaced."""
+    if context_group_col:
+        units = [
+            [node for nodes in group[node_list_col] for node in nodes]
+            for _, group in df.groupby(context_group_col)
+        ]
+    else:
+        units = list(df[node_list_col])
+    pairs = [
+        tuple(sorted(pair)) for unit in units for pair in combinations(set(unit), 2)
+    ]
+    edgelist = pd.DataFrame(pairs, columns=["i", "j"])
+    return edgelist.groupby(["i", "j"]).size().reset_index(name="count")
+
+
+@pytest.mark.parametrize("context_group_col", [None, "video"])
+def test_cooccurrence_edgelist_matches_the_loop_builder(context_group_col):
+    edgelist = networks.construct_cooccurrence_edgelist(
+        NODE_LISTS, "nodes", context_group_col
+    )
+    expected = loop_cooccurrence_edgelist(NODE_LISTS, "nodes", context_group_col)
+    pd.testing.assert_frame_equal(edgelist, expected)
+
+
+def test_cooccurrence_matrix_counts_each_node_once_per_unit():
+    counts, labels = networks.cooccurrence_matrix(NODE_LISTS, "nodes")
+    assert labels.tolist() == ["a", "b", "c", "d", "e"]
+    assert counts.shape == (5, 5)
+    assert counts.nnz == len(
+        networks.construct_cooccurrence_edgelist(NODE_LISTS, "nodes")
+    )
+    assert counts[0, 1] == 2  # "a" twice in the second row still counts once
+    assert sparse.tril(counts).nnz == 0
+
+
+def vertex_names(g, name_prop):
+    return [g.vp[name_prop][v] for v in g.vertices()]
+
+
+def weighted_edges(g, weight_prop, name_prop=None):
+    """(source, target, weight) for every edge, by vertex name if name_prop is set."""
+    edges = g.get_edges([g.ep[weight_prop]])
+    if name_prop is None:
+        return [(int(s), int(t), int(w)) for s, t, w in edges]
+    names = g.vp[name_prop]
+    return [(names[s], names[t], int(w)) for s, t, w in edges]
+
+
+def per_edge_graph(edgelist):
+    """The add_vertex / add_edge builder that g_from_weighted_edgelist replaced."""
+    g = gt.Graph(directed=False)
+    vprop_name = g.new_vertex_property("string")
+    eprop_weight = g.new_edge_property("int")
+    vertices = {}
+    for node_i, node_j, count in edgelist[["i", "j", "count"]].itertuples(index=False):
+        for node in (node_i, node_j):
+            if node not in vertices:
+                vertices[node] = g.add_vertex()
+                vprop_name[vertices[node]] = node
+        e = g.add_edge(vertices[node_i], vertices[node_j])
+        eprop_weight[e] = count
+    g.vp["vprop_name"] = vprop_name
+    g.ep["eprop_weight"] = eprop_weight
+    return g
+
+
+def test_g_from_weighted_edgelist_matches_the_per_edge_builder():
+    edgelist = networks.construct_cooccurrence_edgelist(NODE_LISTS, "nodes", "video")
+    g = networks.g_from_weighted_edgelist(edgelist)
+    expected = per_edge_graph(edgelist)
+
+    assert vertex_names(g, "vprop_name") == vertex_names(expected, "vprop_name")
+    assert weighted_edges(g, "eprop_weight", "vprop_name") == weighted_edges(
+        expected, "eprop_weight", "vprop_name"
+    )
+    assert not g.is_directed()
+
+
+def per_edge_mention_network(df):
+    """The per-edge construct_mention_network, before bulk construction."""
+    g = gt.Graph(directed=True)
+    mentions = df.assign(mentioned_users=df["comment_text"].str.findall(r"@(\w+)"))
+    mentions = mentions.explode("mentioned_users").dropna(subset=["mentioned_users"])
+    nodes = {user: g.add_vertex() for user in df["user"].unique()}
+    for user in mentions["mentioned_users"].unique():
+        if user not in nodes:
+            nodes[user] = g.add_vertex()
+    mentions = mentions[mentions["user"] != mentions["mentioned_users"]]
+    weights = Counter(zip(mentions["user"], mentions["mentioned_users"]))
+    weight = g.new_edge_property("int")
+    for (user, mentioned), count in weights.items():
+        weight[g.add_edge(nodes[user], nodes[mentioned])] = count
+    g.ep["weight"] = weight
+    isolates = [v for v in g.vertices() if g.get_total_degrees([v])[0] == 0]
+    g.remove_vertex(isolates)
+    return g
+
+
+def test_construct_mention_network_matches_the_per_edge_builder():
+    comments = pd.DataFrame(
+        {
+            "user": ["ann", "bo", "ann", "cy", "dee"],
+            "comment_text": [
+                "@bo @cy hello",
+                "@ann @ann",
+                "@bo again",
+                "@cy talking to myself",
+                "no mentions",
+            ],
+        }
+    )
+    g, edgelist = networks.construct_mention_network(comments.copy())
+    expected = per_edge_mention_network(comments)
+
+    assert g.num_vertices() == expected.num_vertices() == 3
+    assert sorted(weighted_edges(g, "weight")) == sorted(
+        weighted_edges(expected, "weight")
+    )
+    assert vertex_names(g, "name") == ["ann", "bo", "cy"]
+    assert edgelist["weight"].tolist() == [2, 2, 1]
+
+
+ENTITIES = pd.DataFrame(
+    {
+        "comment_id": ["c2", "c1", "c1", "c1", "c2", "c3", "c3", "c1", "c4", "c2"],
+        "span": [
+            "Ottawa",
+            "Canada",
+            "Ottawa",
+            "Canada",
+            "Canada",
+            "NDP",
+            "NDP",
+            "NDP",
+            "Canada",
+            "Trudeau",
+        ],
+        "score": [0.9, 0.8, 0.95, 0.7, 0.6, 0.9, 0.9, 0.3, 0.99, 0.9],
+        "label": ["LOC", "LOC", "LOC", "LOC", "LOC", "ORG", "ORG", "ORG", "LOC", "PER"],
+    }
+)
+
+
+def per_pair_entity_network(df, threshold=0.5, typelist=None, edge_weight_threshold=1):
+    """The g.edge() lookup builder that construct_entity_network replaced."""
+    df = df[df["score"] > threshold]
+    if typelist is not None:
+        df = df[df["label"].isin(typelist)]
+    g = gt.Graph()
+    name = g.new_vertex_property("string")
+    count = g.new_vertex_property("int")
+    weight = g.new_edge_property("int")
+    vertices = {}
+
+    def vertex(entity):
+        if entity not in vertices:
+            vertices[entity] = g.add_vertex()
+            name[vertices[entity]] = entity
+        count[vertices[entity]] += 1
+        return vertices[entity]
+
+    for _, group in df.groupby("comment_id"):
+        entities = group["span"].tolist()
+        for i, entity1 in enumerate(entities):
+            v1 = vertex(entity1)
+            for entity2 in entities[i + 1 :]:
+                v2 = vertex(entity2)
+                e = g.edge(v1, v2)
+                if e is None:
+                    e = g.add_edge(v1, v2)
+                weight[e] += 1
+    g.vp["name"], g.vp["count"], g.ep["weight"] = name, count, weight
+    gt.remove_self_loops(g)
+    keep = g.new_edge_property("bool", vals=weight.a >= edge_weight_threshold)
+    return gt.GraphView(g, efilt=keep)
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{}, {"edge_weight_threshold": 2}, {"typelist": ["LOC", "PER"]}]
+)
+def test_construct_entity_network_matches_the_per_pair_builder(kwargs):
+    gv, edgelist = networks.construct_entity_network(
+        ENTITIES, "comment_id", "span", "score", **kwargs
+    )
+    expected = per_pair_entity_network(ENTITIES, **kwargs)
+
+    assert vertex_names(gv, "name") == vertex_names(expected, "name")
+    assert [gv.vp["count"][v] for v in gv.vertices()] == [
+        expected.vp["count"][v] for v in expected.vertices()
+    ]
+    assert sorted(weighted_edges(gv, "weight", "name")) == sorted(
+        weighted_edges(expected, "weight", "name")
+    )
+    assert sorted(edgelist) == sorted(weighted_edges(expected, "weight", "name"))
+
+
+# INCREMENTAL UPDATES #
+
+
+def edges_by_name(g, weight_prop, name_prop):
+    """Edge weights keyed by vertex names, with undirected endpoints sorted."""
+    edges = weighted_edges(g, weight_prop, name_prop)
+    if g.is_directed():
+        return {(s, t): w for s, t, w in edges}
+    return {tuple(sorted((s, t))): w for s, t, w in edges}
+
+
+def test_update_weighted_graph_increments_and_appends():
+    g = networks.g_from_weighted_edgelist(
+        pd.DataFrame({"i": ["a"], "j": ["b"], "count": [1]})
+    )
+    delta = pd.DataFrame({"i": ["b", "b"], "j": ["a", "c"], "count": [2, 1]})
+    added = networks.update_weighted_graph(
+        g, delta, name_prop="vprop_name", weight_prop="eprop_weight"
+    )
+
+    assert added == (1, 1)
+    assert vertex_names(g, "vprop_name") == ["a", "b", "c"]
+    assert edges_by_name(g, "eprop_weight", "vprop_name") == {
+        ("a", "b"): 3,
+        ("b", "c"): 1,
+    }
+
+
+def test_update_entity_network_ignores_rows_it_has_already_seen(tmp_path):
+    path = tmp_path / "entities.gt"
+    args = ("comment_id", "span", "score")
+    first = networks.update_entity_network(path, ENTITIES, *args)
+    edges = edges_by_name(first, "weight", "name")
+    counts = dict(zip(vertex_names(first, "name"), first.vp["count"].a.tolist()))
+
+    again = networks.update_entity_network(path, ENTITIES, *args)
+    reloaded = gt.load_graph(str(path))
+    for g in (again, reloaded):
+        assert edges_by_name(g, "weight", "name") == edges
+        assert dict(zip(vertex_names(g, "name"), g.vp["count"].a.tolist())) == counts
+    assert networks.read_manifest(reloaded) == {"c1", "c2", "c3", "c4"}
+
+
+def test_incremental_entity_updates_match_a_full_build(tmp_path):
+    path = tmp_path / "entities.gt"
+    args = ("comment_id", "span", "score")
+    earlier = ENTITIES["comment_id"].isin(["c1", "c2"])
+    networks.update_entity_network(path, ENTITIES[earlier], *args)
+    # the second batch overlaps the first; rows already seen are skipped
+    g = networks.update_entity_network(
+        path, ENTITIES[~earlier | (ENTITIES["comment_id"] == "c2")], *args
+    )
+
+    full, _ = networks.construct_entity_network(ENTITIES, *args)
+    assert edges_by_name(g, "weight", "name") == edges_by_name(full, "weight", "name")
+    assert dict(zip(vertex_names(g, "name"), g.vp["count"].a.tolist())) == dict(
+        zip(vertex_names(full, "name"), full.vp["count"].a.tolist())
+    )
+
+
+def test_incremental_cooccurrence_updates_match_a_full_build(tmp_path):
+    path = tmp_path / "cooccurrence.gt"
+    rows = NODE_LISTS.assign(video_row=[f"r{i}" for i in range(len(NODE_LISTS))])
+    networks.update_cooccurrence_network(path, rows.iloc[:3], "video_row", "nodes")
+    g = networks.update_cooccurrence_network(path, rows.iloc[2:], "video_row", "nodes")
+
+    full = networks.g_from_weighted_edgelist(
+        networks.construct_cooccurrence_edgelist(rows, "nodes")
+    )
+    assert not g.is_directed()
+    assert edges_by_name(g, "eprop_weight", "vprop_name") == edges_by_name(
+        full, "eprop_weight", "vprop_name"
+    )
+
+
+# PARALLEL CONSTRUCTION #
+
+
+def test_parallel_cooccurrence_networks_match_a_serial_build(tmp_path):
+    df = pd.concat(
+        [
+            NODE_LISTS.assign(channel="left"),
+            NODE_LISTS.iloc[:4].assign(channel="right"),
+        ],
+        ignore_index=True,
+    )
+    contexts = {"rows": None, "videos": "video"}
+    results = {}
+    for n_processes in (1, 2):
+        pattern = str(tmp_path / f"{n_processes}_{{group}}_{{context}}.gt")
+        results[n_processes] = networks.construct_cooccurrence_networks(
+            df, "channel", "nodes", contexts, pattern, n_processes=n_processes
+        )
+
+    for context in contexts:
+        pd.testing.assert_frame_equal(results[1][context], results[2][context])
+        assert results[2][context]["channel"].unique().tolist() == ["left", "right"]
+        for channel in ("left", "right"):
+            serial = gt.load_graph(str(tmp_path / f"1_{channel}_{context}.gt"))
+            parallel = gt.load_graph(str(tmp_path / f"2_{channel}_{context}.gt"))
+            assert weighted_edges(parallel, "eprop_weight", "vprop_name") == (
+                weighted_edges(serial, "eprop_weight", "vprop_name")
+            )
+
+    expected = networks.construct_cooccurrence_edgelist(
+        df[df["channel"] == "left"], "nodes", "video"
+    )
+    left = results[2]["videos"].query("channel == 'left'").drop(columns="channel")
+    pd.testing.assert_frame_equal(left.reset_index(drop=True), expected)
+
+
+# MODEL NETWORK FUNCTIONS #
+
+
+def test_parallel_starts_keep_the_lowest_description_length(caplog):
+    g = two_cliques()
+    caplog.set_level(logging.INFO)
+    state = networks._fit_best_of(
+        g, False, {}, False, None, n_starts=2, n_processes=2, seed=1
+    )
+
+    message = next(
+        r.getMessage()
+        for r in caplog.records
+        if r.getMessage().startswith("Description lengths of 2 starts")
+    )
+    entropies = [float(e.replace(",", "")) for e in message.split(": ")[1].split(", ")]
+    assert len(entropies) == 2
+    assert state.entropy() == pytest.approx(min(entropies), abs=0.1)
+
+
+def test_fit_bppm_with_parallel_starts_and_chains():
+    g = two_cliques()
+    state, block_data = networks.fit_bppm(
+        g, refine="marginals", n_starts=2, n_chains=2, n_processes=2, seed=1
+    )
+
+    assert len(block_data) == g.num_vertices()
+    assert np.asarray(state.b.a).shape == (g.num_vertices(),)
+    # each vertex's marginal counts the partitions sampled by both chains
+    counts = {int(np.sum(g.vp["pv"][v])) for v in g.vertices()}
+    assert len(counts) == 1 and counts.pop() > 0
+
+
+def test_ppm_results_match_the_per_vertex_loop():
+    g = two_cliques(3)
+    g.vp["vprop_name"][5] = "v0"  # a duplicate name keeps its last block
+    blocks = g.new_vertex_property("int", vals=[7, 7, 2, 9, 9, 4])
+    block_data = networks._get_ppm_results(g, blocks)
+
+    contiguous = gt.contiguous_map(blocks)
+    expected = {g.vp["vprop_name"][v]: contiguous[v] for v in g.vertices()}
+    assert block_data.columns.tolist() == ["Node", "BlockID"]
+    assert list(block_data.itertuples(index=False, name=None)) == list(expected.items())
+
+
+def test_hbsbm_results_project_every_level_onto_the_nodes():
+    g = two_cliques(3)
+    bs = [np.array([0, 0, 1, 2, 2, 3]), np.array([0, 1, 1, 2]), np.array([1, 0, 0])]
+    state = SimpleNamespace(g=g, get_bs=lambda: bs)
+    names = vertex_names(g, "vprop_name")
+
+    base = networks._get_hbsbm_results(state)
+    assert base.columns.tolist() == ["Node", "BlockID"]
+    assert base["Node"].tolist() == names
+    assert base["BlockID"].tolist() == bs[0].tolist()
+
+    every = networks._get_hbsbm_results(state, all_levels=True)
+    expected = []
+    for level in range(len(bs)):
+        for v in g.vertices():
+            block = bs[0][v]
+            for higher in bs[1 : level + 1]:
+                block = higher[block]
+            expected.append((names[v], block, level))
+    assert list(every.itertuples(index=False, name=None)) == expected
+
+
+class ScriptedState:
+    """A block state whose sweeps change the description length by set amounts."""
+
+    def __init__(self, deltas, entropy=100.0, seconds_per_sweep=0.0):
+        self.deltas = iter(deltas)
+        self.S = entropy
+        self.seconds_per_sweep = seconds_per_sweep
+        self.sweeps = 0
+
+    def entropy(self):
+        return self.S
+
+    def multiflip_mcmc_sweep(self, niter, beta):
+        time.sleep(self.seconds_per_sweep)
+        delta = next(self.deltas, -1.0)
+        self.S += delta
+        self.sweeps += 1
+        return delta, niter, 0
+
+
+def test_refinement_stops_once_converged():
+    state = ScriptedState([-10, -5, -1e-9, -1e-9, -1e-9, -10])
+    trace = []
+    networks._refine_state_multiflip_mcmc_sweep(
+        state, niter=100, window=3, tol=1e-6, trace=trace
+    )
+
+    assert state.sweeps == 5
+    assert [t["sweep"] for t in trace] == [0, 100, 200, 300, 400, 500]
+    assert trace[0]["entropy"] == 100
+    assert trace[-1]["entropy"] == pytest.approx(state.entropy())
+    assert [t["seconds"] for t in trace] == sorted(t["seconds"] for t in trace)
+
+
+def test_refinement_stops_at_the_time_budget():
+    state = ScriptedState([], seconds_per_sweep=0.02)
+    trace = []
+    start = time.perf_counter()
+    networks._refine_state_multiflip_mcmc_sweep(
+        state, niter=100, tol=0, max_seconds=0.05, trace=trace
+    )
+
+    assert 3 <= state.sweeps < 10
+    assert time.perf_counter() - start < 1
+    assert trace[-1]["seconds"] >= 0.05
+    assert len(trace) == state.sweeps + 1
+
+
+def test_refinement_resumes_its_trace():
+    trace = [
+        {"sweep": 0, "entropy": 100.0, "seconds": 0.0},
+        {"sweep": 4, "entropy": 99.0, "seconds": 1.0},
+    ]
+    rounds = []
+    state = ScriptedState([], entropy=99.0)
+    networks._refine_state_multiflip_mcmc_sweep(
+        state,
+        niter=4,
+        tol=0,
+        trace=trace,
+        start_round=1,
+        callback=lambda s, completed: rounds.append(completed),
+    )
+
+    assert rounds == [2, 3, 4]
+    assert [t["sweep"] for t in trace] == [0, 4, 8, 12, 16]
+    assert [t["entropy"] for t in trace] == [100, 99, 98, 97, 96]
+    assert all(t["seconds"] >= 1.0 for t in trace[1:])
+
+
+def test_partition_accumulator_round_trips_and_merges():
+    first = networks.PartitionAccumulator(nested=False, stride=2)
+    for b in ([0, 0, 1, 1], [1, 1, 0, 0], [0, 1, 1, 1]):
+        first(SimpleNamespace(b=SimpleNamespace(a=np.array(b))))
+    assert (first.seen, first.kept) == (3, 2)
+
+    second = pickle.loads(pickle.dumps(first))
+    assert (second.seen, second.kept) == (3, 2)
+    assert len(second.partitions()) == 2
+
+    first.merge(second)
+    assert (first.seen, first.kept) == (6, 4)
+    assert len(first.partitions()) == 4
+
+
+def test_parallel_chains_keep_a_bounded_number_of_partitions():
+    g = two_cliques()
+    state = gt.minimize_blockmodel_dl(g=g, state=gt.PPBlockState)
+    networks.get_consensus_partition_from_posterior(
+        state, g, force_niter=50, n_chains=2, n_processes=2, seed=1, max_partitions=10
+    )
+    # the marginals of each vertex sum to the number of partitions kept
+    kept = {int(np.sum(g.vp["pv"][v])) for v in g.vertices()}
+    assert len(kept) == 1
+    assert 0 < kept.pop() <= 10
+
+
+# CHECKPOINTED FITTING #
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_fit_blockmodel_checkpointed_resumes_after_a_crash(
+    tmp_path, monkeypatch, caplog
+):
+    graph_path = tmp_path / "cliques.gt"
+    two_cliques().save(str(graph_path))
+    settings = dict(
+        model="ppm",
+        checkpoint_dir=tmp_path / "checkpoints",
+        checkpoint_every=2,
+        seed=1,
+        refine_args=dict(niter=5, tol=-1),  # never converges, so runs 5 rounds
+    )
+    checkpoint = tmp_path / "checkpoints" / "cliques_ppm.npz"
+
+    # crash right after the checkpoint at round 4
+    save = networks.save_blockmodel_checkpoint
+    saved_rounds = []
+
+    def save_then_crash(path, state, meta):
+        save(path, state, meta)
+        saved_rounds.append(meta["round"])
+        if meta["round"] == 4:
+            raise Interrupted
+
+    monkeypatch.setattr(networks, "save_blockmodel_checkpoint", save_then_crash)
+    with pytest.raises(Interrupted):
+        networks.fit_blockmodel_checkpointed(graph_path, **settings)
+    assert saved_rounds == [0, 2, 4]
+    bs, meta = networks.load_blockmodel_checkpoint(checkpoint)
+    assert (meta["round"], meta["complete"]) == (4, False)
+
+    monkeypatch.undo()
+    caplog.set_level(logging.INFO)
+    state, block_data = networks.fit_blockmodel_checkpointed(graph_path, **settings)
+    assert f"Resuming the ppm fit in {checkpoint} from round 4" in caplog.messages
+    bs, meta = networks.load_blockmodel_checkpoint(checkpoint)
+    assert (meta["round"], meta["complete"]) == (5, True)
+    assert [t["sweep"] for t in meta["trace"]] == [0, 5, 10, 15, 20, 25]
+    assert len(block_data) == 12
+
+    caplog.clear()
+    reused, reused_data = networks.fit_blockmodel_checkpointed(graph_path, **settings)
+    assert f"Reusing the completed ppm fit in {checkpoint}" in caplog.messages
+    np.testing.assert_array_equal(reused.get_blocks().a, bs[0])
+    pd.testing.assert_frame_equal(reused_data, block_data)
+
+    # other parameters give another key, so the fit starts over
+    caplog.clear()
+    networks.fit_blockmodel_checkpointed(graph_path, **{**settings, "seed": 2})
+    assert not any("Reusing" in m or "Resuming" in m for m in caplog.messages)
+
+
+# CONVERSION #
+
+
+def weighted_graph(directed):
+    g = gt.Graph(directed=directed)
+    g.add_vertex(4)
+    weight = g.new_edge_property("int")
+    g.add_edge_list(
+        [(0, 1, 2), (1, 2, 3), (0, 1, 1), (3, 3, 5), (2, 0, 4)], eprops=[weight]
+    )
+    g.ep["weight"] = weight
+    g.vp["name"] = g.new_vertex_property("string", vals=["a", "b", "c", "d"])
+    g.vp["size"] = g.new_vertex_property("int", vals=[10, 20, 30, 40])
+    return g
+
+
+def dense_adjacency(edges, n, directed):
+    expected = np.zeros((n, n), dtype=np.int64)
+    for s, t, w in edges:
+        expected[s, t] += w
+        if not directed and s != t:
+            expected[t, s] += w
+    return expected
+
+
+@pytest.mark.parametrize("directed", [True, False])
+def test_graph_tool_to_csr_matches_the_edge_list(directed):
+    g = weighted_graph(directed)
+    edges = [(0, 1, 2), (1, 2, 3), (0, 1, 1), (3, 3, 5), (2, 0, 4)]
+
+    weighted = networks.graph_tool_to_csr(g, weight="weight")
+    assert isinstance(weighted, sparse.csr_matrix)
+    assert weighted.shape == (4, 4)
+    np.testing.assert_array_equal(
+        weighted.toarray(), dense_adjacency(edges, 4, directed)
+    )
+
+    unweighted = networks.graph_tool_to_csr(g)
+    np.testing.assert_array_equal(
+        unweighted.toarray(),
+        dense_adjacency([(s, t, 1) for s, t, _ in edges], 4, directed),
+    )
+
+
+def test_graph_tool_to_csr_skips_filtered_vertices():
+    g = weighted_graph(directed=True)
+    keep = g.new_vertex_property("bool", vals=[True, False, True, True])
+    view = gt.GraphView(g, vfilt=keep)
+
+    adjacency = networks.graph_tool_to_csr(view, weight="weight")
+    # rows and columns are vertices 0, 2 and 3; edges through vertex 1 are gone
+    assert adjacency.shape == (3, 3)
+    np.testing.assert_array_equal(
+        adjacency.toarray(), [[0, 0, 0], [4, 0, 0], [0, 0, 5]]
+    )
+
+
+def test_graph_tool_to_networkx_keeps_weights_and_vertex_properties():
+    g = weighted_graph(directed=False)
+    nx_graph = networks.graph_tool_to_networkx(g, weight="weight")
+
+    assert not nx_graph.is_directed()
+    assert nx_graph.number_of_nodes() == 4
+    assert nx_graph[0][1]["weight"] == 3
+    assert nx_graph[0][2]["weight"] == 4
+    assert nx_graph[3][3]["weight"] == 5
+    assert [nx_graph.nodes[v]["name"] for v in range(4)] == ["a", "b", "c", "d"]
+    assert [nx_graph.nodes[v]["size"] for v in range(4)] == [10, 20, 30, 40]
+    np.testing.assert_array_equal(
+        nx.to_scipy_sparse_array(nx_graph, nodelist=range(4)).toarray(),
+        networks.graph_tool_to_csr(g, weight="weight").toarray(),
+    )
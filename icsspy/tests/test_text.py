@@ -0,0 +1,431 @@
+import json
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+text = pytest.importorskip("icsspy.text")
+
+WORDS = "the a cat dog sat on mat happy sad angry very not good bad and it was".split()
+
+TEXTS = [
+    "the cat sat on the mat",
+    "dog",
+    "it was very very bad and the dog was not happy",
+    "a sad cat",
+    "not good",
+    "the dog sat and the cat sat and it was good",
+]
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    """A tiny randomly initialised classifier saved locally, so no download."""
+    torch = pytest.importorskip("torch")
+    from transformers import (
+        BertConfig,
+        BertForSequenceClassification,
+        BertTokenizerFast,
+    )
+
+    path = tmp_path_factory.mktemp("tiny-classifier")
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    (path / "vocab.txt").write_text("\n".join(specials + WORDS))
+    tokenizer = BertTokenizerFast(str(path / "vocab.txt"))
+    labels = ["joy", "anger", "sadness"]
+    config = BertConfig(
+        vocab_size=tokenizer.vocab_size,
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=64,
+        initializer_range=0.5,
+        num_labels=len(labels),
+        id2label=dict(enumerate(labels)),
+        label2id={label: i for i, label in enumerate(labels)},
+    )
+    torch.manual_seed(0)
+    BertForSequenceClassification(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return str(path)
+
+
+@pytest.fixture
+def classifier(checkpoint):
+    import torch
+
+    text.MODEL_REGISTRY.clear()
+    tokenizer, model = text.load_sequence_classifier(checkpoint, torch.device("cpu"))
+    return tokenizer, model
+
+
+# TOKENISATION #
+
+
+def test_tokenize_windows_truncates_by_default(checkpoint):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+    long_text = " ".join(["cat"] * 20)
+    input_ids, doc_index, char_ends = text.tokenize_windows(
+        tokenizer, ["the dog", long_text], max_length=8
+    )
+    assert doc_index.tolist() == [0, 1]
+    assert [len(i) for i in input_ids] == [4, 8]
+    # the truncated text is covered up to the end of its sixth word
+    assert char_ends.tolist() == [len("the dog"), len(" ".join(["cat"] * 6))]
+
+
+def test_tokenize_windows_splits_long_texts_with_overlap(checkpoint):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+    long_text = " ".join(WORDS)
+    input_ids, doc_index, char_ends = text.tokenize_windows(
+        tokenizer, ["the dog", long_text, "cat"], max_length=8, stride=2
+    )
+    assert doc_index.tolist()[0] == 0 and doc_index.tolist()[-1] == 2
+    windows = [ids[1:-1] for ids, d in zip(input_ids, doc_index) if d == 1]
+    assert len(windows) > 1
+    assert all(len(w) <= 6 for w in windows)
+    # neighbouring windows share `stride` tokens
+    for left, right in zip(windows, windows[1:]):
+        assert left[-2:] == right[:2]
+    assert char_ends.tolist() == [len("the dog"), len(long_text), len("cat")]
+
+
+def test_aggregate_windows():
+    scores = np.array([[1.0, 0.0], [0.0, 1.0], [0.5, 0.5], [0.2, 0.4]])
+    doc_index = np.array([0, 0, 1, 3])
+
+    mean = text.aggregate_windows(scores, doc_index, n_docs=4, how="mean")
+    np.testing.assert_allclose(mean[[0, 1, 3]], [[0.5, 0.5], [0.5, 0.5], [0.2, 0.4]])
+    assert np.isnan(mean[2]).all()
+
+    top = text.aggregate_windows(scores, doc_index, n_docs=4, how="max")
+    np.testing.assert_allclose(top[[0, 1, 3]], [[1.0, 1.0], [0.5, 0.5], [0.2, 0.4]])
+    assert np.isnan(top[2]).all()
+
+    with pytest.raises(ValueError):
+        text.aggregate_windows(scores, doc_index, n_docs=4, how="median")
+
+
+# MODEL REGISTRY #
+
+
+def test_nbytes_counts_int8_weights_and_onnx_files(checkpoint, tmp_path):
+    import torch
+
+    text.MODEL_REGISTRY.clear()
+    device = torch.device("cpu")
+    _, fp32 = text.load_sequence_classifier(checkpoint, device)
+    _, int8 = text.load_sequence_classifier(checkpoint, device, backend="int8")
+
+    fp32_bytes = sum(p.numel() * p.element_size() for p in fp32.parameters())
+    assert text._nbytes(fp32) == fp32_bytes
+    # the quantised linear layers hold one byte per weight, not four
+    linear = sum(
+        m.weight.numel() for m in fp32.modules() if isinstance(m, torch.nn.Linear)
+    )
+    assert text._nbytes(int8) < text._nbytes(fp32)
+    assert text._nbytes(int8) > text._nbytes(fp32) - 4 * linear
+
+    onnx = tmp_path / "model.onnx"
+    onnx.write_bytes(b"0" * 1000)
+    (tmp_path / "model.onnx_data").write_bytes(b"0" * 500)
+    assert text._nbytes((object(), SimpleNamespace(model_path=onnx))) == 1500
+
+
+# BATCHED INFERENCE #
+
+
+def test_length_bucketed_batches_sorts_by_length():
+    batches = text.length_bucketed_batches([5, 1, 3, 2, 4], batch_size=2)
+    assert [b.tolist() for b in batches] == [[1, 3], [2, 4], [0]]
+
+
+def test_classify_batched_matches_one_text_at_a_time(classifier):
+    import torch
+
+    tokenizer, model = classifier
+    device = torch.device("cpu")
+    scores, ok, char_ends = text.classify_batched(
+        model, tokenizer, TEXTS, device=device, batch_size=4
+    )
+    assert ok.all()
+    assert scores.shape == (len(TEXTS), 3)
+    np.testing.assert_allclose(scores.sum(axis=1), 1, rtol=1e-5)
+
+    for i, td in enumerate(TEXTS):
+        single, single_ok, single_chars = text.classify_batched(
+            model, tokenizer, [td], device=device, batch_size=1
+        )
+        assert single_ok.all()
+        np.testing.assert_allclose(scores[i], single[0], atol=1e-5)
+        assert char_ends[i] == single_chars[0] == len(td)
+
+
+def test_classify_batched_aggregates_windows_of_long_texts(classifier):
+    import torch
+
+    tokenizer, model = classifier
+    texts = ["the dog", " ".join(WORDS * 3)]
+    settings = dict(device=torch.device("cpu"), max_length=8, stride=2)
+    mean, ok, char_ends = text.classify_batched(model, tokenizer, texts, **settings)
+    top, _, _ = text.classify_batched(
+        model, tokenizer, texts, aggregate="max", **settings
+    )
+    truncated, _, truncated_ends = text.classify_batched(
+        model, tokenizer, texts, device=torch.device("cpu"), max_length=8
+    )
+
+    assert ok.all()
+    assert char_ends[1] == len(texts[1]) > truncated_ends[1]
+    np.testing.assert_allclose(mean[0], top[0], atol=1e-6)
+    np.testing.assert_allclose(mean[0], truncated[0], atol=1e-6)
+    assert (top[1] >= mean[1] - 1e-6).all()
+
+
+# INFERENCE CACHE #
+
+
+def test_inference_cache_hits_and_misses(tmp_path):
+    cache = text.InferenceCache(tmp_path / "cache.sqlite")
+    cache.put_many("model", "rev", ["a", "b"], [{"scores": [1.0]}, {"scores": [2.0]}])
+
+    found = cache.get_many("model", "rev", ["a", "b", "c"])
+    assert found == {
+        text.hash_text("a"): {"scores": [1.0]},
+        text.hash_text("b"): {"scores": [2.0]},
+    }
+    assert (cache.hits, cache.misses) == (2, 1)
+    # other models and revisions never see each other's rows
+    assert cache.get_many("model", "other", ["a"]) == {}
+    assert cache.get_many("other", "rev", ["a"]) == {}
+
+
+def test_inference_cache_replaces_payloads_without_growing(tmp_path):
+    cache = text.InferenceCache(tmp_path / "cache.sqlite")
+    cache.put_many("model", "rev", ["a", "b"], [1, 2])
+    cache.put_many("model", "rev", ["b", "c"], [3, 4])
+
+    assert cache.count() == 3
+    assert cache._n_rows == 3
+    assert cache.get_many("model", "rev", ["b"]) == {text.hash_text("b"): 3}
+
+
+def test_inference_cache_evicts_least_recently_used(tmp_path):
+    cache = text.InferenceCache(tmp_path / "cache.sqlite", max_entries=3)
+    for td in ["a", "b", "c"]:
+        cache.put_many("model", "rev", [td], [td])
+    # touching "a" makes "b" the least recently used row
+    cache.get_many("model", "rev", ["a"])
+    cache.put_many("model", "rev", ["d"], ["d"])
+
+    assert cache.count() == 3
+    found = cache.get_many("model", "rev", ["a", "b", "c", "d"])
+    assert text.hash_text("b") not in found
+    assert len(found) == 3
+
+
+def test_inference_cache_recounts_when_shared(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    first = text.InferenceCache(path, max_entries=4)
+    first.put_many("model", "rev", ["a", "b"], [1, 2])
+    # a pickled copy (as handed to a worker process) counts the table afresh
+    second = pickle.loads(pickle.dumps(first))
+    assert second._conn is None and second._n_rows is None
+    second.put_many("model", "rev", ["c", "d"], [3, 4])
+
+    # the first handle's estimate lags behind, but it recounts before evicting
+    first.put_many("model", "rev", ["e", "f", "g"], [5, 6, 7])
+    assert first.count() == 4
+    assert first._n_rows == 4
+
+
+# EMBEDDING STORE #
+
+
+class CountingEncoder:
+    """Stands in for a SentenceTransformer and records what it was asked to encode."""
+
+    def __init__(self, width=4):
+        self.width = width
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(texts))
+        return np.array([[len(td) + j for j in range(self.width)] for td in texts])
+
+    def get_sentence_embedding_dimension(self):
+        return self.width
+
+
+def test_embedding_store_appends_and_reopens(tmp_path):
+    store = text.EmbeddingStore(tmp_path, "org/model")
+    store.append(["a", "bb"], np.array([[1, 2], [3, 4]]))
+    store.append(["bb", "ccc", "ccc"], np.array([[0, 0], [5, 6], [7, 8]]))
+    assert len(store) == 3
+
+    reopened = text.EmbeddingStore(tmp_path, "org/model")
+    assert len(reopened) == 3
+    positions, found = reopened.lookup(["ccc", "a", "missing"])
+    assert positions.tolist() == [2, 0, -1]
+    assert found.tolist() == [True, True, False]
+    np.testing.assert_array_equal(reopened.embeddings, [[1, 2], [3, 4], [5, 6]])
+    assert reopened.embeddings.dtype == np.float16
+
+    with pytest.raises(ValueError):
+        reopened.append(["dddd"], np.zeros((1, 3)))
+
+
+def test_embedding_store_drops_rows_from_an_unfinished_append(tmp_path):
+    store = text.EmbeddingStore(tmp_path, "model")
+    store.append(["a", "b"], np.array([[1, 1], [2, 2]]))
+    # rows written to the matrix, but the run died before the index was updated
+    index = store.index_path.read_text()
+    store.append(["c"], np.array([[9, 9]]))
+    store.index_path.write_text(index)
+
+    reopened = text.EmbeddingStore(tmp_path, "model")
+    assert len(reopened.embeddings) == 2
+    reopened.append(["d"], np.array([[4, 4]]))
+    np.testing.assert_array_equal(reopened.embeddings, [[1, 1], [2, 2], [4, 4]])
+    assert np.load(reopened.matrix_path).shape == (3, 2)
+
+
+def test_embedding_store_only_encodes_new_texts(tmp_path):
+    encoder = CountingEncoder()
+    store = text.EmbeddingStore(tmp_path, "model", dtype="float32")
+    first = store.encode(["a", "bb", "a"], encoder)
+    second = text.EmbeddingStore(tmp_path, "model", dtype="float32").encode(
+        ["bb", "ccc", "a"], encoder
+    )
+
+    assert encoder.calls == [["a", "bb"], ["ccc"]]
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_array_equal(second[1], [3, 4, 5, 6])
+    assert second.dtype == np.float32
+
+
+def test_embedding_store_handles_empty_input(tmp_path):
+    encoder = CountingEncoder()
+    store = text.EmbeddingStore(tmp_path, "model")
+    positions, found = store.lookup([])
+    assert positions.dtype == np.int64 and found.shape == (0,)
+
+    empty = store.encode([], encoder)
+    assert empty.shape == (0, 4) and empty.dtype == np.float32
+    assert not store.matrix_path.exists()
+
+    store.encode(["a"], encoder)
+    assert store.encode([], encoder).shape == (0, 4)
+    assert encoder.calls == [["a"]]
+
+
+# STREAMING #
+
+
+def write_comments(path, n=6):
+    pd.DataFrame(
+        {
+            "comment_id": [f"c{i}" for i in range(n)],
+            "text": [TEXTS[i % len(TEXTS)] for i in range(n)],
+            "channel": ["left" if i % 2 else "right" for i in range(n)],
+        }
+    ).to_csv(path, index=False)
+
+
+class FlakyLabeller:
+    """Labels text lengths, adding a column named after each chunk, and can fail."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = []
+
+    def __call__(self, df, idcol, textcol):
+        self.calls.append(df[idcol].tolist())
+        if len(self.calls) == self.fail_on:
+            raise RuntimeError("interrupted")
+        out = pd.DataFrame({idcol: df[idcol], f"from_{df[idcol].iloc[0]}": 1})
+        out["length"] = df[textcol].str.len()
+        return out
+
+
+def test_label_csv_in_chunks_resumes_from_checkpoint(tmp_path):
+    source, output = tmp_path / "comments.csv", tmp_path / "labelled.csv"
+    write_comments(source)
+    checkpoint = tmp_path / "labelled.csv.checkpoint.json"
+
+    flaky = FlakyLabeller(fail_on=2)
+    with pytest.raises(RuntimeError):
+        text.label_csv_in_chunks(
+            flaky, source, output, "comment_id", chunksize=2, textcol="text"
+        )
+    saved = json.loads(checkpoint.read_text())
+    assert saved["rows_read"] == 2
+    assert saved["columns"] == ["comment_id", "from_c0", "length"]
+
+    resumed = FlakyLabeller()
+    n = text.label_csv_in_chunks(
+        resumed, source, output, "comment_id", chunksize=2, textcol="text"
+    )
+    assert n == 6
+    assert resumed.calls == [["c2", "c3"], ["c4", "c5"]]
+    assert not checkpoint.exists()
+
+    labelled = pd.read_csv(output)
+    assert labelled.columns.tolist() == ["comment_id", "from_c0", "length"]
+    assert labelled["comment_id"].tolist() == [f"c{i}" for i in range(6)]
+    assert labelled["length"].tolist() == [len(TEXTS[i]) for i in range(6)]
+    # later chunks are written under the first header, without their own columns
+    assert labelled["from_c0"].iloc[:2].tolist() == [1, 1]
+    assert labelled["from_c0"].iloc[2:].isna().all()
+
+
+def test_label_csv_in_chunks_keeps_emotion_columns_aligned(checkpoint, tmp_path):
+    source, output = tmp_path / "comments.csv", tmp_path / "emotions.csv"
+    write_comments(source)
+    settings = dict(
+        model=checkpoint, textcol="text", multilabel=False, set_torch_device=False
+    )
+    text.label_csv_in_chunks(
+        text.label_emotion_concepts,
+        source,
+        output,
+        "comment_id",
+        chunksize=2,
+        carry_cols=["channel"],
+        **settings,
+    )
+
+    emotions = ["ec_joy", "ec_anger", "ec_sadness"]
+    labelled = pd.read_csv(output)
+    assert labelled.columns.tolist() == emotions + ["comment_id", "text", "channel"]
+
+    expected = text.label_emotion_concepts(
+        df=pd.read_csv(source), idcol="comment_id", **settings
+    )
+    top = labelled[emotions].idxmax(axis=1)
+    # the chunks disagree on which concepts come out on top
+    assert top.iloc[:2].nunique() < top.nunique()
+    assert top.tolist() == expected[emotions].idxmax(axis=1).tolist()
+    assert (labelled[emotions].notna().sum(axis=1) == 1).all()
+    assert labelled["channel"].tolist() == ["right", "left"] * 3
+
+
+def test_int8_backend_agrees_with_fp32(checkpoint):
+    text.MODEL_REGISTRY.clear()
+    result = text.benchmark_backends(
+        checkpoint, TEXTS * 4, backends=("int8", "onnx"), batch_size=8
+    ).set_index("backend")
+
+    # the ONNX backend is skipped unless optimum is installed
+    assert result.index[:2].tolist() == ["torch", "int8"]
+    assert result.loc["torch", "max_abs_diff"] == 0
+    assert result.loc["int8", "top_label_agreement"] == 1
+    assert result.loc["int8", "max_abs_diff"] < 0.05
@@ -0,0 +1,366 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import httplib2
+import pandas as pd
+import pytest
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+import icsspy.youtube as yt
+
+# A local fake of the parts of the YouTube Data API used by the collectors.
+
+
+def http_error(status, reason):
+    content = {"error": {"message": reason, "errors": [{"reason": reason}]}}
+    return HttpError(
+        httplib2.Response({"status": status}), json.dumps(content).encode()
+    )
+
+
+def comment(comment_id, text, published_at="2024-01-01T00:00:00Z"):
+    return {
+        "id": comment_id,
+        "snippet": {
+            "textDisplay": text,
+            "authorDisplayName": "author",
+            "authorChannelUrl": "http://www.youtube.com/channel/author",
+            "likeCount": 0,
+            "publishedAt": published_at,
+            "updatedAt": published_at,
+        },
+    }
+
+
+class FakeDataAPI:
+    def __init__(
+        self, threads, disabled=(), quota=None, page_size=2, replies=None, throttled=()
+    ):
+        self.threads = threads  # video_id -> commentThreads items, newest first
+        self.replies = replies or {}  # thread_id -> all replies
+        self.disabled = set(disabled)
+        self.throttled = set(throttled)  # answered with 429 on every request
+        self.quota = quota or {}  # key -> units before quotaExceeded
+        self.page_size = page_size
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def spend(self, key):
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if self.calls[key] > self.quota.get(key, float("inf")):
+                raise http_error(403, "quotaExceeded")
+
+
+class FakeRequest:
+    """Like googleapiclient's HttpRequest, the API key is part of the uri."""
+
+    def __init__(self, api, respond, **params):
+        self.api, self.respond = api, respond
+        self.uri = "https://youtube.test/youtube/v3?" + urlencode(params)
+
+    def execute(self):
+        params = parse_qs(urlsplit(self.uri).query)
+        assert len(params["key"]) == 1 and "fields" in params
+        self.api.spend(params["key"][0])
+        return self.respond()
+
+
+class FakeCommentThreads:
+    def __init__(self, api):
+        self.api = api
+
+    def list(self, part, videoId, maxResults, fields, order="time", pageToken=None):
+        assert order == "time"
+
+        def respond():
+            if videoId in self.api.disabled:
+                raise http_error(403, "commentsDisabled")
+            if videoId in self.api.throttled:
+                raise http_error(429, "rateLimitExceeded")
+            start = int(pageToken or 0)
+            end = start + self.api.page_size
+            threads = self.api.threads[videoId]
+            response = {"items": threads[start:end]}
+            if end < len(threads):
+                response["nextPageToken"] = str(end)
+            return response
+
+        return FakeRequest(self.api, respond, fields=fields)
+
+
+class FakeComments:
+    def __init__(self, api):
+        self.api = api
+
+    def list(self, part, parentId, maxResults, fields, pageToken=None):
+        def respond():
+            start = int(pageToken or 0)
+            end = start + self.api.page_size
+            replies = self.api.replies[parentId]
+            response = {"items": replies[start:end]}
+            if end < len(replies):
+                response["nextPageToken"] = str(end)
+            return response
+
+        return FakeRequest(self.api, respond, fields=fields)
+
+
+class FakeVideos:
+    def __init__(self, api):
+        self.api = api
+
+    def list(self, part, id, fields):
+        def respond():
+            return {"items": [{"id": video_id} for video_id in id.split(",")]}
+
+        return FakeRequest(self.api, respond, fields=fields)
+
+
+class FakeService:
+    def __init__(self, api):
+        self.api = api
+
+    def commentThreads(self):
+        return FakeCommentThreads(self.api)
+
+    def comments(self):
+        return FakeComments(self.api)
+
+    def videos(self):
+        return FakeVideos(self.api)
+
+
+class FakeYouTubeAPI(yt.YouTubeAPI):
+    def __init__(self, api_keys, api):
+        self.api = api
+        super().__init__(api_keys)
+
+    def build_service(self):
+        return FakeService(self.api)
+
+
+def thread(comment_id, day=1, n_replies=1):
+    published_at = f"2024-01-{day:02d}T00:00:00Z"
+    return {
+        "id": comment_id,
+        "snippet": {
+            "topLevelComment": comment(comment_id, "a &amp; b", published_at),
+            "totalReplyCount": n_replies,
+        },
+        "replies": {"comments": [comment(f"{comment_id}.r0", "reply", published_at)]},
+    }
+
+
+def make_threads(n_videos=6, n_threads=5):
+    return {
+        f"v{v}": [thread(f"v{v}c{c}") for c in range(n_threads)]
+        for v in range(n_videos)
+    }
+
+
+def test_collect_comments_across_keys(tmp_path):
+    api = FakeDataAPI(make_threads(), disabled=["v5"])
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a", "b", "c"], api))
+    output = tmp_path / "comments.csv"
+    collector.collect_comments_for_videos(
+        [f"v{v}" for v in range(6)], str(output), overwrite=True
+    )
+
+    comments = pd.read_csv(output)
+    assert len(comments) == 5 * 5 * 2
+    assert set(comments["video_id"]) == {f"v{v}" for v in range(5)}
+    assert comments["comment_id"].is_unique
+    assert (comments.loc[comments["text"] != "reply", "text"] == "a & b").all()
+    # 3 pages for each of 5 videos, plus the disabled video
+    assert sum(collector.scheduler.spent) == sum(api.calls.values()) == 16
+    assert len(api.calls) == 3
+
+
+def test_exhausted_key_is_retired():
+    api = FakeDataAPI(make_threads(), quota={"a": 1})
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a", "b"], api))
+    for v in range(6):
+        assert len(collector.get_video_comments(f"v{v}")) == 10
+    assert api.calls["a"] == 2  # one successful and one rejected request
+    assert collector.scheduler.paused_until[0] > time.monotonic() + 3600
+
+
+def test_scheduler_routes_to_headroom_and_raises_when_exhausted():
+    now = [0.0]
+    scheduler = yt.QuotaScheduler(
+        2, capacity=3, refill_rate=1, max_wait=0.5, clock=lambda: now[0]
+    )
+    assert [scheduler.acquire() for _ in range(6)] == [0, 1, 0, 1, 0, 1]
+    with pytest.raises(yt.QuotaExhausted):
+        scheduler.acquire()
+    now[0] = 1.0
+    assert scheduler.acquire() in (0, 1)
+    assert scheduler.spent == [4, 3] or scheduler.spent == [3, 4]
+
+
+def test_channel_video_data_keeps_order():
+    api = FakeDataAPI({})
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a", "b", "c"], api))
+    video_ids = [f"v{v}" for v in range(230)]
+    details = collector.get_channel_video_data(video_ids)
+    assert [item["id"] for item in details] == video_ids
+    assert sum(api.calls.values()) == 5
+
+
+def test_queue_resumes_mid_video_without_refetching_pages(tmp_path):
+    threads = make_threads(n_videos=3, n_threads=6)
+    api = FakeDataAPI(threads, disabled=["v2"], quota={"a": 4})
+    queue = yt.VideoQueue(tmp_path / "queue.sqlite")
+    assert queue.add(["v0", "v1", "v2", "v0"]) == 3
+    output = tmp_path / "comments.csv"
+
+    scheduler = yt.QuotaScheduler(1, max_wait=0)
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a"], api), scheduler=scheduler)
+    counts = collector.collect_comments_from_queue(queue, str(output))
+    assert counts["done"] == 1 and counts["in-progress"] == 2
+    assert api.calls["a"] == 5  # three pages of v0, one of v1, then quotaExceeded
+
+    # the next day's quota
+    api.quota, api.calls = {}, {}
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a"], api))
+    counts = collector.collect_comments_from_queue(queue, str(output))
+    assert counts == {
+        "pending": 0,
+        "in-progress": 0,
+        "done": 2,
+        "disabled": 1,
+        "failed": 0,
+    }
+    assert api.calls["a"] == 3  # the remaining two pages of v1, and v2
+
+    comments = pd.read_csv(output)
+    assert len(comments) == 2 * 6 * 2
+    assert comments["comment_id"].is_unique
+
+
+def test_throttled_video_fails_without_stopping_the_run(tmp_path):
+    api = FakeDataAPI(make_threads(n_videos=3, n_threads=3), throttled=["v1"])
+    queue = yt.VideoQueue(tmp_path / "queue.sqlite")
+    queue.add(["v0", "v1", "v2"])
+    output = tmp_path / "comments.csv"
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a", "b"], api), max_retries=2)
+    counts = collector.collect_comments_from_queue(queue, str(output))
+
+    assert counts["done"] == 2 and counts["failed"] == 1
+    (error,) = queue._execute(
+        "SELECT error FROM videos WHERE video_id = 'v1'"
+    ).fetchone()
+    assert error.startswith("Max retries exceeded")
+    comments = pd.read_csv(output)
+    assert set(comments["video_id"]) == {"v0", "v2"}
+    assert len(comments) == 2 * 3 * 2
+
+
+def test_recrawl_appends_only_new_threads(tmp_path):
+    threads = make_threads(n_videos=2, n_threads=5)
+    api = FakeDataAPI(threads)
+    queue = yt.VideoQueue(tmp_path / "queue.sqlite")
+    queue.add(["v0", "v1"])
+    output = tmp_path / "comments.csv"
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a", "b"], api))
+    collector.collect_comments_from_queue(queue, str(output))
+    assert queue.progress("v0")["newest_comment_id"] == "v0c0"
+
+    # a week later, v0 has three new threads
+    threads["v0"] = [thread(f"v0n{c}", day=8) for c in range(3)] + threads["v0"]
+    api.calls = {}
+    assert queue.requeue(["v0", "v1"], older_than_days=1) == 0
+    assert queue.requeue(["v0", "v1"]) == 2
+    counts = collector.collect_comments_from_queue(queue, str(output))
+    assert counts["done"] == 2
+    assert sum(api.calls.values()) == 3  # two pages of v0 and one of v1
+
+    comments = pd.read_csv(output)
+    assert len(comments) == 2 * 5 * 2 + 3 * 2
+    assert comments["comment_id"].is_unique
+    progress = queue.progress("v0")
+    assert progress["newest_comment_id"] == "v0n0"
+    assert progress["newest_published_at"] == "2024-01-08T00:00:00Z"
+
+
+def test_truncated_threads_are_expanded_once(tmp_path):
+    threads = make_threads(n_videos=2, n_threads=3)
+    threads["v0"][1] = thread("v0c1", n_replies=5)
+    threads["v1"][2] = thread("v1c2", n_replies=3)
+    replies = {
+        thread_id: [comment(f"{thread_id}.r{r}", "reply") for r in range(n)]
+        for thread_id, n in [("v0c1", 5), ("v1c2", 3)]
+    }
+    api = FakeDataAPI(threads, replies=replies)
+    queue = yt.VideoQueue(tmp_path / "queue.sqlite")
+    queue.add(["v0", "v1"])
+    output = tmp_path / "comments.csv"
+    collector = yt.ConcurrentCollector(FakeYouTubeAPI(["a", "b"], api))
+    collector.collect_comments_from_queue(queue, str(output))
+    assert queue.counts("threads")["pending"] == 2
+
+    api.calls = {}
+    counts = collector.expand_replies_from_queue(queue, str(output))
+    assert counts["done"] == 2
+    assert sum(api.calls.values()) == 3 + 2  # pages of two replies per thread
+    assert collector.expand_replies_from_queue(queue, str(output))["done"] == 2
+
+    comments = pd.read_csv(output)
+    assert comments["comment_id"].is_unique
+    assert len(comments) == 2 * 3 * 2 + 4 + 2
+    assert (comments["comment_id"].str.startswith("v0c1.")).sum() == 5
+
+
+def test_pooled_transport_against_local_server():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            requests_seen.append((parse_qs(urlsplit(self.path).query), self.headers))
+            body = gzip.compress(json.dumps({"items": [{"id": "v0"}]}).encode())
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-encoding", "gzip")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    class LocalYouTubeAPI(yt.YouTubeAPI):
+        def build_service(self):
+            return build(
+                "youtube",
+                "v3",
+                http=self.http,
+                cache_discovery=False,
+                client_options={"api_endpoint": endpoint},
+            )
+
+    try:
+        api = LocalYouTubeAPI(["k1", "k2"])
+        service = api.service
+        assert yt.get_channel_video_data(api, ["v0"]) == [{"id": "v0"}]
+        api.switch_key()
+        assert api.service is service
+        assert yt.get_channel_video_data(api, ["v0"]) == [{"id": "v0"}]
+    finally:
+        server.shutdown()
+
+    assert [query["key"] for query, _ in requests_seen] == [["k1"], ["k2"]]
+    assert all(query["fields"] == [yt.VIDEO_FIELDS] for query, _ in requests_seen)
+    assert all("gzip" in headers["accept-encoding"] for _, headers in requests_seen)
+    assert all("gzip" in headers["user-agent"] for _, headers in requests_seen)
@@ -1,9 +1,29 @@
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain
-from typing import Any, List, Optional, Tuple
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import spacy
 from bertopic import BERTopic
@@ -20,7 +40,7 @@ from sentence_transformers import SentenceTransformer
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.preprocessing import LabelBinarizer
 from tqdm import tqdm
-from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
 from umap import UMAP
 
 import icsspy.utils as u
@@ -53,18 +73,1127 @@ def make_text_df(filenames: List[str], texts: List[List[str]]) -> pd.DataFrame:
     return data
 
 
-def truncate_text_to_transformer_limit(text: str, limit: int = 512) -> str:
+def truncate_text_to_transformer_limit(
+    text: str, limit: int = 512, tokenizer: Optional[Any] = None
+) -> str:
     """
     Truncate text to the specified transformer limit.
 
+    Without a tokenizer the limit is counted in characters. With a (fast) tokenizer
+    it is counted in tokens, including special tokens, which is what the model
+    actually sees.
+
     Args:
         text (str): Text to be truncated.
         limit (int): Maximum length of the text. Defaults to 512.
+        tokenizer (Optional[Any]): Tokenizer to count tokens with. Defaults to None.
 
     Returns:
         str: Truncated text.
     """
-    return text[:limit]
+    if tokenizer is None:
+        return text[:limit]
+    _, _, char_ends = tokenize_windows(tokenizer, [text], max_length=limit)
+    return text[: char_ends[0]]
+
+
+# TOKENISATION #
+
+
+def tokenize_windows(
+    tokenizer: Any,
+    texts: List[str],
+    max_length: int = 512,
+    stride: Optional[int] = None,
+) -> Tuple[List[List[int]], np.ndarray, np.ndarray]:
+    """
+    Tokenise texts once, in batch, truncating or splitting them at a token limit.
+
+    By default each text is truncated to `max_length` tokens. If `stride` is set,
+    long texts are instead split into overlapping windows of up to `max_length`
+    tokens that share `stride` tokens with their neighbours, so no text is lost.
+    Requires a fast tokenizer.
+
+    Args:
+        tokenizer (Any): A transformers fast tokenizer.
+        texts (List[str]): Texts to tokenise.
+        max_length (int): Maximum number of tokens per window. Defaults to 512.
+        stride (Optional[int]): Number of overlapping tokens between windows.
+            Defaults to None (truncate instead of splitting).
+
+    Returns:
+        Tuple[List[List[int]], np.ndarray, np.ndarray]: Token ids for each window,
+            the position of the text each window came from, and the number of
+            characters of each text covered by its windows.
+    """
+    encoded = tokenizer(
+        texts,
+        truncation=True,
+        max_length=max_length,
+        stride=stride or 0,
+        return_overflowing_tokens=stride is not None,
+        return_offsets_mapping=True,
+    )
+    if stride is None:
+        doc_index = np.arange(len(texts))
+    else:
+        doc_index = np.asarray(encoded["overflow_to_sample_mapping"])
+
+    char_ends = np.zeros(len(texts), dtype=int)
+    for d, offsets in zip(doc_index, encoded["offset_mapping"]):
+        char_ends[d] = max([char_ends[d]] + [end for _, end in offsets])
+    return encoded["input_ids"], doc_index, char_ends
+
+
+def aggregate_windows(
+    scores: np.ndarray, doc_index: np.ndarray, n_docs: int, how: str = "mean"
+) -> np.ndarray:
+    """
+    Aggregate per-window scores back to one row per document.
+
+    Args:
+        scores (np.ndarray): Score matrix with one row per window.
+        doc_index (np.ndarray): Document position of each window.
+        n_docs (int): Number of documents.
+        how (str): "mean" or "max". Defaults to "mean".
+
+    Returns:
+        np.ndarray: Score matrix with one row per document (NaN if it has no windows).
+    """
+    counts = np.bincount(doc_index, minlength=n_docs)
+    if how == "mean":
+        out = np.zeros((n_docs, scores.shape[1]), dtype=scores.dtype)
+        np.add.at(out, doc_index, scores)
+        out /= np.maximum(counts, 1)[:, None]
+    elif how == "max":
+        out = np.full((n_docs, scores.shape[1]), -np.inf, dtype=scores.dtype)
+        np.maximum.at(out, doc_index, scores)
+    else:
+        raise ValueError(f"Unknown aggregation '{how}'; use 'mean' or 'max'")
+    out[counts == 0] = np.nan
+    return out
+
+
+def default_activation(config: Any) -> str:
+    """Pick sigmoid for multi-label (or single-output) models, softmax otherwise."""
+    if config.problem_type == "multi_label_classification" or config.num_labels == 1:
+        return "sigmoid"
+    return "softmax"
+
+
+def _activate(logits: np.ndarray, activation: Optional[str]) -> np.ndarray:
+    if activation == "softmax":
+        return softmax(logits, axis=1)
+    elif activation == "sigmoid":
+        return 1 / (1 + np.exp(-logits))
+    elif activation is None:
+        return logits
+    raise ValueError(f"Unknown activation '{activation}'")
+
+
+# MODEL REGISTRY #
+
+
+def _tensor_nbytes(values: Any, seen: set) -> int:
+    import torch
+
+    total = 0
+    for value in values:
+        if isinstance(value, (tuple, list)):
+            # int8 linear layers keep (weight, bias) in a packed params tuple
+            total += _tensor_nbytes(value, seen)
+        elif isinstance(value, torch.Tensor) and value.data_ptr() not in seen:
+            seen.add(value.data_ptr())
+            total += value.numel() * value.element_size()
+    return total
+
+
+def _nbytes(obj: Any) -> int:
+    """
+    Estimate the memory held by a model (or a tuple of models) in bytes.
+
+    Torch models are measured from their state dict, which (unlike `parameters()`)
+    includes the packed weights of int8 quantised layers; tied weights are counted
+    once. ONNX Runtime models are measured by the size of their model file.
+    """
+    if isinstance(obj, tuple):
+        return sum(_nbytes(o) for o in obj)
+    model_path = getattr(obj, "model_path", None)
+    if model_path is not None:
+        model_path = Path(model_path)
+        files = [model_path, model_path.with_name(model_path.name + "_data")]
+        return sum(f.stat().st_size for f in files if f.exists())
+    if hasattr(obj, "state_dict"):
+        return _tensor_nbytes(obj.state_dict(keep_vars=True).values(), set())
+    return 0
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models, keyed by (kind, name, device, dtype).
+
+    Labellers that are called once per channel would otherwise reload the same
+    weights on every call. The least recently used models are evicted once the
+    estimated size of everything loaded exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024**3) -> None:
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the model stored under `key`, calling `loader` to load it if needed.
+
+        Args:
+            key (Hashable): Registry key, e.g. ("classifier", name, device, dtype).
+            loader (Callable[[], Any]): Loads the model when it is not registered.
+
+        Returns:
+            Any: The loaded model (or whatever `loader` returns).
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+
+            logging.info(f"Loading {key} into the model registry")
+            obj = loader()
+            self._models[key] = (obj, _nbytes(obj))
+            self._evict(keep=key)
+            return obj
+
+    def _evict(self, keep: Hashable) -> None:
+        while self.nbytes > self.max_bytes and len(self._models) > 1:
+            key = next(k for k in self._models if k != keep)
+            del self._models[key]
+            logging.info(f"Evicted {key} from the model registry")
+
+    @property
+    def nbytes(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+
+def _resolve_device(set_torch_device: bool, backend: str = "torch") -> Any:
+    import torch
+
+    if set_torch_device and backend == "torch":
+        return u.set_torch_device()
+    return torch.device("cpu")
+
+
+BACKENDS = ("torch", "int8", "onnx")
+
+ONNX_EXPORT_DIR = Path.home() / ".cache" / "icsspy" / "onnx"
+
+
+def _load_onnx_classifier(name: str, export_dir: Path) -> Any:
+    """Load an ONNX Runtime classifier, exporting it to `export_dir` the first time."""
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+    except ImportError as e:
+        raise ImportError(
+            "The 'onnx' backend needs optimum with ONNX Runtime, which is in the "
+            "'onnx' extra: pip install 'icsspy[onnx]'"
+        ) from e
+
+    path = export_dir / name.replace("/", "__")
+    if not (path / "model.onnx").exists():
+        logging.info(f"Exporting {name} to ONNX in {path}")
+        model = ORTModelForSequenceClassification.from_pretrained(name, export=True)
+        model.save_pretrained(path)
+
+    model = ORTModelForSequenceClassification.from_pretrained(path)
+    # keep the hub name, not the export path, so cache keys stay stable
+    model.config._name_or_path = name
+    return model
+
+
+def load_sequence_classifier(
+    name: str,
+    device: Any,
+    dtype: Optional[str] = None,
+    backend: str = "torch",
+    export_dir: Optional[Union[str, Path]] = None,
+) -> Tuple[Any, Any]:
+    """
+    Get a (tokenizer, model) pair for sequence classification from the registry.
+
+    The "int8" and "onnx" backends are for CPU inference. "int8" applies PyTorch
+    dynamic int8 quantisation to the linear layers of the fp32 model. "onnx" runs
+    the model with ONNX Runtime (requires optimum); the exported model is cached
+    under `export_dir` so it is only exported once. Use `benchmark_backends` to
+    check their speed and agreement with fp32 for a given model.
+
+    Args:
+        name (str): Model name on the Hugging Face hub (or a local path).
+        device (Any): Torch device to put the model on.
+        dtype (Optional[str]): Torch dtype to load the weights as (e.g., "float16").
+            Defaults to None, which keeps the checkpoint's dtype. Only used by the
+            "torch" backend.
+        backend (str): "torch", "int8", or "onnx". Defaults to "torch".
+        export_dir (Optional[Union[str, Path]]): Where exported ONNX models are kept.
+            Defaults to ONNX_EXPORT_DIR.
+
+    Returns:
+        Tuple[Any, Any]: Tokenizer and model, with the model in eval mode.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'; use one of {BACKENDS}")
+    if backend != "torch":
+        import torch
+
+        if str(device) != "cpu":
+            logging.warning(f"The '{backend}' backend runs on the CPU, not {device}")
+        device, dtype = torch.device("cpu"), None
+    export_dir = Path(export_dir) if export_dir is not None else ONNX_EXPORT_DIR
+
+    def loader() -> Tuple[Any, Any]:
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        if backend == "onnx":
+            return tokenizer, _load_onnx_classifier(name, export_dir)
+
+        kwargs = {"torch_dtype": dtype} if dtype is not None else {}
+        model = AutoModelForSequenceClassification.from_pretrained(name, **kwargs)
+        model.to(device)
+        model.eval()
+        if backend == "int8":
+            import torch
+
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return tokenizer, model
+
+    key = ("sequence-classifier", name, str(device), dtype, backend)
+    return MODEL_REGISTRY.get(key, loader)
+
+
+def load_span_marker(name: str, device: Any) -> Any:
+    """Get a SpanMarker entity recognition model from the registry."""
+    from span_marker import SpanMarkerModel
+
+    def loader() -> Any:
+        model = SpanMarkerModel.from_pretrained(name)
+        model.to(device)
+        return model
+
+    key = ("span-marker", name, str(device), None)
+    return MODEL_REGISTRY.get(key, loader)
+
+
+def load_sentence_transformer(name: str) -> SentenceTransformer:
+    """Get a SentenceTransformer model from the registry."""
+    key = ("sentence-transformer", name, None, None)
+    return MODEL_REGISTRY.get(key, lambda: SentenceTransformer(name))
+
+
+# BATCHED INFERENCE #
+
+
+def length_bucketed_batches(
+    lengths: Sequence[int], batch_size: int
+) -> List[np.ndarray]:
+    """
+    Group positions into batches of texts with similar token lengths.
+
+    Sorting by length before batching keeps the padding in each batch to a minimum.
+
+    Args:
+        lengths (Sequence[int]): Token length of each text.
+        batch_size (int): Maximum number of texts per batch.
+
+    Returns:
+        List[np.ndarray]: Arrays of positions (into `lengths`), one per batch.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def classify_batched(
+    model: Any,
+    tokenizer: Any,
+    texts: List[str],
+    device: Any,
+    batch_size: int = 32,
+    max_length: int = 512,
+    stride: Optional[int] = None,
+    aggregate: str = "mean",
+    activation: Optional[str] = "softmax",
+    desc: str = "Classifying",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Run a sequence classification model over texts in length-bucketed batches.
+
+    Texts are tokenised once (see `tokenize_windows`), sorted into length buckets,
+    padded per batch, and run under `torch.inference_mode()`. If a batch fails, its
+    windows are retried one at a time so a single bad text does not sink the whole
+    batch. When texts are split into windows, window scores are aggregated back to
+    one row per text (see `aggregate_windows`).
+
+    Args:
+        model (Any): A transformers sequence classification model.
+        tokenizer (Any): The tokenizer that matches `model`.
+        texts (List[str]): Texts to classify.
+        device (Any): Torch device the model lives on.
+        batch_size (int): Number of windows per forward pass. Defaults to 32.
+        max_length (int): Maximum number of tokens per window. Defaults to 512.
+        stride (Optional[int]): Overlapping tokens between windows of long texts.
+            Defaults to None, which truncates texts at `max_length` tokens.
+        aggregate (str): How to combine window scores, "mean" or "max".
+            Defaults to "mean".
+        activation (Optional[str]): "softmax", "sigmoid", or None for raw logits.
+            Defaults to "softmax".
+        desc (str): Progress bar description. Defaults to "Classifying".
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Score matrix (one row per text,
+            in input order), a boolean mask of the texts that were classified, and
+            the number of characters of each text that the model saw.
+    """
+    import torch
+
+    input_ids, doc_index, char_ends = tokenize_windows(
+        tokenizer, texts, max_length=max_length, stride=stride
+    )
+    logits = np.full((len(input_ids), model.config.num_labels), np.nan, np.float32)
+    window_ok = np.zeros(len(input_ids), dtype=bool)
+
+    def forward(positions: np.ndarray) -> None:
+        features = tokenizer.pad(
+            {"input_ids": [input_ids[p] for p in positions]}, return_tensors="pt"
+        ).to(device)
+        output = model(**features).logits
+        logits[positions] = output.float().cpu().numpy()
+        window_ok[positions] = True
+
+    with torch.inference_mode(), tqdm(total=len(input_ids), desc=desc) as progress:
+        for batch in length_bucketed_batches([len(i) for i in input_ids], batch_size):
+            try:
+                forward(batch)
+            except Exception as e:
+                logging.warning(f"Batch failed ({e}); retrying texts one at a time")
+                for position in batch:
+                    try:
+                        forward(np.array([position]))
+                    except Exception as e:
+                        text = texts[doc_index[position]]
+                        logging.error(f"Exception for text '{text}': {e}")
+            progress.update(len(batch))
+
+    # a text only counts as classified if every one of its windows was
+    ok = np.ones(len(texts), dtype=bool)
+    ok[doc_index[~window_ok]] = False
+    keep = ok[doc_index]
+    scores = aggregate_windows(
+        _activate(logits[keep], activation), doc_index[keep], len(texts), aggregate
+    )
+    return scores, ok, char_ends
+
+
+def benchmark_backends(
+    model: str,
+    texts: List[str],
+    backends: Sequence[str] = BACKENDS,
+    batch_size: int = 32,
+    max_length: int = 512,
+    activation: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Compare the throughput of CPU inference backends and their agreement with fp32.
+
+    Every backend classifies the same texts after a one-batch warm-up. The fp32
+    "torch" backend is always run first and its scores are the reference for the
+    others. Backends whose optional dependencies are missing are skipped.
+
+    Args:
+        model (str): Model name on the Hugging Face hub (or a local path).
+        texts (List[str]): A representative sample of texts to classify.
+        backends (Sequence[str]): Backends to compare. Defaults to BACKENDS.
+        batch_size (int): Number of windows per forward pass. Defaults to 32.
+        max_length (int): Maximum number of tokens per window. Defaults to 512.
+        activation (Optional[str]): Activation applied to the logits. Defaults to
+            None, which uses `default_activation` for the model.
+
+    Returns:
+        pd.DataFrame: One row per backend with the time taken, texts per second,
+            the share of texts whose top label matches fp32, and the mean and
+            maximum absolute difference from the fp32 scores.
+    """
+    import torch
+
+    device = torch.device("cpu")
+    reference = None
+    rows = []
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        try:
+            tokenizer, clf = load_sequence_classifier(model, device, backend=backend)
+        except ImportError as e:
+            logging.warning(f"Skipping the '{backend}' backend: {e}")
+            continue
+        settings = dict(
+            device=device,
+            batch_size=batch_size,
+            max_length=max_length,
+            activation=activation or default_activation(clf.config),
+            desc=f"Benchmarking {backend}",
+        )
+
+        classify_batched(clf, tokenizer, texts[:batch_size], **settings)
+        start = time.perf_counter()
+        scores, ok, _ = classify_batched(clf, tokenizer, texts, **settings)
+        seconds = time.perf_counter() - start
+
+        if reference is None:
+            reference = scores, ok
+        both = ok & reference[1]
+        diff = np.abs(scores[both] - reference[0][both])
+        rows.append(
+            {
+                "backend": backend,
+                "seconds": seconds,
+                "texts_per_second": len(texts) / seconds,
+                "top_label_agreement": np.mean(
+                    scores[both].argmax(axis=1) == reference[0][both].argmax(axis=1)
+                ),
+                "mean_abs_diff": diff.mean() if diff.size else np.nan,
+                "max_abs_diff": diff.max() if diff.size else np.nan,
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+# SHARDED EXECUTION #
+
+
+def _pin_torch_threads(threads: int) -> None:
+    import torch
+
+    # torch has already started its OpenMP/MKL runtimes by now, so their
+    # environment variables would be ignored; set_num_threads reaches both
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def run_sharded(
+    labeller: Callable[..., pd.DataFrame],
+    df: pd.DataFrame,
+    n_processes: int,
+    threads_per_process: Optional[int] = None,
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """
+    Split a DataFrame into shards and label each one in its own worker process.
+
+    Each worker loads its own copy of the model and runs with a pinned number of
+    torch threads, so `n_processes * threads_per_process` should roughly match the
+    number of physical cores. Shards are contiguous and results are concatenated in
+    shard order, so the output keeps the order of the input.
+
+    Args:
+        labeller (Callable[..., pd.DataFrame]): Module-level labelling function that
+            takes a `df` keyword argument (e.g., `label_sentiment`).
+        df (pd.DataFrame): DataFrame containing text data.
+        n_processes (int): Number of worker processes (and shards).
+        threads_per_process (Optional[int]): Torch intra-op threads per worker.
+            Defaults to the number of CPUs divided by `n_processes`.
+        **kwargs (Any): Passed through to `labeller`.
+
+    Returns:
+        pd.DataFrame: The concatenated results from every shard.
+    """
+    if threads_per_process is None:
+        threads_per_process = max(1, (os.cpu_count() or 1) // n_processes)
+
+    positions = np.array_split(np.arange(len(df)), n_processes)
+    shards = [df.iloc[p] for p in positions if len(p) > 0]
+    if not shards:
+        return labeller(df=df, **kwargs)
+
+    logging.info(
+        f"Labelling {len(df):,} rows in {len(shards)} shards "
+        f"with {threads_per_process} threads each"
+    )
+    with ProcessPoolExecutor(
+        max_workers=len(shards),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_pin_torch_threads,
+        initargs=(threads_per_process,),
+    ) as pool:
+        futures = [pool.submit(labeller, df=shard, **kwargs) for shard in shards]
+        results = [future.result() for future in futures]
+
+    return pd.concat(results, ignore_index=True)
+
+
+# INFERENCE CACHE #
+
+
+def hash_text(text: str) -> str:
+    """Return the SHA-256 hex digest of a text, used as its content address."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def model_identity(model: Any) -> Tuple[str, str]:
+    """
+    Get the (name, revision) pair that identifies a loaded transformers model.
+
+    Args:
+        model (Any): A transformers or SpanMarker model with a `config` attribute.
+
+    Returns:
+        Tuple[str, str]: Model name and hub commit hash ("local" if unknown).
+    """
+    config = getattr(model, "config", None)
+    name = getattr(config, "_name_or_path", None) or type(model).__name__
+    revision = getattr(config, "_commit_hash", None) or "local"
+    return name, revision
+
+
+class InferenceCache:
+    """
+    Persistent SQLite cache of model outputs keyed by (model, revision, text hash).
+
+    Payloads are stored as JSON, so any labeller whose per-text output is
+    JSON-serialisable can share the same file. When the cache holds more than
+    `max_entries` rows, the least recently used rows are evicted. The table is
+    counted once per connection and the count is kept up to date from the number of
+    rows each write inserts, so eviction does not rescan the table after every
+    batch. The connection is opened lazily and dropped on pickling, so a cache can
+    be handed to worker processes (see `run_sharded`).
+    """
+
+    def __init__(
+        self, path: Union[str, Path], max_entries: Optional[int] = 5_000_000
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._n_rows: Optional[int] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_n_rows"] = None
+        return state
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS inference ("
+                "model TEXT, revision TEXT, text_hash TEXT, payload TEXT, "
+                "accessed_at REAL, PRIMARY KEY (model, revision, text_hash))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS inference_accessed_at "
+                "ON inference (accessed_at)"
+            )
+        return self._conn
+
+    def get_many(self, model: str, revision: str, texts: List[str]) -> Dict[str, Any]:
+        """
+        Look up cached payloads for a list of texts.
+
+        Args:
+            model (str): Model name.
+            revision (str): Model revision.
+            texts (List[str]): Texts to look up.
+
+        Returns:
+            Dict[str, Any]: Payloads keyed by text hash, for the texts that were found.
+        """
+        text_hashes = [hash_text(td) for td in texts]
+        hashes = list(dict.fromkeys(text_hashes))
+        found: Dict[str, Any] = {}
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i : i + 500]
+            rows = self.conn.execute(
+                "SELECT text_hash, payload FROM inference "
+                "WHERE model = ? AND revision = ? "
+                f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                [model, revision, *chunk],
+            ).fetchall()
+            found.update((h, json.loads(payload)) for h, payload in rows)
+
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE inference SET accessed_at = ? "
+                "WHERE model = ? AND revision = ? AND text_hash = ?",
+                [(now, model, revision, h) for h in found],
+            )
+
+        n_found = sum(h in found for h in text_hashes)
+        self.hits += n_found
+        self.misses += len(text_hashes) - n_found
+        return found
+
+    def put_many(
+        self, model: str, revision: str, texts: List[str], payloads: List[Any]
+    ) -> None:
+        """
+        Store payloads for a list of texts, evicting old rows if the cache is full.
+
+        Args:
+            model (str): Model name.
+            revision (str): Model revision.
+            texts (List[str]): Texts that were labelled.
+            payloads (List[Any]): JSON-serialisable model output for each text.
+        """
+        now = time.time()
+        rows = [
+            (model, revision, hash_text(td), json.dumps(payload, default=float), now)
+            for td, payload in zip(texts, payloads)
+        ]
+        if self._n_rows is None:
+            self._n_rows = self.count()
+        with self.conn:
+            inserted = self.conn.executemany(
+                "INSERT OR IGNORE INTO inference VALUES (?, ?, ?, ?, ?)", rows
+            ).rowcount
+            if inserted < len(rows):
+                # some texts were already cached; refresh them in place
+                self.conn.executemany(
+                    "UPDATE inference SET payload = ?, accessed_at = ? "
+                    "WHERE model = ? AND revision = ? AND text_hash = ?",
+                    [(p, t, m, r, h) for m, r, h, p, t in rows],
+                )
+        self._n_rows += inserted
+        self.evict()
+
+    def count(self) -> int:
+        """Count the rows in the cache."""
+        (n,) = self.conn.execute("SELECT COUNT(*) FROM inference").fetchone()
+        return n
+
+    def evict(self) -> None:
+        """Delete the least recently used rows beyond `max_entries`."""
+        if self.max_entries is None:
+            return
+        if self._n_rows is None:
+            self._n_rows = self.count()
+        if self._n_rows <= self.max_entries:
+            return
+        # other processes may share the file, so recount before deleting
+        n = self.count()
+        if n > self.max_entries:
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM inference WHERE rowid IN (SELECT rowid FROM "
+                    "inference ORDER BY accessed_at LIMIT ?)",
+                    (n - self.max_entries,),
+                )
+            logging.info(f"Evicted {n - self.max_entries:,} rows from {self.path}")
+        self._n_rows = min(n, self.max_entries)
+
+    def log_stats(self) -> None:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        logging.info(
+            f"Inference cache {self.path}: {self.hits:,} hits, "
+            f"{self.misses:,} misses ({rate:.1%} hit rate)"
+        )
+
+
+def classify_cached(
+    model: Any,
+    tokenizer: Any,
+    texts: List[str],
+    device: Any,
+    cache: Optional[InferenceCache] = None,
+    batch_size: int = 32,
+    max_length: int = 512,
+    stride: Optional[int] = None,
+    aggregate: str = "mean",
+    activation: Optional[str] = "softmax",
+    desc: str = "Classifying",
+    backend: str = "torch",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Like `classify_batched`, but only texts missing from `cache` hit the model.
+
+    The settings that change the scores (`max_length`, `stride`, `aggregate`,
+    `activation` and the inference backend) are part of the cache key.
+
+    Args:
+        model (Any): A transformers sequence classification model.
+        tokenizer (Any): The tokenizer that matches `model`.
+        texts (List[str]): Texts to classify.
+        device (Any): Torch device the model lives on.
+        cache (Optional[InferenceCache]): Cache of scores. Defaults to None.
+        batch_size (int): Number of windows per forward pass. Defaults to 32.
+        max_length (int): Maximum number of tokens per window. Defaults to 512.
+        stride (Optional[int]): Overlapping tokens between windows of long texts.
+            Defaults to None, which truncates texts at `max_length` tokens.
+        aggregate (str): How to combine window scores, "mean" or "max".
+            Defaults to "mean".
+        activation (Optional[str]): "softmax", "sigmoid", or None for raw logits.
+            Defaults to "softmax".
+        desc (str): Progress bar description. Defaults to "Classifying".
+        backend (str): The backend `model` was loaded with (see
+            `load_sequence_classifier`). Defaults to "torch".
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Score matrix, a mask of
+            classified rows, and the number of characters of each text the model saw.
+    """
+    settings = dict(
+        max_length=max_length, stride=stride, aggregate=aggregate, activation=activation
+    )
+    if cache is None:
+        return classify_batched(
+            model,
+            tokenizer,
+            texts,
+            device=device,
+            batch_size=batch_size,
+            desc=desc,
+            **settings,
+        )
+
+    name, revision = model_identity(model)
+    if backend != "torch":
+        name = f"{name}:{backend}"
+    name = f"{name}:{json.dumps(settings, sort_keys=True)}"
+    found = cache.get_many(name, revision, texts)
+    hashes = [hash_text(td) for td in texts]
+    missing = [i for i, h in enumerate(hashes) if h not in found]
+
+    scores = np.full((len(texts), model.config.num_labels), np.nan, dtype=np.float32)
+    ok = np.zeros(len(texts), dtype=bool)
+    char_ends = np.zeros(len(texts), dtype=int)
+    for i, h in enumerate(hashes):
+        if h in found:
+            scores[i] = found[h]["scores"]
+            char_ends[i] = found[h]["chars"]
+            ok[i] = True
+
+    if missing:
+        new_scores, new_ok, new_char_ends = classify_batched(
+            model,
+            tokenizer,
+            [texts[i] for i in missing],
+            device=device,
+            batch_size=batch_size,
+            desc=desc,
+            **settings,
+        )
+        scores[missing] = new_scores
+        ok[missing] = new_ok
+        char_ends[missing] = new_char_ends
+        cache.put_many(
+            name,
+            revision,
+            [texts[i] for i, keep in zip(missing, new_ok) if keep],
+            [
+                {"scores": row.tolist(), "chars": int(chars)}
+                for row, chars in zip(new_scores[new_ok], new_char_ends[new_ok])
+            ],
+        )
+
+    cache.log_stats()
+    return scores, ok, char_ends
+
+
+# STREAMING #
+
+
+def _write_checkpoint(path: Path, checkpoint: Dict[str, Any]) -> None:
+    """Write a checkpoint atomically so a crash never leaves a half-written file."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, default=str)
+    os.replace(tmp, path)
+
+
+def label_csv_in_chunks(
+    labeller: Callable[..., Optional[pd.DataFrame]],
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    idcol: str,
+    chunksize: int = 10_000,
+    carry_cols: Optional[List[str]] = None,
+    checkpoint_path: Optional[Union[str, Path]] = None,
+    read_csv_kwargs: Optional[Dict[str, Any]] = None,
+    **kwargs: Any,
+) -> int:
+    """
+    Label a CSV file chunk by chunk, appending results to an output CSV as they finish.
+
+    Only one chunk of the input is held in memory at a time. After each chunk is
+    written, a JSON checkpoint records the number of input rows consumed, the last
+    id processed, the size of the output file and the columns of its header. Every
+    chunk is written in the header's column order, with columns the labeller did
+    not return for that chunk left empty. If the run is interrupted, calling
+    the function again with the same arguments truncates the output back to the last
+    checkpoint and resumes with the next unprocessed row. The checkpoint is tied to
+    the size and modification time of the input file; if the input changes, the run
+    starts over. The checkpoint is removed once the whole file has been labelled.
+
+    Args:
+        labeller (Callable[..., Optional[pd.DataFrame]]): A labelling function such as
+            label_sentiment, label_emotion_concepts, detect_language or
+            label_entities. It is called as labeller(df=chunk, idcol=idcol, **kwargs).
+        input_path (Union[str, Path]): Path to the input CSV file.
+        output_path (Union[str, Path]): Path to the output CSV file.
+        idcol (str): Name of the id column in the input file.
+        chunksize (int): Number of input rows labelled at a time. Defaults to 10_000.
+        carry_cols (Optional[List[str]]): Input columns (e.g. "channel") to join onto
+            the labelled output by idcol. Defaults to None.
+        checkpoint_path (Optional[Union[str, Path]]): Where to keep the checkpoint.
+            Defaults to the output path with ".checkpoint.json" appended.
+        read_csv_kwargs (Optional[Dict[str, Any]]): Extra arguments for pd.read_csv.
+        **kwargs: Further arguments passed on to the labeller (model, textcol, ...).
+
+    Returns:
+        int: The number of labelled rows in the output file.
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    if checkpoint_path is None:
+        checkpoint_path = output_path.with_name(output_path.name + ".checkpoint.json")
+    checkpoint_path = Path(checkpoint_path)
+
+    stat = input_path.stat()
+    source = {"path": str(input_path), "size": stat.st_size, "mtime": stat.st_mtime}
+    checkpoint: Dict[str, Any] = {
+        "source": source,
+        "rows_read": 0,
+        "last_id": None,
+        "output_bytes": 0,
+        "rows_written": 0,
+        "columns": None,
+    }
+
+    if checkpoint_path.exists():
+        with open(checkpoint_path) as f:
+            saved = json.load(f)
+        if saved.get("source") == source:
+            checkpoint = saved
+            logging.info(
+                f"Resuming {input_path} after {checkpoint['rows_read']} rows "
+                f"(last id: {checkpoint['last_id']})"
+            )
+        else:
+            logging.warning(
+                f"{input_path} changed since the last checkpoint; restarting"
+            )
+
+    # drop anything written after the last checkpoint (or everything on a fresh run)
+    if output_path.exists():
+        with open(output_path, "r+b") as f:
+            f.truncate(checkpoint["output_bytes"])
+        if checkpoint["output_bytes"] and not checkpoint.get("columns"):
+            checkpoint["columns"] = list(pd.read_csv(output_path, nrows=0).columns)
+
+    rows_seen = 0
+    reader = pd.read_csv(input_path, chunksize=chunksize, **(read_csv_kwargs or {}))
+    for chunk in tqdm(reader, desc="Chunks", unit="chunk"):
+        start = rows_seen
+        rows_seen += len(chunk)
+        if rows_seen <= checkpoint["rows_read"]:
+            continue
+        if start < checkpoint["rows_read"]:
+            # chunksize changed between runs; skip the rows already labelled
+            chunk = chunk.iloc[checkpoint["rows_read"] - start :]
+
+        result = labeller(df=chunk, idcol=idcol, **kwargs)
+        if result is not None and not result.empty:
+            if carry_cols:
+                carried = chunk[[idcol] + carry_cols].drop_duplicates(subset=idcol)
+                result = result.merge(carried, on=idcol, how="left")
+            # every chunk is written in the column order of the header
+            if checkpoint["columns"] is None:
+                checkpoint["columns"] = list(result.columns)
+            else:
+                extra = result.columns.difference(checkpoint["columns"])
+                if len(extra):
+                    logging.warning(
+                        f"Dropping columns missing from the header: {extra}"
+                    )
+                result = result.reindex(columns=checkpoint["columns"])
+            result.to_csv(
+                output_path,
+                mode="a",
+                header=checkpoint["output_bytes"] == 0,
+                index=False,
+            )
+            checkpoint["rows_written"] += len(result)
+
+        checkpoint["rows_read"] = rows_seen
+        checkpoint["last_id"] = chunk[idcol].iloc[-1]
+        if output_path.exists():
+            checkpoint["output_bytes"] = output_path.stat().st_size
+        _write_checkpoint(checkpoint_path, checkpoint)
+
+    checkpoint_path.unlink(missing_ok=True)
+    logging.info(
+        f"Labelled {checkpoint['rows_read']} rows from {input_path} "
+        f"into {checkpoint['rows_written']} rows in {output_path}"
+    )
+    return checkpoint["rows_written"]
+
+
+# EMBEDDING STORE #
+
+
+class EmbeddingStore:
+    """
+    Reusable on-disk store of sentence embeddings for a single model.
+
+    Embeddings live in a memory-mapped `.npy` matrix (one row per unique text)
+    alongside an index of text hashes, one per line, in row order. New texts are
+    appended in place by growing the matrix along its first axis, so adding a few
+    new videos or comments never rewrites the rows that are already stored.
+    """
+
+    def __init__(
+        self, directory: Union[str, Path], model: str, dtype: str = "float16"
+    ) -> None:
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.directory = Path(directory) / model.replace("/", "__")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.matrix_path = self.directory / "embeddings.npy"
+        self.index_path = self.directory / "index.txt"
+
+        self.rows: Dict[str, int] = {}
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                self.rows = {h: i for i, h in enumerate(f.read().split())}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Read-only memory map of the stored embeddings, in index order."""
+        matrix = np.load(self.matrix_path, mmap_mode="r")
+        # rows past the index belong to an append that did not finish
+        return matrix[: len(self.rows)]
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get stored embeddings for a list of texts.
+
+        Args:
+            texts (List[str]): Texts to look up.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The stored row positions (-1 if missing)
+                and a boolean mask of the texts that were found.
+        """
+        positions = np.array(
+            [self.rows.get(hash_text(td), -1) for td in texts], dtype=np.int64
+        )
+        return positions, positions >= 0
+
+    def append(self, texts: List[str], embeddings: np.ndarray) -> None:
+        """
+        Append embeddings for texts that are not already in the store.
+
+        Args:
+            texts (List[str]): Texts that were encoded.
+            embeddings (np.ndarray): One embedding row per text.
+        """
+        new: Dict[str, int] = {}
+        for i, td in enumerate(texts):
+            h = hash_text(td)
+            if h not in self.rows and h not in new:
+                new[h] = i
+        if not new:
+            return
+
+        rows = np.ascontiguousarray(embeddings[list(new.values())], dtype=self.dtype)
+        if not self.matrix_path.exists():
+            np.save(self.matrix_path, rows)
+        else:
+            with open(self.matrix_path, "r+b") as f:
+                if np.lib.format.read_magic(f) != (1, 0):
+                    raise RuntimeError(f"Unexpected .npy version in {self.matrix_path}")
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                header_length = f.tell()
+                if shape[1] != rows.shape[1] or dtype != rows.dtype:
+                    raise ValueError(
+                        f"Cannot append {rows.dtype} rows of width {rows.shape[1]} "
+                        f"to {dtype} embeddings of width {shape[1]}"
+                    )
+                if shape[0] != len(self.rows):
+                    # drop rows left behind by an append that did not finish
+                    f.truncate(header_length + len(self.rows) * rows[0].nbytes)
+                f.seek(0, os.SEEK_END)
+                f.write(rows.tobytes())
+                # np.save pads the header so the first axis can grow in place
+                f.seek(0)
+                np.lib.format.write_array_header_1_0(
+                    f,
+                    {
+                        "descr": np.lib.format.dtype_to_descr(dtype),
+                        "fortran_order": fortran_order,
+                        "shape": (len(self.rows) + len(rows), shape[1]),
+                    },
+                )
+                if f.tell() != header_length:
+                    raise RuntimeError(f"Could not grow {self.matrix_path} in place")
+
+        with open(self.index_path, "a") as f:
+            f.writelines(f"{h}\n" for h in new)
+        start = len(self.rows)
+        self.rows.update((h, start + i) for i, h in enumerate(new))
+        logging.info(f"Added {len(new):,} embeddings to {self.directory}")
+
+    def encode(
+        self, texts: List[str], encoder: Any, batch_size: int = 32
+    ) -> np.ndarray:
+        """
+        Get embeddings for texts, encoding and storing only the ones not seen before.
+
+        Args:
+            texts (List[str]): Texts to embed.
+            encoder (Any): SentenceTransformer model that matches `self.model`.
+            batch_size (int): Batch size passed to `encoder.encode`. Defaults to 32.
+
+        Returns:
+            np.ndarray: float32 embedding matrix with one row per text, in order.
+        """
+        if not texts:
+            # an empty store has no matrix to read the width from yet
+            width = (
+                self.embeddings.shape[1]
+                if self.matrix_path.exists()
+                else encoder.get_sentence_embedding_dimension()
+            )
+            return np.empty((0, width), dtype=np.float32)
+
+        _, found = self.lookup(texts)
+        missing = list(dict.fromkeys(td for td, hit in zip(texts, found) if not hit))
+        logging.info(
+            f"Embedding store {self.directory}: {found.sum():,} stored, "
+            f"{len(missing):,} to encode"
+        )
+        if missing:
+            self.append(
+                missing,
+                encoder.encode(missing, batch_size=batch_size, show_progress_bar=True),
+            )
+        positions, _ = self.lookup(texts)
+        return np.asarray(self.embeddings[positions], dtype=np.float32)
 
 
 def label_topics(
@@ -81,10 +1210,16 @@ def label_topics(
     ngram_upper_limit: int = 2,
     top_n_words: int = 10,
     spacy_model: str = "en_core_web_sm",
+    embeddings: Optional[np.ndarray] = None,
+    embedding_store: Optional[EmbeddingStore] = None,
 ) -> Tuple[pd.DataFrame, pd.DataFrame, BERTopic]:
     """
     Label topics in the DataFrame using BERTopic.
 
+    Document embeddings are the expensive part. Pass precomputed `embeddings`
+    (one row per row of `df`), or an `embedding_store` so that only texts it has
+    not seen before are encoded.
+
     Args:
         df (pd.DataFrame): DataFrame containing text data.
         textcol (str): Column name containing text data.
@@ -103,14 +1238,28 @@ def label_topics(
         ngram_upper_limit (int): Upper limit for ngram range. Defaults to 2.
         top_n_words (int): Number of top words for topic representation. Defaults to 10.
         spacy_model (str): SpaCy model name. Defaults to "en_core_web_sm".
+        embeddings (Optional[np.ndarray]): Precomputed document embeddings.
+            Defaults to None.
+        embedding_store (Optional[EmbeddingStore]): Store of embeddings for `model`.
+            Defaults to None.
 
     Returns:
         Tuple[pd.DataFrame, pd.DataFrame, BERTopic]: DataFrame with topics, topic
             information, and BERTopic model.
     """
     df = df.reset_index(drop=True)
-    sent_embeddings = SentenceTransformer(model)
-    embeddings = sent_embeddings.encode(df[textcol], show_progress_bar=True)
+    sent_embeddings = load_sentence_transformer(model)
+    if embeddings is not None:
+        if len(embeddings) != len(df):
+            raise ValueError("embeddings must have one row per row of df")
+    elif embedding_store is not None:
+        if embedding_store.model != model:
+            raise ValueError(
+                f"embedding_store holds '{embedding_store.model}', not '{model}'"
+            )
+        embeddings = embedding_store.encode(df[textcol].tolist(), sent_embeddings)
+    else:
+        embeddings = sent_embeddings.encode(df[textcol], show_progress_bar=True)
     umap_model = UMAP(
         n_neighbors=umap_n_neighbors,
         n_components=umap_n_components,
@@ -155,55 +1304,106 @@ def label_topics(
     return df, topic_info, topic_model
 
 
+ENTITY_FIELDS = ("span", "label", "score", "char_start_index", "char_end_index")
+
+
 def label_entities(
     model: Any,
     df: pd.DataFrame,
     idcol: str,
     textcol: str,
     drop_invalid_text: bool = True,
+    cache: Optional[InferenceCache] = None,
+    set_torch_device: bool = True,
+    batch_size: int = 32,
 ) -> Optional[pd.DataFrame]:
     """
     Label entities in the DataFrame using the provided model.
 
+    Texts are passed to `model.predict` in batches of similar length. If a batch
+    fails, its texts are retried one at a time so a single bad text is skipped.
+
     Args:
-        model (Any): Entity recognition model.
+        model (Any): Entity recognition model, or the name of a SpanMarker model to
+            load from the model registry.
         df (pd.DataFrame): DataFrame containing text data.
         idcol (str): Column name for IDs.
         textcol (str): Column name for text data.
         drop_invalid_text (bool): Whether to drop rows with invalid text.
             Defaults to True.
+        cache (Optional[InferenceCache]): Cache of predicted entities; only texts
+            missing from it are passed to the model. Defaults to None.
+        set_torch_device (bool): Whether to set the torch device when loading a
+            model by name. Defaults to True.
+        batch_size (int): Number of texts per call to `model.predict`.
+            Defaults to 32.
 
     Returns:
         Optional[pd.DataFrame]: DataFrame with labeled entities, or None if no valid
             entities are found.
     """
+    if isinstance(model, str):
+        model = load_span_marker(model, _resolve_device(set_torch_device))
+
     if drop_invalid_text:
         df = df.dropna(subset=[textcol])
         df = df[df[textcol].apply(lambda x: isinstance(x, str) and len(x) > 0)]
 
-    ids = df[idcol]
-    text = df[textcol]
-
-    ents: List[pd.DataFrame] = []
-    for i, td in tqdm(zip(ids, text), total=len(ids), desc="Labelling entities"):
-        try:
-            entities = model.predict(td)
-            if entities:
-                entdf = pd.DataFrame(entities)
-                entdf[textcol] = td
-                entdf[idcol] = i
-                ents.append(entdf)
-        except RuntimeWarning as rw:
-            if "All-NaN slice encountered" in str(rw):
-                logging.warning(f"Skipping NaN slice at ID {i}")
-            else:
-                logging.error(f"Runtime warning for ID {i}: {rw}")
-        except Exception as e:
-            logging.error(f"Exception for ID {i}: {e}")
+    ids = df[idcol].tolist()
+    texts = df[textcol].tolist()
 
-    if ents:
-        entdf_concat = pd.concat(ents)
-        return entdf_concat
+    name, revision = model_identity(model)
+    found = cache.get_many(name, revision, texts) if cache is not None else {}
+    hashes = [hash_text(td) for td in texts]
+    entities: List[Optional[List[Dict[str, Any]]]] = [found.get(h) for h in hashes]
+    missing = [p for p, ents in enumerate(entities) if ents is None]
+
+    def predict(positions: np.ndarray) -> None:
+        batch = model.predict([texts[p] for p in positions], batch_size=batch_size)
+        for p, ents in zip(positions, batch):
+            entities[p] = ents
+
+    lengths = [len(texts[p]) for p in missing]
+    with tqdm(total=len(missing), desc="Labelling entities") as progress:
+        for batch in length_bucketed_batches(lengths, batch_size):
+            positions = np.asarray(missing)[batch]
+            try:
+                predict(positions)
+            except Exception:
+                for p in positions:
+                    try:
+                        predict(np.array([p]))
+                    except RuntimeWarning as rw:
+                        if "All-NaN slice encountered" in str(rw):
+                            logging.warning(f"Skipping NaN slice at ID {ids[p]}")
+                        else:
+                            logging.error(f"Runtime warning for ID {ids[p]}: {rw}")
+                    except Exception as e:
+                        logging.error(f"Exception for ID {ids[p]}: {e}")
+            progress.update(len(positions))
+
+    if cache is not None:
+        labelled = [p for p in missing if entities[p] is not None]
+        cache.put_many(
+            name,
+            revision,
+            [texts[p] for p in labelled],
+            [entities[p] for p in labelled],
+        )
+        cache.log_stats()
+
+    # flat columnar lists, assembled into a single DataFrame at the end
+    columns: Dict[str, List[Any]] = {field: [] for field in ENTITY_FIELDS}
+    columns[textcol], columns[idcol] = [], []
+    for i, td, ents in zip(ids, texts, entities):
+        for ent in ents or []:
+            for field in ENTITY_FIELDS:
+                columns[field].append(ent.get(field))
+            columns[textcol].append(td)
+            columns[idcol].append(i)
+
+    if columns[idcol]:
+        return pd.DataFrame(columns)
     else:
         logging.info("No valid entities found")
         return None
@@ -216,10 +1416,23 @@ def label_sentiment(
     idcol: str,
     set_torch_device: bool = True,
     drop_invalid_text: bool = True,
+    batch_size: int = 32,
+    n_processes: int = 1,
+    threads_per_process: Optional[int] = None,
+    cache: Optional[InferenceCache] = None,
+    dtype: Optional[str] = None,
+    max_length: int = 512,
+    stride: Optional[int] = None,
+    aggregate: str = "mean",
+    backend: str = "torch",
 ) -> pd.DataFrame:
     """
     Label sentiment in the DataFrame using the specified model.
 
+    Texts are scored in length-bucketed batches (see `classify_batched`). Set
+    `n_processes` above 1 to shard the DataFrame across worker processes (see
+    `run_sharded`). The returned text is the part of each text the model saw.
+
     Args:
         model (str): Model name for sentiment analysis.
         df (pd.DataFrame): DataFrame containing text data.
@@ -228,52 +1441,79 @@ def label_sentiment(
         set_torch_device (bool): Whether to set the torch device. Defaults to True.
         drop_invalid_text (bool): Whether to drop rows with invalid text.
             Defaults to True.
+        batch_size (int): Number of texts per forward pass. Defaults to 32.
+        n_processes (int): Number of worker processes. Defaults to 1.
+        threads_per_process (Optional[int]): Torch threads per worker process.
+            Defaults to the number of CPUs divided by `n_processes`.
+        cache (Optional[InferenceCache]): Cache of model outputs; only texts
+            missing from it are passed to the model. Defaults to None.
+        dtype (Optional[str]): Torch dtype to load the model weights as.
+            Defaults to None, which keeps the checkpoint's dtype.
+        max_length (int): Maximum number of tokens per window. Defaults to 512.
+        stride (Optional[int]): Overlapping tokens between windows, to split long
+            texts instead of truncating them. Defaults to None.
+        aggregate (str): How to combine window scores, "mean" or "max".
+            Defaults to "mean".
+        backend (str): Inference backend, "torch", "int8" or "onnx" (see
+            `load_sequence_classifier`). Defaults to "torch".
 
     Returns:
         pd.DataFrame: DataFrame with sentiment labels.
     """
-    import torch
-
-    tokenizer = AutoTokenizer.from_pretrained(model, max_len=512)
-    model = AutoModelForSequenceClassification.from_pretrained(model)
+    if n_processes > 1:
+        return run_sharded(
+            label_sentiment,
+            df,
+            n_processes,
+            threads_per_process,
+            model=model,
+            textcol=textcol,
+            idcol=idcol,
+            set_torch_device=set_torch_device,
+            drop_invalid_text=drop_invalid_text,
+            batch_size=batch_size,
+            cache=cache,
+            dtype=dtype,
+            max_length=max_length,
+            stride=stride,
+            aggregate=aggregate,
+            backend=backend,
+        )
 
-    if set_torch_device:
-        device = u.set_torch_device()
-        model.to(device)
-    else:
-        device = torch.device("cpu")
-        model.to(device)
+    device = _resolve_device(set_torch_device, backend)
+    tokenizer, model = load_sequence_classifier(
+        model, device, dtype=dtype, backend=backend
+    )
 
     if drop_invalid_text:
         df = df.dropna(subset=[textcol])
         df = df[df[textcol].apply(lambda x: isinstance(x, str) and len(x) > 0)]
 
-    ids, text = df[idcol], df[textcol]
-    scores: List[Any] = []
-    sentids: List[Any] = []
-    processed_text: List[str] = []
+    ids = df[idcol].tolist()
+    texts = df[textcol].tolist()
 
-    for i, td in tqdm(zip(ids, text), total=len(ids), desc="Labelling Sentiment"):
-        try:
-            truncated_text = truncate_text_to_transformer_limit(td)
-            encoded = tokenizer.encode(truncated_text, return_tensors="pt").to(device)
-            sentsent = model(encoded)
-            sentsent = sentsent[0][0].detach().cpu().numpy()
-            sentsent = softmax(sentsent)
-            scores.append(sentsent)
-            processed_text.append(truncated_text)
-            sentids.append(i)
-        except RuntimeWarning as rw:
-            if "All-NaN slice encountered" in str(rw):
-                logging.warning(f"Skipping NaN slice at ID {i} in {textcol}")
-            else:
-                logging.error(f"Runtime warning for ID {i} in {textcol}: {rw}")
-        except Exception as e:
-            logging.error(f"Exception for ID {i} with text '{td}' in {textcol}: {e}")
+    scores, ok, char_ends = classify_cached(
+        model,
+        tokenizer,
+        texts,
+        device=device,
+        cache=cache,
+        batch_size=batch_size,
+        max_length=max_length,
+        stride=stride,
+        aggregate=aggregate,
+        activation="softmax",
+        desc="Labelling Sentiment",
+        backend=backend,
+    )
+    sentids = [i for i, keep in zip(ids, ok) if keep]
+    processed_text = [
+        td[:chars] for td, chars, keep in zip(texts, char_ends, ok) if keep
+    ]
 
-    if scores:
+    if ok.any():
         df_sentiment = pd.DataFrame(
-            scores,
+            scores[ok],
             columns=["sentiment_negative", "sentiment_neutral", "sentiment_positive"],
         )
         df_sentiment[idcol] = sentids
@@ -300,75 +1540,222 @@ def label_emotion_concepts(
     multilabel: bool = True,
     set_torch_device: bool = True,
     drop_invalid_text: bool = True,
+    n_processes: int = 1,
+    threads_per_process: Optional[int] = None,
+    cache: Optional[InferenceCache] = None,
+    dtype: Optional[str] = None,
+    batch_size: int = 32,
+    max_length: int = 512,
+    stride: Optional[int] = None,
+    aggregate: str = "mean",
+    backend: str = "torch",
 ) -> pd.DataFrame:
     """
     Label emotion concepts in the DataFrame using the specified model.
 
+    Texts are scored in length-bucketed batches (see `classify_batched`), using a
+    sigmoid for multi-label models and a softmax otherwise. Set `n_processes` above
+    1 to shard the DataFrame across worker processes (see `run_sharded`).
+
     Args:
         model (str): Model name for emotion concept classification.
         df (pd.DataFrame): DataFrame containing text data.
         textcol (str): Column name for text data.
         idcol (str): Column name for IDs.
-        multilabel (bool): Whether to use multilabel classification. Defaults to True.
+        multilabel (bool): Whether to return scores for every emotion concept
+            rather than only the top one. If False, the other concepts are NaN;
+            every concept keeps its column either way. Defaults to True.
         set_torch_device (bool): Whether to set the torch device. Defaults to True.
         drop_invalid_text (bool): Whether to drop rows with invalid text.
             Defaults to True.
+        n_processes (int): Number of worker processes. Defaults to 1.
+        threads_per_process (Optional[int]): Torch threads per worker process.
+            Defaults to the number of CPUs divided by `n_processes`.
+        cache (Optional[InferenceCache]): Cache of model outputs; only texts
+            missing from it are passed to the model. Defaults to None.
+        dtype (Optional[str]): Torch dtype to load the model weights as.
+            Defaults to None, which keeps the checkpoint's dtype.
+        batch_size (int): Number of texts per forward pass. Defaults to 32.
+        max_length (int): Maximum number of tokens per window. Defaults to 512.
+        stride (Optional[int]): Overlapping tokens between windows, to split long
+            texts instead of truncating them. Defaults to None.
+        aggregate (str): How to combine window scores, "mean" or "max".
+            Defaults to "mean".
+        backend (str): Inference backend, "torch", "int8" or "onnx" (see
+            `load_sequence_classifier`). Defaults to "torch".
 
     Returns:
         pd.DataFrame: DataFrame with emotion concept labels.
     """
-    import torch
-
-    if set_torch_device:
-        device = u.set_torch_device()
-    else:
-        device = torch.device("cpu")
+    if n_processes > 1:
+        return run_sharded(
+            label_emotion_concepts,
+            df,
+            n_processes,
+            threads_per_process,
+            model=model,
+            textcol=textcol,
+            idcol=idcol,
+            multilabel=multilabel,
+            set_torch_device=set_torch_device,
+            drop_invalid_text=drop_invalid_text,
+            cache=cache,
+            dtype=dtype,
+            batch_size=batch_size,
+            max_length=max_length,
+            stride=stride,
+            aggregate=aggregate,
+            backend=backend,
+        )
 
-    pipe = pipeline(
-        "text-classification",
-        model=model,
-        device=device.index if device.type != "cpu" else -1,
-        top_k=None if multilabel else 1,
+    device = _resolve_device(set_torch_device, backend)
+    tokenizer, model = load_sequence_classifier(
+        model, device, dtype=dtype, backend=backend
     )
 
     if drop_invalid_text:
         df = df.dropna(subset=[textcol])
         df = df[df[textcol].apply(lambda x: isinstance(x, str) and len(x) > 0)]
 
+    ids = df[idcol].to_numpy()
     texts = df[textcol].tolist()
-    ids = df[idcol].tolist()
 
-    emodfs: List[pd.DataFrame] = []
-    for i, td in tqdm(
-        zip(ids, texts), total=len(ids), desc="Labelling Emotion Concepts"
-    ):
-        truncated_text = truncate_text_to_transformer_limit(td)
-        try:
-            emo = pipe(truncated_text)
-            if isinstance(emo, list):
-                if isinstance(emo[0], list):
-                    emo_dict = {
-                        item["label"]: item["score"]
-                        for sublist in emo
-                        for item in sublist
-                    }
-                else:
-                    emo_dict = {item["label"]: item["score"] for item in emo}
-            else:
-                raise ValueError("Unexpected output format from the pipeline.")
+    scores, ok, char_ends = classify_cached(
+        model,
+        tokenizer,
+        texts,
+        device=device,
+        cache=cache,
+        batch_size=batch_size,
+        max_length=max_length,
+        stride=stride,
+        aggregate=aggregate,
+        activation=default_activation(model.config),
+        desc="Labelling Emotion Concepts",
+        backend=backend,
+    )
+    scores = scores[ok]
+    labels = [model.config.id2label[i] for i in range(scores.shape[1])]
+
+    if not multilabel:
+        # keep only the top emotion concept for each text
+        top = scores.argmax(axis=1)
+        scores = np.where(np.arange(scores.shape[1]) == top[:, None], scores, np.nan)
+
+    master_emo = pd.DataFrame(scores, columns=[f"ec_{c}" for c in labels])
+    master_emo[idcol] = ids[ok]
+    master_emo[textcol] = [
+        td[:chars] for td, chars, keep in zip(texts, char_ends, ok) if keep
+    ]
+    return master_emo
 
-            emodf = pd.DataFrame([emo_dict])
-            emodf.columns = [f"ec_{c}" for c in emodf.columns]
-            emodf[idcol] = i
-            emodf[textcol] = truncated_text
 
-            emodfs.append(emodf)
-        except Exception as e:
-            print(f"Error processing ID {i} with text: {td}")
-            print(f"Error: {e}")
+def detect_language(
+    model: str,
+    df: pd.DataFrame,
+    textcol: str,
+    idcol: str,
+    set_torch_device: bool = True,
+    drop_invalid_text: bool = True,
+    batch_size: int = 32,
+    n_processes: int = 1,
+    threads_per_process: Optional[int] = None,
+    cache: Optional[InferenceCache] = None,
+    dtype: Optional[str] = None,
+    max_length: int = 512,
+    stride: Optional[int] = None,
+    aggregate: str = "mean",
+    backend: str = "torch",
+) -> pd.DataFrame:
+    """
+    Predict the language of each text using the specified model.
+
+    Texts are classified in length-bucketed batches (see `classify_batched`). Set
+    `n_processes` above 1 to shard the DataFrame across worker processes (see
+    `run_sharded`).
 
-    master_emo = pd.concat(emodfs, ignore_index=True)
-    return master_emo
+    Args:
+        model (str): Model name for language classification
+            (e.g., "papluca/xlm-roberta-base-language-detection").
+        df (pd.DataFrame): DataFrame containing text data.
+        textcol (str): Column name for text data.
+        idcol (str): Column name for IDs.
+        set_torch_device (bool): Whether to set the torch device. Defaults to True.
+        drop_invalid_text (bool): Whether to drop rows with invalid text.
+            Defaults to True.
+        batch_size (int): Number of texts per forward pass. Defaults to 32.
+        n_processes (int): Number of worker processes. Defaults to 1.
+        threads_per_process (Optional[int]): Torch threads per worker process.
+            Defaults to the number of CPUs divided by `n_processes`.
+        cache (Optional[InferenceCache]): Cache of model outputs; only texts
+            missing from it are passed to the model. Defaults to None.
+        dtype (Optional[str]): Torch dtype to load the model weights as.
+            Defaults to None, which keeps the checkpoint's dtype.
+        max_length (int): Maximum number of tokens per window. Defaults to 512.
+        stride (Optional[int]): Overlapping tokens between windows, to split long
+            texts instead of truncating them. Defaults to None.
+        aggregate (str): How to combine window scores, "mean" or "max".
+            Defaults to "mean".
+        backend (str): Inference backend, "torch", "int8" or "onnx" (see
+            `load_sequence_classifier`). Defaults to "torch".
+
+    Returns:
+        pd.DataFrame: DataFrame with the predicted language and its confidence score.
+    """
+    if n_processes > 1:
+        return run_sharded(
+            detect_language,
+            df,
+            n_processes,
+            threads_per_process,
+            model=model,
+            textcol=textcol,
+            idcol=idcol,
+            set_torch_device=set_torch_device,
+            drop_invalid_text=drop_invalid_text,
+            batch_size=batch_size,
+            cache=cache,
+            dtype=dtype,
+            max_length=max_length,
+            stride=stride,
+            aggregate=aggregate,
+            backend=backend,
+        )
+
+    device = _resolve_device(set_torch_device, backend)
+    tokenizer, model = load_sequence_classifier(
+        model, device, dtype=dtype, backend=backend
+    )
+
+    if drop_invalid_text:
+        df = df.dropna(subset=[textcol])
+        df = df[df[textcol].apply(lambda x: isinstance(x, str) and len(x) > 0)]
+
+    probabilities, ok, _ = classify_cached(
+        model,
+        tokenizer,
+        df[textcol].tolist(),
+        device=device,
+        cache=cache,
+        batch_size=batch_size,
+        max_length=max_length,
+        stride=stride,
+        aggregate=aggregate,
+        activation="softmax",
+        desc="Detecting language",
+        backend=backend,
+    )
+    probabilities = probabilities[ok]
+    labels = np.array([model.config.id2label[i] for i in range(probabilities.shape[1])])
+
+    langdf = pd.DataFrame(
+        {
+            idcol: df[idcol].to_numpy()[ok],
+            "predicted_language": labels[probabilities.argmax(axis=1)],
+            "confidence_score": probabilities.max(axis=1),
+        }
+    )
+    return langdf
 
 
 def preview_topics(text_topic_df: pd.DataFrame, topic_info: pd.DataFrame) -> None:
@@ -1,31 +1,149 @@
 import csv
 import html
+import itertools
+import json
 import logging
+import sqlite3
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
+import httplib2
+import requests
 from googleapiclient.discovery import Resource, build
 from googleapiclient.errors import HttpError
 from tqdm import tqdm
 
+COMMENT_FIELDNAMES = [
+    "video_id",
+    "comment_id",
+    "text",
+    "author",
+    "author_channel_url",
+    "like_count",
+    "published_at",
+    "updated_at",
+]
+
+# default quota of a Data API project, in units per day; most list calls cost 1
+DAILY_QUOTA = 10_000
+QUOTA_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+# partial-response masks, so the API only sends the fields that are parsed
+COMMENT_SNIPPET_FIELDS = (
+    "snippet(textDisplay,authorDisplayName,authorChannelUrl,likeCount,"
+    "publishedAt,updatedAt)"
+)
+COMMENT_FIELDS = f"id,{COMMENT_SNIPPET_FIELDS}"
+COMMENT_THREAD_FIELDS = (
+    "nextPageToken,items(id,snippet(totalReplyCount,"
+    f"topLevelComment({COMMENT_SNIPPET_FIELDS})),replies(comments({COMMENT_FIELDS})))"
+)
+REPLY_FIELDS = f"nextPageToken,items({COMMENT_FIELDS})"
+VIDEO_PARTS = (
+    "snippet,contentDetails,statistics,status,topicDetails,"
+    "recordingDetails,player,liveStreamingDetails"
+)
+VIDEO_FIELDS = f"items(id,{VIDEO_PARTS})"
+
+
+class PooledHttp:
+    """
+    An httplib2.Http stand-in for googleapiclient, built on a requests Session.
+
+    Connections are pooled and kept alive across requests, threads and API keys,
+    and responses are requested gzip-compressed (the Data API also wants "gzip"
+    in the user agent).
+
+    Args:
+        pool_maxsize (int): Connections kept open per host. Defaults to 16.
+        timeout (float): Seconds to wait for a response. Defaults to 60.
+    """
+
+    def __init__(self, pool_maxsize: int = 16, timeout: float = 60) -> None:
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = timeout
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Optional[Union[str, bytes]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        redirections: int = 5,
+        connection_type: Any = None,
+    ) -> Tuple[httplib2.Response, bytes]:
+        headers = dict(headers or {})
+        user_agent = headers.get("user-agent", "icsspy")
+        if "gzip" not in user_agent:
+            headers["user-agent"] = f"{user_agent} (gzip)"
+        headers["accept-encoding"] = "gzip"
+        response = self.session.request(
+            method,
+            uri,
+            data=body,
+            headers=headers,
+            timeout=self.timeout,
+            allow_redirects=redirections > 0,
+        )
+        # requests has already decompressed the content
+        info = {
+            k: v
+            for k, v in response.headers.items()
+            if k.lower() not in ("content-encoding", "content-length")
+        }
+        info["status"] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+
+def _with_key(uri: str, key: str) -> str:
+    parts = urlsplit(uri)
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "key"
+    ]
+    query.append(("key", key))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
 
 class YouTubeAPI:
-    def __init__(self, api_keys: List[str]) -> None:
+    def __init__(self, api_keys: List[str], http: Optional[Any] = None) -> None:
         self.api_keys = api_keys
         self.key_index = 0
+        self.http = http if http is not None else PooledHttp()
         self.service = self.build_service()
 
     def build_service(self) -> Resource:
-        return build(
-            "youtube",
-            "v3",
-            developerKey=self.api_keys[self.key_index],
-            cache_discovery=False,
-        )
+        # one service for all keys; with_key sets the key of each request
+        return build("youtube", "v3", http=self.http, cache_discovery=False)
+
+    def with_key(self, request: Any, key_index: Optional[int] = None) -> Any:
+        """Set the API key a request is sent with (the current key by default)."""
+        if key_index is None:
+            key_index = self.key_index
+        request.uri = _with_key(request.uri, self.api_keys[key_index])
+        return request
 
     def switch_key(self) -> None:
         self.key_index = (self.key_index + 1) % len(self.api_keys)
-        self.service = self.build_service()
 
     def execute_request(self, request: Any) -> Any:
         wait_time = 1  # initial wait time in seconds
@@ -33,7 +151,7 @@ class YouTubeAPI:
 
         for _ in range(max_retries):
             try:
-                response = request.execute()
+                response = self.with_key(request).execute()
                 return response
             except HttpError as e:
                 if e.resp.status in [403, 429]:  # Rate limit exceeded
@@ -151,11 +269,9 @@ def get_channel_video_data(
     for i in range(0, len(video_ids), 50):
         try:
             request = youtube_api.service.videos().list(
-                part=(
-                    "snippet,contentDetails,statistics,status,topicDetails,"
-                    "recordingDetails,player,liveStreamingDetails"
-                ),
+                part=VIDEO_PARTS,
                 id=",".join(video_ids[i : i + 50]),
+                fields=VIDEO_FIELDS,
             )
             response = youtube_api.execute_request(request)
 
@@ -173,16 +289,7 @@ def collect_comments_for_videos(
     filename: str,
     overwrite: bool = False,
 ) -> None:
-    fieldnames = [
-        "video_id",
-        "comment_id",
-        "text",
-        "author",
-        "author_channel_url",
-        "like_count",
-        "published_at",
-        "updated_at",
-    ]
+    fieldnames = COMMENT_FIELDNAMES
 
     # If overwrite is True, open the file in write mode and write the header
     if overwrite:
@@ -222,53 +329,61 @@ def collect_comments_for_videos(
                     )
 
 
+def _error_reason(e: HttpError) -> Optional[str]:
+    error_details = e.error_details[0] if e.error_details else {}
+    return error_details.get("reason") if isinstance(error_details, dict) else None
+
+
+def _comment_data(comment_id: str, snippet: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "comment_id": comment_id,
+        "text": snippet["textDisplay"],
+        "author": snippet["authorDisplayName"],
+        "author_channel_url": snippet["authorChannelUrl"],
+        "like_count": snippet["likeCount"],
+        "published_at": snippet["publishedAt"],
+        "updated_at": snippet["updatedAt"],
+    }
+
+
+def _published_at(item: Dict[str, Any]) -> str:
+    return item["snippet"]["topLevelComment"]["snippet"]["publishedAt"]
+
+
+def _truncated_replies(item: Dict[str, Any]) -> Optional[List[str]]:
+    """The ids of the embedded replies of a thread, if it has more replies."""
+    embedded = item.get("replies", {}).get("comments", [])
+    if item["snippet"].get("totalReplyCount", 0) > len(embedded):
+        return [reply["id"] for reply in embedded]
+    return None
+
+
+def _thread_comments(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The top-level comment of a commentThreads item and its embedded replies."""
+    comments = [
+        _comment_data(item["id"], item["snippet"]["topLevelComment"]["snippet"])
+    ]
+    for reply in item.get("replies", {}).get("comments", []):
+        comments.append(_comment_data(reply["id"], reply["snippet"]))
+    return comments
+
+
 def get_video_comments(
     youtube_api: YouTubeAPI, video_id: str
 ) -> Optional[List[Dict[str, Any]]]:
     """Retrieve comments for a given video ID."""
     try:
         request = youtube_api.service.commentThreads().list(
-            part="snippet,replies", videoId=video_id, maxResults=100
+            part="snippet,replies",
+            videoId=video_id,
+            maxResults=100,
+            fields=COMMENT_THREAD_FIELDS,
         )
         comments: List[Dict[str, Any]] = []
         while request:
             response = youtube_api.execute_request(request)
             for item in response.get("items", []):
-                comment_data = {
-                    "comment_id": item["id"],
-                    "text": item["snippet"]["topLevelComment"]["snippet"][
-                        "textDisplay"
-                    ],
-                    "author": item["snippet"]["topLevelComment"]["snippet"][
-                        "authorDisplayName"
-                    ],
-                    "author_channel_url": item["snippet"]["topLevelComment"]["snippet"][
-                        "authorChannelUrl"
-                    ],
-                    "like_count": item["snippet"]["topLevelComment"]["snippet"][
-                        "likeCount"
-                    ],
-                    "published_at": item["snippet"]["topLevelComment"]["snippet"][
-                        "publishedAt"
-                    ],
-                    "updated_at": item["snippet"]["topLevelComment"]["snippet"][
-                        "updatedAt"
-                    ],
-                }
-                comments.append(comment_data)
-                # Check for replies
-                if "replies" in item:
-                    for reply in item["replies"]["comments"]:
-                        reply_data = {
-                            "comment_id": reply["id"],
-                            "text": reply["snippet"]["textDisplay"],
-                            "author": reply["snippet"]["authorDisplayName"],
-                            "author_channel_url": reply["snippet"]["authorChannelUrl"],
-                            "like_count": reply["snippet"]["likeCount"],
-                            "published_at": reply["snippet"]["publishedAt"],
-                            "updated_at": reply["snippet"]["updatedAt"],
-                        }
-                        comments.append(reply_data)
+                comments.extend(_thread_comments(item))
             request = youtube_api.service.commentThreads().list_next(request, response)
         return comments
     except HttpError as e:
@@ -281,3 +396,782 @@ def get_video_comments(
                 (" An error occurred while fetching comments for" f"{video_id}: {e}")
             )
         return None
+
+
+# WORK QUEUE #
+#
+# Comment collection can take several days of quota. A VideoQueue records each
+# video's state and the token of the next page to fetch in SQLite, and the
+# collector records a page only after its comments have been written, so a
+# stopped run resumes mid-video without spending units on finished pages. It also
+# keeps the newest thread collected for each video, so re-crawls of finished
+# videos fetch only the threads posted since, and a second queue of threads whose
+# replies were truncated by commentThreads, for the reply expansion stage.
+
+
+class VideoQueue:
+    """
+    Durable SQLite work queue of videos to collect comments for.
+
+    Videos are "pending", "in-progress", "done", "disabled" (comments turned off)
+    or "failed". Pages are recorded after their comments are written, so a crash
+    can at worst repeat the page that was being written; drop duplicate
+    comment_ids downstream. The newest thread found by a crawl becomes the
+    video's watermark once the crawl is done.
+
+    Args:
+        path (Union[str, Path]): SQLite file; created if it does not exist.
+    """
+
+    STATES = ("pending", "in-progress", "done", "disabled", "failed")
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS videos ("
+                "video_id TEXT PRIMARY KEY, state TEXT NOT NULL, page_token TEXT, "
+                "n_pages INTEGER DEFAULT 0, n_comments INTEGER DEFAULT 0, "
+                "newest_comment_id TEXT, newest_published_at TEXT, "
+                "newest_updated_at TEXT, crawl_comment_id TEXT, "
+                "crawl_published_at TEXT, crawl_updated_at TEXT, "
+                "error TEXT, updated_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS videos_state ON videos (state)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS threads ("
+                "thread_id TEXT PRIMARY KEY, video_id TEXT NOT NULL, "
+                "state TEXT NOT NULL, page_token TEXT, embedded_reply_ids TEXT, "
+                "n_replies INTEGER DEFAULT 0, error TEXT, updated_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS threads_state ON threads (state)"
+            )
+        return self._conn
+
+    def _execute(self, sql: str, params: Iterable[Any] = ()) -> sqlite3.Cursor:
+        with self._lock, self.conn:
+            return self.conn.execute(sql, tuple(params))
+
+    def add(self, video_ids: Iterable[str], state: str = "pending") -> int:
+        """Add videos that are not queued yet; returns how many were added."""
+        if state not in self.STATES:
+            raise ValueError(f"Unknown state {state!r}; use one of {self.STATES}.")
+        now = time.time()
+        with self._lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO videos (video_id, state, updated_at) "
+                "VALUES (?, ?, ?)",
+                [(video_id, state, now) for video_id in dict.fromkeys(video_ids)],
+            )
+            return self.conn.total_changes - before
+
+    def claim(self) -> List[str]:
+        """
+        Mark pending videos, and any left in progress by a stopped run, as in
+        progress and return them, videos with a saved page token first.
+        """
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT video_id FROM videos "
+                "WHERE state IN ('pending', 'in-progress') "
+                "ORDER BY page_token IS NULL, rowid"
+            ).fetchall()
+            self.conn.execute(
+                "UPDATE videos SET state = 'in-progress', updated_at = ? "
+                "WHERE state = 'pending'",
+                (time.time(),),
+            )
+        return [video_id for (video_id,) in rows]
+
+    def progress(self, video_id: str) -> Dict[str, Optional[str]]:
+        """The next page token of a video and the newest thread collected so far."""
+        columns = (
+            "page_token",
+            "newest_comment_id",
+            "newest_published_at",
+            "newest_updated_at",
+        )
+        row = self._execute(
+            f"SELECT {', '.join(columns)} FROM videos WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        return dict(zip(columns, row or (None,) * len(columns)))
+
+    def record_page(
+        self,
+        video_id: str,
+        next_page_token: Optional[str],
+        comments: List[Dict[str, Any]],
+        newest: Optional[Tuple[str, str]] = None,
+    ) -> None:
+        """
+        Record a written page of comments and the token of the page to fetch next.
+        newest is the (comment_id, published_at) of the newest thread of the crawl,
+        given with its first page.
+        """
+        newest_comment_id, newest_published_at = newest or (None, None)
+        newest_updated_at = max((c["updated_at"] for c in comments), default=None)
+        self._execute(
+            "UPDATE videos SET page_token = ?, n_pages = n_pages + 1, "
+            "n_comments = n_comments + ?, "
+            "crawl_comment_id = COALESCE(?, crawl_comment_id), "
+            "crawl_published_at = COALESCE(?, crawl_published_at), "
+            "crawl_updated_at = NULLIF(MAX(COALESCE(crawl_updated_at, ''), "
+            "COALESCE(?, '')), ''), updated_at = ? WHERE video_id = ?",
+            (
+                next_page_token,
+                len(comments),
+                newest_comment_id,
+                newest_published_at,
+                newest_updated_at,
+                time.time(),
+                video_id,
+            ),
+        )
+
+    def finish(self, video_id: str, state: str, error: Optional[str] = None) -> None:
+        """
+        Move a video to done, disabled or failed. Unless it failed (and may be
+        retried from its last page), the crawl's newest thread becomes the
+        video's watermark.
+        """
+        if state not in ("done", "disabled", "failed"):
+            raise ValueError(f"Cannot finish a video as {state!r}.")
+        self._execute(
+            "UPDATE videos SET state = ?, error = ?, updated_at = ? "
+            "WHERE video_id = ?",
+            (state, error, time.time(), video_id),
+        )
+        if state != "failed":
+            self._execute(
+                "UPDATE videos SET page_token = NULL, "
+                "newest_comment_id = COALESCE(crawl_comment_id, newest_comment_id), "
+                "newest_published_at = "
+                "COALESCE(crawl_published_at, newest_published_at), "
+                "newest_updated_at = NULLIF(MAX(COALESCE(newest_updated_at, ''), "
+                "COALESCE(crawl_updated_at, '')), ''), "
+                "crawl_comment_id = NULL, crawl_published_at = NULL, "
+                "crawl_updated_at = NULL WHERE video_id = ?",
+                (video_id,),
+            )
+
+    def requeue(self, video_ids: Iterable[str], older_than_days: float = 0) -> int:
+        """
+        Queue finished videos again for an incremental crawl, if they were last
+        collected more than older_than_days ago; returns how many were queued.
+        """
+        cutoff = time.time() - older_than_days * 86_400
+        with self._lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "UPDATE videos SET state = 'pending', updated_at = ? "
+                "WHERE video_id = ? AND state = 'done' AND updated_at <= ?",
+                [(time.time(), video_id, cutoff) for video_id in video_ids],
+            )
+            return self.conn.total_changes - before
+
+    def set_watermarks(
+        self, watermarks: Iterable[Tuple[str, str, str, Optional[str]]]
+    ) -> None:
+        """
+        Set (video_id, comment_id, published_at, updated_at) watermarks for videos
+        that have none, e.g. for videos collected before they were queued.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE videos SET newest_comment_id = ?, newest_published_at = ?, "
+                "newest_updated_at = ? "
+                "WHERE video_id = ? AND newest_published_at IS NULL",
+                [
+                    (comment_id, published_at, updated_at, video_id)
+                    for video_id, comment_id, published_at, updated_at in watermarks
+                ],
+            )
+
+    def retry_failed(self) -> int:
+        """Queue failed videos again, from their last recorded page."""
+        return self._execute(
+            "UPDATE videos SET state = 'pending', error = NULL WHERE state = 'failed'"
+        ).rowcount
+
+    def clear(self) -> None:
+        """Forget every video and its progress."""
+        self._execute("DELETE FROM videos")
+
+    def add_threads(self, threads: Iterable[Tuple[str, str, List[str]]]) -> None:
+        """
+        Queue (thread_id, video_id, embedded_reply_ids) for reply expansion,
+        unless they are queued already.
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO threads "
+                "(thread_id, video_id, state, embedded_reply_ids, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?)",
+                [
+                    (thread_id, video_id, json.dumps(reply_ids), now)
+                    for thread_id, video_id, reply_ids in threads
+                ],
+            )
+
+    def claim_threads(self) -> List[Tuple[str, str]]:
+        """Like claim, for (thread_id, video_id) of threads awaiting expansion."""
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT thread_id, video_id FROM threads "
+                "WHERE state IN ('pending', 'in-progress') "
+                "ORDER BY page_token IS NULL, rowid"
+            ).fetchall()
+            self.conn.execute(
+                "UPDATE threads SET state = 'in-progress', updated_at = ? "
+                "WHERE state = 'pending'",
+                (time.time(),),
+            )
+        return [(thread_id, video_id) for thread_id, video_id in rows]
+
+    def thread_progress(self, thread_id: str) -> Tuple[Optional[str], List[str]]:
+        """The next page token of a thread and the ids of its embedded replies."""
+        row = self._execute(
+            "SELECT page_token, embedded_reply_ids FROM threads WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+        return row[0], json.loads(row[1] or "[]")
+
+    def record_reply_page(
+        self, thread_id: str, next_page_token: Optional[str], n_replies: int
+    ) -> None:
+        self._execute(
+            "UPDATE threads SET page_token = ?, n_replies = n_replies + ?, "
+            "updated_at = ? WHERE thread_id = ?",
+            (next_page_token, n_replies, time.time(), thread_id),
+        )
+
+    def finish_thread(
+        self, thread_id: str, state: str, error: Optional[str] = None
+    ) -> None:
+        if state not in ("done", "failed"):
+            raise ValueError(f"Cannot finish a thread as {state!r}.")
+        self._execute(
+            "UPDATE threads SET state = ?, error = ?, updated_at = ? "
+            "WHERE thread_id = ?",
+            (state, error, time.time(), thread_id),
+        )
+
+    def counts(self, table: str = "videos") -> Dict[str, int]:
+        """Number of videos (or, with table="threads", threads) in each state."""
+        if table not in ("videos", "threads"):
+            raise ValueError(f"Unknown table {table!r}; use 'videos' or 'threads'.")
+        rows = self._execute(
+            f"SELECT state, COUNT(*) FROM {table} GROUP BY state"
+        ).fetchall()
+        counts = dict.fromkeys(self.STATES, 0)
+        counts.update(rows)
+        return counts
+
+
+# CONCURRENT COLLECTION #
+#
+# Requests run on a bounded thread pool and share one service and its pooled
+# HTTP transport; each request carries its API key as a query parameter.
+# A QuotaScheduler keeps a token bucket of quota units per key and routes each
+# request to the key with the most headroom, so throughput scales with the
+# number of keys. Rate-limited keys are paused and exhausted keys are retired
+# until their bucket refills, without blocking requests on the other keys.
+
+
+class QuotaExhausted(Exception):
+    """Raised when no API key will have enough quota within the allowed wait."""
+
+
+class RetriesExhausted(Exception):
+    """Raised when a request is still rate limited after every allowed retry."""
+
+
+class QuotaScheduler:
+    """
+    Token buckets of quota units, one per API key.
+
+    Each bucket holds up to capacity units and refills at refill_rate units per
+    second (by default, a day's quota spread over a day).
+
+    Args:
+        n_keys (int): Number of API keys.
+        capacity (float): Units per bucket. Defaults to DAILY_QUOTA.
+        refill_rate (float): Units added to each bucket per second.
+            Defaults to DAILY_QUOTA / 86,400.
+        max_wait (Optional[float]): Longest a request waits for quota before
+            QuotaExhausted is raised; None waits indefinitely. Defaults to 60.
+        clock (Callable[[], float]): Time source. Defaults to time.monotonic.
+    """
+
+    def __init__(
+        self,
+        n_keys: int,
+        capacity: float = DAILY_QUOTA,
+        refill_rate: float = DAILY_QUOTA / 86_400,
+        max_wait: Optional[float] = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_wait = max_wait
+        self.clock = clock
+        self.tokens = [float(capacity)] * n_keys
+        self.spent = [0] * n_keys
+        self.paused_until = [0.0] * n_keys
+        self._updated = clock()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        added = (now - self._updated) * self.refill_rate
+        self.tokens = [min(self.capacity, t + added) for t in self.tokens]
+        self._updated = now
+
+    def _seconds_until_ready(self, key: int, cost: float, now: float) -> float:
+        paused = max(0.0, self.paused_until[key] - now)
+        missing = max(0.0, cost - self.tokens[key])
+        if missing > 0 and self.refill_rate <= 0:
+            return float("inf")
+        refill = missing / self.refill_rate if missing > 0 else 0.0
+        return max(paused, refill)
+
+    def acquire(self, cost: float = 1) -> int:
+        """Spend cost units from the key with the most headroom and return its index."""
+        with self._condition:
+            deadline = None if self.max_wait is None else self.clock() + self.max_wait
+            while True:
+                now = self.clock()
+                self._refill(now)
+                waits = [
+                    self._seconds_until_ready(key, cost, now)
+                    for key in range(len(self.tokens))
+                ]
+                ready = [key for key, w in enumerate(waits) if w == 0]
+                if ready:
+                    key = max(ready, key=lambda k: self.tokens[k])
+                    self.tokens[key] -= cost
+                    self.spent[key] += cost
+                    return key
+
+                wait_for = min(waits)
+                if deadline is not None and now + wait_for > deadline:
+                    raise QuotaExhausted(
+                        f"No API key has {cost} quota units left "
+                        f"(spent {sum(self.spent):,} units)."
+                    )
+                self._condition.wait(wait_for)
+
+    def pause(self, key: int, seconds: float) -> None:
+        """Stop routing requests to a key for a while (e.g. after a rate limit)."""
+        with self._condition:
+            self.paused_until[key] = max(self.paused_until[key], self.clock() + seconds)
+
+    def exhaust(self, key: int) -> None:
+        """Empty a key's bucket and retire the key until it has fully refilled."""
+        with self._condition:
+            self.tokens[key] = 0.0
+            if self.refill_rate > 0:
+                self.pause(key, self.capacity / self.refill_rate)
+            else:
+                self.paused_until[key] = float("inf")
+
+
+def _imap_unordered(
+    fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int
+) -> Iterator[Tuple[Any, Any]]:
+    """
+    Yield (item, fn(item)) as they complete, keeping at most 2 * max_workers
+    items in flight. Pending items are cancelled if the consumer stops early or
+    fn raises.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending: Dict[Future, Any] = {}
+
+        def fill() -> None:
+            while len(pending) < 2 * max_workers:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                pending[pool.submit(fn, item)] = item
+
+        try:
+            fill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    yield item, future.result()
+                fill()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class ConcurrentCollector:
+    """
+    Collect from the Data API concurrently across all keys of a YouTubeAPI.
+
+    Args:
+        youtube_api (YouTubeAPI): Provides the API keys, the service and its
+            pooled HTTP transport, which all workers share.
+        max_workers (Optional[int]): Size of the worker pool. Defaults to the
+            number of keys.
+        scheduler (Optional[QuotaScheduler]): Quota accounting for the keys.
+            Defaults to a QuotaScheduler with the default daily quota per key.
+        max_retries (int): Attempts per request. Defaults to 5.
+    """
+
+    def __init__(
+        self,
+        youtube_api: YouTubeAPI,
+        max_workers: Optional[int] = None,
+        scheduler: Optional[QuotaScheduler] = None,
+        max_retries: int = 5,
+    ) -> None:
+        n_keys = len(youtube_api.api_keys)
+        self.youtube_api = youtube_api
+        self.scheduler = scheduler if scheduler is not None else QuotaScheduler(n_keys)
+        self.max_workers = max_workers or n_keys
+        self.max_retries = max_retries
+
+    def execute(self, make_request: Callable[[Resource], Any], cost: float = 1) -> Any:
+        """
+        Build a request with make_request and send it with the key that has the
+        most quota left. Rate-limited keys are paused and exhausted keys retired,
+        and the request is retried with another key, up to max_retries attempts
+        before RetriesExhausted is raised.
+        """
+        wait_time = 1
+        for _ in range(self.max_retries):
+            key = self.scheduler.acquire(cost)
+            try:
+                request = make_request(self.youtube_api.service)
+                return self.youtube_api.with_key(request, key).execute()
+            except HttpError as e:
+                reason = _error_reason(e)
+                if reason in QUOTA_REASONS:
+                    logging.info(f"Quota exceeded for API key {key}.")
+                    self.scheduler.exhaust(key)
+                elif e.resp.status == 429 or reason in RATE_LIMIT_REASONS:
+                    logging.info(
+                        f"Rate limit for API key {key}. Pausing it for {wait_time}s."
+                    )
+                    self.scheduler.pause(key, wait_time)
+                    wait_time *= 2
+                else:
+                    raise e
+
+        raise RetriesExhausted(
+            f"Max retries exceeded after {self.max_retries} rate-limited attempts."
+        )
+
+    def iter_comment_threads(
+        self, video_id: str, page_token: Optional[str] = None
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Yield each page of a video's comment threads, newest first, starting at
+        page_token, with the token of the next page (None after the last page).
+        """
+        while True:
+            response = self.execute(
+                lambda service: service.commentThreads().list(
+                    part="snippet,replies",
+                    videoId=video_id,
+                    maxResults=100,
+                    order="time",
+                    pageToken=page_token,
+                    fields=COMMENT_THREAD_FIELDS,
+                )
+            )
+            page_token = response.get("nextPageToken")
+            yield response.get("items", []), page_token
+            if page_token is None:
+                return
+
+    def get_video_comments(self, video_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Retrieve comments for a given video ID, like get_video_comments."""
+        comments: List[Dict[str, Any]] = []
+        try:
+            for items, _ in self.iter_comment_threads(video_id):
+                for item in items:
+                    comments.extend(_thread_comments(item))
+            return comments
+        except (HttpError, RetriesExhausted) as e:
+            if isinstance(e, HttpError) and _error_reason(e) == "commentsDisabled":
+                logging.warning(f" Comments are disabled for video {video_id}")
+            else:
+                logging.error(
+                    f" An error occurred while fetching comments for {video_id}: {e}"
+                )
+            return None
+
+    def get_channel_video_data(self, video_ids: List[str]) -> List[Dict[str, Any]]:
+        """Retrieve detailed information for each video, 50 videos per request."""
+
+        def fetch(batch: List[str]) -> List[Dict[str, Any]]:
+            try:
+                response = self.execute(
+                    lambda service: service.videos().list(
+                        part=VIDEO_PARTS, id=",".join(batch), fields=VIDEO_FIELDS
+                    )
+                )
+                return response.get("items", [])
+            except (HttpError, RetriesExhausted) as e:
+                logging.error(f"An error occurred while fetching video details: {e}")
+                return []
+
+        batches = [video_ids[i : i + 50] for i in range(0, len(video_ids), 50)]
+        results = dict(
+            _imap_unordered(
+                lambda i: fetch(batches[i]), range(len(batches)), self.max_workers
+            )
+        )
+        return [item for i in range(len(batches)) for item in results[i]]
+
+    def collect_comments_for_videos(
+        self, video_ids: List[str], filename: str, overwrite: bool = False
+    ) -> None:
+        """
+        Collect comments for many videos at once and append them to a CSV file as
+        each video finishes. Stops when every key has run out of quota.
+        """
+        if overwrite:
+            with open(filename, "w", newline="") as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=COMMENT_FIELDNAMES)
+                writer.writeheader()
+
+        with open(filename, "a", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=COMMENT_FIELDNAMES)
+            results = _imap_unordered(
+                self.get_video_comments, video_ids, self.max_workers
+            )
+            try:
+                for video_id, comments in tqdm(
+                    results, total=len(video_ids), desc="Videos", unit="video"
+                ):
+                    for comment in comments or []:
+                        comment["video_id"] = video_id
+                        comment["text"] = html.unescape(comment["text"])
+                        writer.writerow(comment)
+            except QuotaExhausted as e:
+                logging.error(f"{e} Stopping execution.")
+
+        logging.info(
+            f"Spent {sum(self.scheduler.spent):,} quota units "
+            f"({', '.join(f'{u:,}' for u in self.scheduler.spent)} per key)."
+        )
+
+    def _collect_queued_video(
+        self,
+        video_id: str,
+        queue: VideoQueue,
+        write: Callable[[str, List[Dict[str, Any]]], None],
+    ) -> str:
+        progress = queue.progress(video_id)
+        seen_published_at = progress["newest_published_at"]
+        seen_comment_id = progress["newest_comment_id"]
+        first_page = progress["page_token"] is None
+
+        def seen(item: Dict[str, Any]) -> bool:
+            return seen_published_at is not None and (
+                item["id"] == seen_comment_id or _published_at(item) < seen_published_at
+            )
+
+        try:
+            pages = self.iter_comment_threads(video_id, progress["page_token"])
+            for items, next_page_token in pages:
+                # threads are newest first, so everything after a seen one is old
+                new_items = list(itertools.takewhile(lambda i: not seen(i), items))
+                reached_seen = len(new_items) < len(items)
+                comments = [c for item in new_items for c in _thread_comments(item)]
+                write(video_id, comments)
+                truncated = [
+                    (item["id"], _truncated_replies(item)) for item in new_items
+                ]
+                queue.add_threads(
+                    (thread_id, video_id, reply_ids)
+                    for thread_id, reply_ids in truncated
+                    if reply_ids is not None
+                )
+                newest = new_items[0] if first_page and new_items else None
+                queue.record_page(
+                    video_id,
+                    None if reached_seen else next_page_token,
+                    comments,
+                    newest=(newest["id"], _published_at(newest)) if newest else None,
+                )
+                first_page = False
+                if reached_seen:
+                    break
+            state, error = "done", None
+        except (HttpError, RetriesExhausted) as e:
+            if isinstance(e, HttpError) and _error_reason(e) == "commentsDisabled":
+                state, error = "disabled", None
+            else:
+                state, error = "failed", str(e)
+                logging.error(
+                    f" An error occurred while fetching comments for {video_id}: {e}"
+                )
+        queue.finish(video_id, state, error)
+        return state
+
+    def _stream_to_csv(
+        self,
+        filename: str,
+        work: Callable[[Any, Callable[[str, List[Dict[str, Any]]], None]], Any],
+        items: List[Any],
+        desc: str,
+    ) -> None:
+        """
+        Run work(item, write) for each item on the worker pool, where write
+        appends a video's comments to a CSV file; stops when quota runs out.
+        """
+        write_lock = threading.Lock()
+        new_file = not Path(filename).exists() or Path(filename).stat().st_size == 0
+
+        with open(filename, "a", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=COMMENT_FIELDNAMES)
+            if new_file:
+                writer.writeheader()
+
+            def write(video_id: str, comments: List[Dict[str, Any]]) -> None:
+                for comment in comments:
+                    comment["video_id"] = video_id
+                    comment["text"] = html.unescape(comment["text"])
+                with write_lock:
+                    writer.writerows(comments)
+                    csvfile.flush()
+
+            results = _imap_unordered(
+                lambda item: work(item, write), items, self.max_workers
+            )
+            try:
+                for _ in tqdm(
+                    results, total=len(items), desc=desc, unit=desc[:-1].lower()
+                ):
+                    pass
+            except QuotaExhausted as e:
+                logging.error(f"{e} Stopping; the next run resumes from the queue.")
+
+    def collect_comments_from_queue(
+        self, queue: VideoQueue, filename: str
+    ) -> Dict[str, int]:
+        """
+        Collect comments for the queued videos and append them to a CSV file page
+        by page, recording progress in the queue. When every key runs out of quota,
+        collection stops and the next run resumes where this one left off.
+
+        Videos collected before (see VideoQueue.requeue) are collected
+        incrementally: threads are read newest first and paging stops at the
+        newest thread seen last time, so only new threads are appended. Replies
+        posted to older threads are not picked up this way.
+
+        Threads with more replies than commentThreads embeds are queued for
+        expand_replies_from_queue.
+
+        Returns:
+            Dict[str, int]: Number of videos in each state afterwards.
+        """
+        self._stream_to_csv(
+            filename,
+            lambda video_id, write: self._collect_queued_video(video_id, queue, write),
+            queue.claim(),
+            "Videos",
+        )
+        counts = queue.counts()
+        logging.info(
+            f"Spent {sum(self.scheduler.spent):,} quota units. Videos: "
+            + ", ".join(f"{n:,} {state}" for state, n in counts.items())
+        )
+        return counts
+
+    def iter_replies(
+        self, parent_id: str, page_token: Optional[str] = None
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Yield each page of replies to a comment thread, starting at page_token,
+        with the token of the next page (None after the last page).
+        """
+        while True:
+            response = self.execute(
+                lambda service: service.comments().list(
+                    part="snippet",
+                    parentId=parent_id,
+                    maxResults=100,
+                    pageToken=page_token,
+                    fields=REPLY_FIELDS,
+                )
+            )
+            page_token = response.get("nextPageToken")
+            replies = [
+                _comment_data(reply["id"], reply["snippet"])
+                for reply in response.get("items", [])
+            ]
+            yield replies, page_token
+            if page_token is None:
+                return
+
+    def _expand_queued_thread(
+        self,
+        thread: Tuple[str, str],
+        queue: VideoQueue,
+        write: Callable[[str, List[Dict[str, Any]]], None],
+    ) -> str:
+        thread_id, video_id = thread
+        page_token, embedded_reply_ids = queue.thread_progress(thread_id)
+        embedded = set(embedded_reply_ids)
+        try:
+            for replies, next_page_token in self.iter_replies(thread_id, page_token):
+                # the embedded replies were written with the thread
+                replies = [
+                    reply for reply in replies if reply["comment_id"] not in embedded
+                ]
+                write(video_id, replies)
+                queue.record_reply_page(thread_id, next_page_token, len(replies))
+            state, error = "done", None
+        except (HttpError, RetriesExhausted) as e:
+            state, error = "failed", str(e)
+            logging.error(
+                f" An error occurred while fetching replies to {thread_id}: {e}"
+            )
+        queue.finish_thread(thread_id, state, error)
+        return state
+
+    def expand_replies_from_queue(
+        self, queue: VideoQueue, filename: str
+    ) -> Dict[str, int]:
+        """
+        Fetch the replies that commentThreads left out of the queued threads with
+        comments().list, spending from the same quota, and append them to the CSV
+        file of the threads. Like collect_comments_from_queue, it stops when quota
+        runs out and resumes from the queue.
+
+        Returns:
+            Dict[str, int]: Number of threads in each state afterwards.
+        """
+        self._stream_to_csv(
+            filename,
+            lambda thread, write: self._expand_queued_thread(thread, queue, write),
+            queue.claim_threads(),
+            "Threads",
+        )
+        counts = queue.counts("threads")
+        logging.info(
+            f"Spent {sum(self.scheduler.spent):,} quota units. Threads: "
+            + ", ".join(f"{n:,} {state}" for state, n in counts.items())
+        )
+        return counts
@@ -13,6 +13,7 @@ with open("../input/config.yaml", "r") as file:
 KEY_NAMES = config.get("list_youtube_api_key_names", "YOUTUBE_API_KEY")
 API_KEYS = utils.load_api_key_list(KEY_NAMES)
 YOUTUBE_API = yt.YouTubeAPI(API_KEYS)
+COLLECTOR = yt.ConcurrentCollector(YOUTUBE_API)
 
 channels = pd.read_csv("../input/channel_ids.csv")
 cnames = channels["Channel"].tolist()
@@ -27,7 +28,7 @@ for cname, cid in zip(cnames, cids):
         logger.warning(f"No videos found for {cname} (ID: {cid})")
         continue
 
-    video_details = yt.get_channel_video_data(YOUTUBE_API, video_ids)
+    video_details = COLLECTOR.get_channel_video_data(video_ids)
 
     output_file = f"../output/{cname}.json"
     utils.save_json(video_details, output_file)
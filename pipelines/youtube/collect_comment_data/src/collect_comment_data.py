@@ -19,6 +19,8 @@ with open("collect_comment_data.yaml", "r") as file:
 
 collect_comment_nans = task_config.get("attempt_to_collect_when_comments_unknown")
 no_redownloading = task_config.get("no_redownloading")
+recrawl_after_days = task_config.get("recrawl_after_days")
+expand_replies = task_config.get("expand_replies")
 
 
 df = pd.read_csv("../input/channels_processed.csv")
@@ -37,38 +39,66 @@ logger.info(
     )
 )
 
+# The queue records which videos are done and, for videos in progress, the next
+# page to fetch, so a run stopped by a crash or by quota resumes where it left off
+queue = yt.VideoQueue("../output/comments_queue.sqlite")
+
 # Do not re-download videos that were previously downloaded (API quotas, etc.)
 if no_redownloading is True:
-    try:
-        already_downloaded = pd.read_csv("../output/comments.csv")
-        already_downloaded = already_downloaded["video_id"].unique().tolist()
-        has_public_comments = [
-            video
-            for video in has_public_comments
-            if video not in set(already_downloaded)
-        ]
-    except (FileNotFoundError, pd.errors.EmptyDataError):
-        already_downloaded = []
-
+    # videos in a comments.csv written before the queue existed count as done, and
+    # their newest threads are where incremental re-crawls stop
+    if sum(queue.counts().values()) == 0:
+        try:
+            previous = pd.read_csv(
+                "../output/comments.csv",
+                usecols=["video_id", "comment_id", "published_at", "updated_at"],
+            )
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            previous = pd.DataFrame(
+                columns=["video_id", "comment_id", "published_at", "updated_at"]
+            )
+        queue.add(previous["video_id"].unique(), state="done")
 
-logger.info(
-    (
-        f"{len(already_downloaded)} videos already collected. "
-        f"{len(has_public_comments):,} videos to download.\n"
-    )
-)
+        # reply ids have the form "{thread id}.{reply id}"
+        threads = previous[~previous["comment_id"].str.contains(".", regex=False)]
+        newest = threads.sort_values("published_at").groupby("video_id").tail(1)
+        newest_updated_at = previous.groupby("video_id")["updated_at"].max()
+        newest = newest.assign(updated_at=newest["video_id"].map(newest_updated_at))
+        queue.set_watermarks(
+            newest[["video_id", "comment_id", "published_at", "updated_at"]].itertuples(
+                index=False
+            )
+        )
+else:
+    queue.clear()
+    open("../output/comments.csv", "w").close()
 
 if collect_comment_nans is True:
     collect = has_public_comments + probably_no_public_comments
-    collect_n = len(collect)
     logger.info(
-        f"Attempting to collect data for an additional {len(collect_n):,} videos"
+        f"Attempting to collect data for an additional "
+        f"{len(probably_no_public_comments):,} videos"
     )
 else:
     collect = has_public_comments
-    collect_n = len(collect)
-    logger.info(f"Attempting to collect data for {collect_n:,} videos.\n")
 
-all_comments = yt.collect_comments_for_videos(
-    YOUTUBE_API, collect, "../output/comments.csv", overwrite=True
+n_queued = queue.add(collect)
+if recrawl_after_days is not None:
+    # collected videos are re-crawled incrementally: only newer threads are fetched
+    n_requeued = queue.requeue(collect, older_than_days=recrawl_after_days)
+    logger.info(f"Re-crawling {n_requeued:,} videos for new comments.")
+counts = queue.counts()
+logger.info(
+    (
+        f"{counts['done']:,} videos already collected. Queued {n_queued:,} new videos; "
+        f"{counts['pending'] + counts['in-progress']:,} videos to download.\n"
+    )
 )
+
+# one worker per API key, each spending from its own quota
+collector = yt.ConcurrentCollector(YOUTUBE_API)
+collector.collect_comments_from_queue(queue, "../output/comments.csv")
+
+# commentThreads embeds only a few replies per thread; fetch the rest
+if expand_replies is True:
+    collector.expand_replies_from_queue(queue, "../output/comments.csv")
@@ -1,45 +1,35 @@
-import pandas as pd
-from tqdm import tqdm
-from transformers import pipeline
-
 import icsspy
-from icsspy.text import truncate_text_to_transformer_limit
+import icsspy.text as t
+from icsspy.paths import inference_cache
 
 logger = icsspy.initialize_logger()
 
-device = icsspy.set_torch_device()
 model = "papluca/xlm-roberta-base-language-detection"
-classifier = pipeline("text-classification", model=model, device=device)
-
-df = pd.read_csv("../input/comments_processed.csv")
-
-# remove invalid text
-df = df.dropna(subset=["processed_text"])
-df = df[df["processed_text"].apply(lambda x: isinstance(x, str) and len(x) > 0)]
-
-ids = df["comment_id"].tolist()
-text = df["processed_text"].tolist()
-
-# Do I want to wrap this up in a function like the others?
-vids, preds, scores = [], [], []
-for vid, text in tqdm(
-    zip(ids, text), total=len(ids), desc="Detecting comment language"
-):
-    try:
-        truncated_text = truncate_text_to_transformer_limit(text)
-        predicted_language = classifier(truncated_text)
-
-        if predicted_language:
-            vids.append(vid)
-            preds.append(predicted_language[0]["label"])
-            scores.append(predicted_language[0]["score"])
-    except Exception as e:
-        logger.error(f"Error processing comment_id {vid}: {e}")
-
-langdf = pd.DataFrame(
-    {"comment_id": vids, "predicted_language": preds, "confidence_score": scores}
-)
-
-langdf.to_csv("../output/comments_predicted_language.csv", index=False)
-logger.info("Finished predicting comment languages\n")
-print(langdf.head())
+# "torch" (fp32), "int8" or "onnx"; compare them with `benchmark-backends`
+backend = "torch"
+cache = t.InferenceCache(inference_cache)
+
+# trade worker processes against torch threads per process; the product should
+# roughly match the number of physical cores on the machine
+n_processes = 1
+threads_per_process = None
+
+# worker processes are spawned and re-import this script, hence the guard
+if __name__ == "__main__":
+    # comments are streamed through the model in chunks; an interrupted run picks up
+    # after the last chunk that was written
+    n_rows = t.label_csv_in_chunks(
+        t.detect_language,
+        "../input/comments_processed.csv",
+        "../output/comments_predicted_language.csv",
+        idcol="comment_id",
+        chunksize=10_000,
+        model=model,
+        textcol="processed_text",
+        n_processes=n_processes,
+        threads_per_process=threads_per_process,
+        cache=cache,
+        backend=backend,
+    )
+
+    logger.info(f"Finished predicting comment languages ({n_rows} rows)\n")
@@ -1,10 +1,10 @@
 import os
 
 import pandas as pd
-from span_marker import SpanMarkerModel
 
 import icsspy
 import icsspy.text as t
+from icsspy.paths import inference_cache
 
 logger = icsspy.initialize_logger()
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -12,17 +12,16 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 df = pd.read_csv("../input/channels_processed.csv")
 
-model = SpanMarkerModel.from_pretrained(
-    "tomaarsen/span-marker-bert-base-fewnerd-fine-super"
-)
-
-device = icsspy.set_torch_device()
-model.to(device)
+# loaded once through the model registry and reused for every channel
+model = "tomaarsen/span-marker-bert-base-fewnerd-fine-super"
+cache = t.InferenceCache(inference_cache)
 
 all_ents_channels_dfs = []
 
 for channel, group_df in df.groupby("channel"):
-    ents_channels = t.label_entities(model, group_df, "video_id", "processed_text")
+    ents_channels = t.label_entities(
+        model, group_df, "video_id", "processed_text", cache=cache
+    )
     ents_channels["channel"] = channel
     all_ents_channels_dfs.append(ents_channels)
 
@@ -2,6 +2,7 @@ import pandas as pd
 
 import icsspy
 import icsspy.text as t
+from icsspy.paths import inference_cache
 
 logger = icsspy.initialize_logger()
 
@@ -10,12 +11,19 @@ df = pd.read_csv("../input/channels_processed.csv")
 df["processed_text"] = df["processed_text"].astype(str)
 
 model = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+cache = t.InferenceCache(inference_cache)
 
 all_sentiment_dfs = []
 
 for channel, group_df in df.groupby("channel"):
     sentiment = t.label_sentiment(
-        model=model, df=group_df, textcol="processed_text", idcol="video_id"
+        model=model,
+        df=group_df,
+        textcol="processed_text",
+        idcol="video_id",
+        cache=cache,
+        # long video descriptions are scored in overlapping 512-token windows
+        stride=128,
     )
 
     sentiment["channel"] = channel
@@ -3,6 +3,7 @@ import yaml
 
 import icsspy
 import icsspy.text as text
+from icsspy.paths import embedding_store
 
 logger = icsspy.initialize_logger()
 
@@ -12,6 +13,9 @@ with open("label_channel_topics.yaml", "r") as file:
 df = pd.read_csv("../input/channels_processed.csv")
 df["processed_text"] = df["processed_text"].astype(str)
 
+# reuse embeddings across runs; only new texts are encoded
+store = text.EmbeddingStore(embedding_store, model="all-MiniLM-L6-v2")
+
 all_text_topic_dfs = []
 all_topic_info_dfs = []
 
@@ -59,6 +63,7 @@ for channel_name, group_df in df.groupby("channel"):
         vectorizer_max_df=vectorizer_max_df,
         ngram_upper_limit=ngram_upper_limit,
         top_n_words=top_n_words,
+        embedding_store=store,
     )
 
     text_topic_df["channel"] = channel
@@ -1,35 +1,29 @@
 import os
 
-import pandas as pd
-from span_marker import SpanMarkerModel
-
 import icsspy
 import icsspy.text as t
-import icsspy.utils as u
+from icsspy.paths import inference_cache
 
 logger = icsspy.initialize_logger()
 
-device = u.set_torch_device()
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-
-df = pd.read_csv("../input/comments_processed_english.csv")
-
-model = SpanMarkerModel.from_pretrained(
-    "tomaarsen/span-marker-bert-base-fewnerd-fine-super"
+# loaded once through the model registry and reused for every chunk
+model = "tomaarsen/span-marker-bert-base-fewnerd-fine-super"
+cache = t.InferenceCache(inference_cache)
+
+# comments are streamed through the model in chunks; an interrupted run picks up
+# after the last chunk that was written
+n_rows = t.label_csv_in_chunks(
+    t.label_entities,
+    "../input/comments_processed_english.csv",
+    "../output/comments_entities.csv",
+    idcol="comment_id",
+    chunksize=10_000,
+    carry_cols=["channel"],
+    model=model,
+    textcol="processed_text",
+    cache=cache,
 )
 
-device = u.set_torch_device()
-model.to(device)
-
-all_ents_comments_dfs = []
-
-for channel, group_df in df.groupby("channel"):
-    ents_comments = t.label_entities(model, group_df, "comment_id", "processed_text")
-    ents_comments["channel"] = channel
-    all_ents_comments_dfs.append(ents_comments)
-
-final_ents_comments_df = pd.concat(all_ents_comments_dfs, ignore_index=True)
-final_ents_comments_df.to_csv("../output/comments_entities.csv", index=False)
-print(final_ents_comments_df.sample(30))
-logger.info("Finished labelling entities")
+logger.info(f"Finished labelling entities ({n_rows} rows)")
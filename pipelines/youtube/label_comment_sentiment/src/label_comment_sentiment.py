@@ -1,26 +1,28 @@
-import pandas as pd
-
 import icsspy
 import icsspy.text as t
+from icsspy.paths import inference_cache
 
 logger = icsspy.initialize_logger()
 
-df = pd.read_csv("../input/comments_processed_english.csv")
-df["processed_text"] = df["processed_text"].astype(str)
-
 model = "cardiffnlp/twitter-roberta-base-sentiment-latest"
-
-all_sentiment_dfs = []
-
-for channel, group_df in df.groupby("channel"):
-    sentiment = t.label_sentiment(
-        model=model, df=group_df, textcol="processed_text", idcol="comment_id"
-    )
-
-    sentiment["channel"] = channel
-    all_sentiment_dfs.append(sentiment)
-
-final_sentiment_df = pd.concat(all_sentiment_dfs, ignore_index=True)
-final_sentiment_df.to_csv("../output/comments_sentiment.csv", index=False)
-logger.info("Finished labelling sentiment in comments data")
-print(final_sentiment_df.sample(30))
+# "torch" (fp32), "int8" or "onnx"; compare them with `benchmark-backends`
+backend = "torch"
+cache = t.InferenceCache(inference_cache)
+
+# comments are streamed through the model in chunks; an interrupted run picks up
+# after the last chunk that was written
+n_rows = t.label_csv_in_chunks(
+    t.label_sentiment,
+    "../input/comments_processed_english.csv",
+    "../output/comments_sentiment.csv",
+    idcol="comment_id",
+    chunksize=10_000,
+    carry_cols=["channel"],
+    read_csv_kwargs={"converters": {"processed_text": str}},
+    model=model,
+    textcol="processed_text",
+    cache=cache,
+    backend=backend,
+)
+
+logger.info(f"Finished labelling sentiment in comments data ({n_rows} rows)")
@@ -0,0 +1,32 @@
+import click
+import pandas as pd
+
+import icsspy
+import icsspy.text as t
+
+logger = icsspy.initialize_logger()
+
+
+@click.command()
+@click.argument("models", nargs=-1, required=True)
+@click.option("--input", "input_path", required=True, help="CSV file of texts.")
+@click.option("--textcol", default="processed_text", show_default=True)
+@click.option("--n-texts", default=1000, show_default=True)
+@click.option("--batch-size", default=32, show_default=True)
+@click.option("--seed", default=42, show_default=True)
+def main(models, input_path, textcol, n_texts, batch_size, seed):
+    """Benchmark the torch, int8 and onnx backends for each of MODELS."""
+    texts = pd.read_csv(input_path, usecols=[textcol])[textcol].dropna().astype(str)
+    texts = texts.sample(min(n_texts, len(texts)), random_state=seed).tolist()
+
+    results = []
+    for model in models:
+        result = t.benchmark_backends(model, texts, batch_size=batch_size)
+        result.insert(0, "model", model)
+        results.append(result)
+
+    print(pd.concat(results, ignore_index=True).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()